@@ -1,13 +1,18 @@
 import telebot
 from telebot import types
 from bot_config import BOT_TOKEN
-from utils import read_file_content, read_monthly_macro_content, read_yearly_macro_content
+from utils import read_file_content
+from macro_fragments import MACRO
 from company_search import get_company_tickers
 from keyboards import get_timeframe_keyboard, get_plot_keyboard, get_forecast_menu_keyboard
 from data_processing import save_historical_data, download_reports, analyze_msfo_report
 from plotting import plot_and_send_chart
 from forecast import short_term_forecast, medium_term_forecast, long_term_forecast
+from live_candles import LIVE
+from preforecast import PREFORECAST
 import re
+import signal
+import sys
 import time
 
 # Инициализация бота
@@ -283,8 +288,11 @@ def handle_callback(call):
 # Запуск бота
 if __name__ == "__main__":
     companies_df = read_file_content(FILE_PATH)
-    monthly_macro_df = read_monthly_macro_content()
-    yearly_macro_df = read_yearly_macro_content()
+    MACRO.warm()
+    LIVE.start()
+    PREFORECAST.start()
+    # SIGTERM завершает процесс через SystemExit, чтобы atexit сбросил очередь отложенной записи
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     if companies_df is None:
         print("Предупреждение: Не удалось загрузить данные о компаниях. Функционал поиска тикеров может быть ограничен.")
         bot.polling(none_stop=True, timeout=60)
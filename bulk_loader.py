@@ -0,0 +1,179 @@
+from datetime import datetime, timedelta
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import candle_store
+import moex_parser
+from moex_parser import ISS_MAX_WORKERS
+from http_client import HTTP, HttpError
+
+UNIVERSE_FILE = "moex_companies_no_etf.csv"
+# Размер страницы history-эндпоинта ISS
+HISTORY_PAGE_SIZE = 100
+
+
+def _history_url(market, board):
+    base_url = moex_parser.ISS_BASE_URL.rstrip('/')
+    return f"{base_url}/iss/history/engines/stock/markets/{market}/boards/{board}/securities.csv"
+
+
+def _parse_history_block(csv_text):
+    """
+    Разбирает первый блок ('history') ответа ISS, отбрасывая блок курсора.
+
+    Формат ответа: имя блока, пустая строка, заголовок, строки данных, пустая строка, следующий блок.
+    """
+    lines = csv_text.splitlines()[1:]
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    block = []
+    for line in lines:
+        if not line.strip():
+            break
+        block.append(line)
+    if len(block) < 2:
+        return pd.DataFrame()
+    return pd.read_csv(StringIO("\n".join(block)), sep=';')
+
+
+def fetch_board_history(date, market="shares", board="TQBR"):
+    """
+    Загружает дневные итоги торгов по всем бумагам доски за одну дату.
+
+    Args:
+        date (str): Дата торгов (YYYY-MM-DD).
+        market (str): Рынок.
+        board (str): Торговая доска.
+
+    Returns:
+        pd.DataFrame: Строки с колонками SECID, TRADEDATE, OPEN, HIGH, LOW, CLOSE, VOLUME,
+            пустой DataFrame для дня без торгов или None при ошибке запроса.
+    """
+    url = _history_url(market, board)
+    pages = []
+    start = 0
+    while True:
+        params = {"date": date, "start": start}
+        try:
+            response = HTTP.get(url, params=params)
+            df = _parse_history_block(response.content.decode('utf-8'))
+        except HttpError as e:
+            # Неполный список бумаг за дату не раскладывается по сериям
+            print(f"Ошибка при запросе истории {board} за {date}: {e}")
+            return None
+        if df.empty or 'SECID' not in df.columns:
+            break
+        pages.append(df)
+        start += len(df)
+        if len(df) < HISTORY_PAGE_SIZE:
+            break
+
+    if not pages:
+        return pd.DataFrame()
+    return pd.concat(pages, ignore_index=True)
+
+
+def load_universe(file_path=UNIVERSE_FILE):
+    """
+    Возвращает список тикеров вселенной компаний.
+    """
+    df = pd.read_csv(file_path)
+    return df['ticker'].dropna().str.strip().str.upper().unique().tolist()
+
+
+def _history_to_candles(history):
+    """
+    Приводит строки history к колонкам хранилища свечей; дни без сделок отбрасываются.
+    """
+    candles = history.rename(columns={
+        'TRADEDATE': 'date', 'OPEN': 'open', 'HIGH': 'high', 'LOW': 'low', 'CLOSE': 'close', 'VOLUME': 'volume'
+    })
+    candles = candles.dropna(subset=['open', 'high', 'low', 'close'])
+    candles = candles[candles['volume'] > 0]
+    candles['date'] = pd.to_datetime(candles['date'])
+    return candles[['SECID'] + candle_store.CANDLE_COLUMNS]
+
+
+def _default_start(tickers, market, board, period_years, now):
+    """
+    Самая ранняя дата последней свечи среди уже сохранённых серий вселенной,
+    чтобы после загрузки ни у одной серии не осталось разрыва.
+    """
+    start = now - timedelta(days=period_years * 365)
+    last_dates = []
+    for ticker in tickers:
+        series = candle_store.load_series(candle_store.series_key(ticker, 'daily', market, board), ['date'])
+        if series is None or series.empty:
+            return start
+        last_dates.append(pd.to_datetime(series['date']).iloc[-1])
+    return min(last_dates) if last_dates else start
+
+
+def refresh_universe(tickers=None, start_date=None, end_date=None, market="shares", board="TQBR",
+                     period_years=10, max_workers=ISS_MAX_WORKERS):
+    """
+    Обновляет дневные серии всей вселенной через history-эндпоинт ISS по датам.
+
+    Один запрос (несколько страниц) на дату возвращает все бумаги доски; строки
+    раскладываются по сериям candle_store, так что ночное обновление стоит
+    несколько запросов на торговый день вместо полной истории по каждому тикеру.
+
+    Args:
+        tickers (list): Тикеры (по умолчанию — все из UNIVERSE_FILE).
+        start_date (datetime): Начало диапазона. По умолчанию — самая ранняя последняя
+            свеча среди сохранённых серий (или period_years назад, если каких-то серий нет).
+        end_date (datetime): Конец диапазона (по умолчанию — сегодня).
+        market (str): Рынок.
+        board (str): Торговая доска.
+        period_years (int): Глубина загрузки, если у тикера ещё нет серии.
+        max_workers (int): Максимум одновременных запросов.
+
+    Returns:
+        dict: Количество добавленных строк по тикерам.
+    """
+    now = datetime.now()
+    tickers = [t.upper() for t in (tickers or load_universe())]
+    end_date = end_date or now
+    start_date = start_date or _default_start(tickers, market, board, period_years, now)
+    dates = [d.strftime('%Y-%m-%d') for d in pd.date_range(start_date.date(), end_date.date(), freq='D')]
+    print(f"Загрузка истории {board}: {len(dates)} дат, {len(tickers)} тикеров")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda d: fetch_board_history(d, market, board), dates))
+    # После первой неудачной даты данные не раскладываются, чтобы в сериях не осталось пропусков
+    failed = [date for date, df in zip(dates, results) if df is None]
+    if failed:
+        print(f"Не загружены даты {failed}, серии обновляются только до {failed[0]}")
+        results = results[:dates.index(failed[0])]
+    frames = [df for df in results if not df.empty]
+    if not frames:
+        print(f"Не удалось получить историю {board} за {dates[0]} - {dates[-1]}")
+        return {}
+
+    candles = _history_to_candles(pd.concat(frames, ignore_index=True))
+    candles = candles[candles['SECID'].isin(tickers)]
+
+    start_str = start_date.strftime('%Y-%m-%d')
+    updated = {}
+    for ticker, rows in candles.groupby('SECID'):
+        key = candle_store.series_key(ticker, 'daily', market, board)
+        with candle_store.SERIES_LOCKS.get(key):
+            stored = candle_store.load_series(key)
+            meta = candle_store.load_meta(key) if stored is not None else {}
+            merged = candle_store.merge_candles(stored, rows)
+            candle_store.save_series(key, merged)
+            covered_from = meta.get('covered_from')
+            if covered_from is None or start_str < covered_from:
+                meta['covered_from'] = start_str
+            if not failed:
+                meta['updated_at'] = now.isoformat(timespec='seconds')
+            candle_store.save_meta(key, meta)
+        updated[ticker] = len(merged) - (0 if stored is None else len(stored))
+
+    print(f"История {board} разложена по {len(updated)} сериям")
+    return updated
+
+
+if __name__ == "__main__":
+    result = refresh_universe()
+    print(f"Обновлено серий: {len(result)}, новых строк: {sum(result.values())}")
@@ -0,0 +1,210 @@
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+import pandas as pd
+import storage
+
+HISTORICAL_DATA_DIR = "historical_data"
+# Бюджет директории historical_data и максимальный возраст файла без обращений
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 2 * 1024 ** 3))
+CACHE_MAX_AGE_DAYS = int(os.environ.get("CACHE_MAX_AGE_DAYS", 60))
+# Минимальный интервал между проходами вытеснения (сек.)
+CACHE_EVICT_INTERVAL = 300
+
+# Снимки старого формата get_historical_data: {TICKER}_{TF}_{N}Y_{YYYYMMDD[_HHMMSS]}.csv
+SNAPSHOT_PATTERN = re.compile(
+    r'^(?P<ticker>.+?)_(?P<timeframe>1M|10M|1H|4H|DAILY|WEEKLY|MONTHLY|QUARTERLY)_(?P<years>\d+)Y_'
+    r'(?P<stamp>\d{8}(?:_\d{6})?)\.(?:csv|parquet|npz)$'
+)
+
+
+class CacheManager:
+    """
+    Управляет размером директории с историческими данными.
+
+    Вытесняет файлы по возрасту и по LRU (время последнего обращения — atime,
+    выставляется явно через touch), объединяет устаревшие снимки одной серии
+    в один файл и ведёт счётчики попаданий/промахов.
+    """
+
+    def __init__(self, directory=HISTORICAL_DATA_DIR, max_bytes=CACHE_MAX_BYTES, max_age_days=CACHE_MAX_AGE_DAYS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.compacted_files = 0
+        self._last_evict = 0.0
+        self._lock = threading.Lock()
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def touch(self, path):
+        """
+        Отмечает обращение к файлу (atime), не меняя mtime.
+        """
+        try:
+            stat = os.stat(path)
+            os.utime(path, (time.time(), stat.st_mtime))
+        except OSError:
+            pass
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, max(stat.st_atime, stat.st_mtime)))
+        return entries
+
+    def _remove(self, path, size):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Не удалось удалить '{path}': {e}")
+            return 0
+        # Вместе с серией хранилища удаляются её метаданные
+        meta_path = os.path.splitext(path)[0] + ".json"
+        if not path.endswith(".json") and os.path.exists(meta_path):
+            os.remove(meta_path)
+        self.evicted_files += 1
+        self.evicted_bytes += size
+        return size
+
+    def evict(self, now=None):
+        """
+        Удаляет файлы старше max_age, затем самые давно использованные, пока размер не уложится в бюджет.
+
+        Returns:
+            int: Количество удалённых файлов.
+        """
+        if not os.path.exists(self.directory):
+            return 0
+        now = now or time.time()
+        with self._lock:
+            self._last_evict = now
+            entries = [entry for entry in self._scan() if not entry[0].endswith((".json", ".tmp"))]
+            evicted_before = self.evicted_files
+            total_bytes = sum(size for _, size, _ in entries)
+
+            remaining = []
+            for path, size, last_used in entries:
+                if now - last_used > self.max_age_seconds:
+                    total_bytes -= self._remove(path, size)
+                else:
+                    remaining.append((path, size, last_used))
+
+            remaining.sort(key=lambda entry: entry[2])
+            for path, size, _ in remaining:
+                if total_bytes <= self.max_bytes:
+                    break
+                total_bytes -= self._remove(path, size)
+
+            evicted = self.evicted_files - evicted_before
+        if evicted:
+            print(f"Кэш '{self.directory}': удалено файлов {evicted}, размер {total_bytes} байт")
+        return evicted
+
+    def maybe_evict(self):
+        """
+        Запускает evict не чаще раза в CACHE_EVICT_INTERVAL секунд.
+        """
+        if time.time() - self._last_evict >= CACHE_EVICT_INTERVAL:
+            return self.evict()
+        return 0
+
+    def compact(self):
+        """
+        Объединяет снимки старого формата одной серии (тикер + таймфрейм) в один файл.
+
+        Строки объединяются по 'date' (побеждает более новый снимок), результат
+        записывается под именем самого нового снимка с максимальным периодом,
+        остальные снимки удаляются.
+
+        Returns:
+            int: Количество удалённых снимков.
+        """
+        if not os.path.exists(self.directory):
+            return 0
+        groups = defaultdict(list)
+        for name in os.listdir(self.directory):
+            match = SNAPSHOT_PATTERN.match(name)
+            if match:
+                key = (match.group('ticker'), match.group('timeframe'))
+                groups[key].append((match.group('stamp'), int(match.group('years')), name))
+
+        removed = 0
+        for (ticker, timeframe), snapshots in groups.items():
+            if len(snapshots) < 2:
+                continue
+            snapshots.sort()
+            frames = []
+            for _, _, name in snapshots:
+                path = os.path.join(self.directory, name)
+                base_path, ext = os.path.splitext(path)
+                df = pd.read_csv(path) if ext == ".csv" else storage.read_frame(base_path)
+                if df is not None and 'date' in df.columns:
+                    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+                    frames.append(df)
+            if not frames:
+                continue
+            merged = pd.concat(frames, ignore_index=True).dropna(subset=['date'])
+            merged = merged.drop_duplicates(subset=['date'], keep='last').sort_values('date')
+
+            stamp = snapshots[-1][0]
+            years = max(years for _, years, _ in snapshots)
+            target = storage.write_frame(
+                os.path.join(self.directory, f"{ticker}_{timeframe}_{years}Y_{stamp}"), merged
+            )
+            for _, _, name in snapshots:
+                path = os.path.join(self.directory, name)
+                if os.path.abspath(path) != os.path.abspath(target) and os.path.exists(path):
+                    os.remove(path)
+                    removed += 1
+            print(f"Снимки {ticker} {timeframe} объединены в {target}: {len(merged)} строк")
+        with self._lock:
+            self.compacted_files += removed
+        return removed
+
+    def stats(self):
+        """
+        Возвращает статистику кэша: число файлов, размер, попадания/промахи и вытеснения.
+        """
+        entries = self._scan() if os.path.exists(self.directory) else []
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'files': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evicted_files': self.evicted_files,
+                'evicted_bytes': self.evicted_bytes,
+                'compacted_files': self.compacted_files,
+            }
+
+
+# Общий менеджер для historical_data
+CACHE = CacheManager()
+
+
+if __name__ == "__main__":
+    CACHE.compact()
+    CACHE.evict()
+    print(CACHE.stats())
@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+from datetime import datetime
+import pandas as pd
+import storage
+from cache_manager import HISTORICAL_DATA_DIR, SNAPSHOT_PATTERN
+from single_flight import KeyedLock
+
+# Директория постоянного хранилища свечей (одна серия на тикер/рынок/доску/интервал)
+STORE_DIR = os.path.join("historical_data", "store")
+CANDLE_COLUMNS = ['date', 'high', 'low', 'open', 'close', 'volume']
+# Блокировки записи по ключу серии (загрузчики из разных потоков не перетирают файл друг друга)
+SERIES_LOCKS = KeyedLock()
+
+
+def series_key(ticker, timeframe, market="shares", board="TQBR"):
+    """
+    Формирует ключ серии в хранилище.
+
+    Args:
+        ticker (str): Тикер инструмента.
+        timeframe (str): Таймфрейм хранимой серии ('1m', '10m', '1h', 'daily', ...).
+        market (str): Рынок.
+        board (str): Торговая доска.
+
+    Returns:
+        str: Ключ вида 'SBER_shares_TQBR_daily'.
+    """
+    return f"{ticker.upper()}_{market}_{board}_{timeframe.lower()}"
+
+
+def _series_path(key):
+    return os.path.join(STORE_DIR, key)
+
+
+def series_file(key):
+    """
+    Возвращает путь к файлу серии на диске (с расширением формата storage).
+    """
+    return storage.storage_path(_series_path(key))
+
+
+def _meta_path(key):
+    return os.path.join(STORE_DIR, f"{key}.json")
+
+
+def load_meta(key):
+    """
+    Загружает метаданные серии: covered_from (самая ранняя запрошенная дата) и updated_at.
+    """
+    path = _meta_path(key)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка чтения метаданных '{path}': {e}")
+        return {}
+
+
+def save_meta(key, meta):
+    if not os.path.exists(STORE_DIR):
+        os.makedirs(STORE_DIR)
+    path = _meta_path(key)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_series(key, columns=None):
+    """
+    Загружает сохранённую серию свечей.
+
+    Args:
+        key (str): Ключ серии.
+        columns (list): Подмножество столбцов (None — все CANDLE_COLUMNS).
+
+    Returns:
+        pd.DataFrame: Свечи с колонками CANDLE_COLUMNS или None, если серии нет.
+    """
+    path = _series_path(key)
+    df = storage.read_frame(path, columns)
+    if df is None:
+        return None
+    missing_columns = [col for col in (columns or CANDLE_COLUMNS) if col not in df.columns]
+    if missing_columns:
+        print(f"Ошибка: в серии {path} отсутствуют столбцы: {missing_columns}, серия сброшена")
+        os.remove(storage.storage_path(path))
+        return None
+    return df
+
+
+def import_snapshot(key, ticker, timeframe, directory=HISTORICAL_DATA_DIR):
+    """
+    Переносит в хранилище свечи снимка старого формата get_historical_data
+    ({TICKER}_{TF}_{N}Y_{YYYYMMDD[_HHMMSS]}, см. SNAPSHOT_PATTERN), чтобы не скачивать их заново.
+
+    Берётся один, самый свежий снимок (при равной дате — с большим периодом): серия в хранилище
+    должна быть непрерывной. covered_from — первая свеча снимка, updated_at — время снимка,
+    поэтому всё после снимка догружается обычным инкрементом.
+
+    Args:
+        key (str): Ключ серии.
+        ticker (str): Тикер инструмента.
+        timeframe (str): Таймфрейм хранимой серии (снимки 4h/weekly/... не переносятся).
+        directory (str): Директория снимков.
+
+    Returns:
+        pd.DataFrame: Перенесённая серия или None, если подходящего снимка нет.
+    """
+    if not os.path.exists(directory):
+        return None
+    snapshots = []
+    for name in os.listdir(directory):
+        match = SNAPSHOT_PATTERN.match(name)
+        if match and match.group('ticker').upper() == ticker.upper() and match.group('timeframe') == timeframe.upper():
+            snapshots.append((match.group('stamp'), int(match.group('years')), name))
+    for stamp, _, name in sorted(snapshots, reverse=True):
+        path = os.path.join(directory, name)
+        base_path, ext = os.path.splitext(path)
+        try:
+            df = pd.read_csv(path) if ext == ".csv" else storage.read_frame(base_path)
+        except Exception as e:
+            print(f"Ошибка чтения снимка '{path}': {e}")
+            continue
+        if df is None or df.empty or any(col not in df.columns for col in CANDLE_COLUMNS):
+            continue
+        series = merge_candles(None, df)
+        save_series(key, series)
+        stamp_format = '%Y%m%d_%H%M%S' if '_' in stamp else '%Y%m%d'
+        save_meta(key, {
+            'covered_from': series['date'].iloc[0].strftime('%Y-%m-%d'),
+            'updated_at': datetime.strptime(stamp, stamp_format).isoformat(timespec='seconds'),
+        })
+        print(f"Серия {key} перенесена из снимка {name}: {len(series)} свечей")
+        return series
+    return None
+
+
+def save_series(key, df):
+    """
+    Атомарно сохраняет серию свечей в колоночном формате storage.
+    """
+    storage.write_frame(_series_path(key), df[CANDLE_COLUMNS])
+
+
+def merge_candles(stored, fresh):
+    """
+    Объединяет сохранённые и новые свечи. Свеча с тем же 'date' заменяется новой,
+    поэтому незакрытая последняя свеча перезаписывается актуальной версией.
+
+    Args:
+        stored (pd.DataFrame): Сохранённые свечи или None.
+        fresh (pd.DataFrame): Новые свечи или None.
+
+    Returns:
+        pd.DataFrame: Отсортированные по дате свечи без дубликатов.
+    """
+    frames = [df[CANDLE_COLUMNS] for df in (stored, fresh) if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=CANDLE_COLUMNS)
+    merged = pd.concat(frames, ignore_index=True)
+    merged['date'] = pd.to_datetime(merged['date'])
+    merged = merged.drop_duplicates(subset=['date'], keep='last')
+    merged = merged.sort_values('date').reset_index(drop=True)
+    return merged
+
+
+def slice_period(df, start_date):
+    """
+    Возвращает окно серии начиная с start_date (включительно).
+
+    Args:
+        df (pd.DataFrame): Серия свечей.
+        start_date (datetime): Начало окна.
+
+    Returns:
+        pd.DataFrame: Копия среза серии.
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=CANDLE_COLUMNS)
+    mask = pd.to_datetime(df['date']) >= pd.Timestamp(start_date.date())
+    return df.loc[mask].reset_index(drop=True).copy()
+
+
+def is_series_fresh(meta, threshold_seconds, now=None):
+    """
+    Проверяет, обновлялась ли серия за последние threshold_seconds секунд.
+    """
+    updated_at = meta.get('updated_at')
+    if not updated_at:
+        return False
+    now = now or datetime.now()
+    try:
+        updated_at = datetime.fromisoformat(updated_at)
+    except ValueError:
+        return False
+    return (now - updated_at).total_seconds() < threshold_seconds
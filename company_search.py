@@ -1,8 +1,5 @@
-from gigachat import GigaChat
-from bot_config import GIGACHAT_API_KEY, VERIFY_SSL_CERTS
 from utils import read_csv_file
-from openai import OpenAI
-import requests
+from llm_clients import LLM_CLIENTS, LOCAL_LLM_MODEL
 import re
 
 def get_company_tickers(company_name: str, companies_df, chat_id, bot, model="local"):
@@ -30,30 +27,26 @@ def get_company_tickers(company_name: str, companies_df, chat_id, bot, model="lo
 Список компаний и их тикеров:
 {companies_str}
 """
-            with GigaChat(
-                credentials=GIGACHAT_API_KEY,
-                verify_ssl_certs=VERIFY_SSL_CERTS,
-                model="GigaChat-2-Max"
-            ) as gigachat_client:
-                try:
-                    response = gigachat_client.chat(prompt)
-                    result = response.choices[0].message.content.strip()
-                    if not result or "не найдена" in result.lower():
-                        return "Извините, компания не найдена. Попробуйте скорректировать запрос."
-                    ticker_list = result.split(",")
-                    ticker_list = [t.strip().upper() for t in ticker_list]
-                    matched_rows = companies_list[companies_list["ticker"].isin(ticker_list)]
-                    if matched_rows.empty:
-                        return "Извините, компания не найдена. Попробуйте скорректировать запрос."
-                    return [(",".join(ticker_list), matched_rows.iloc[0]["official_name"])]
-                except Exception as e:
-                    error_msg = f"Ошибка GigaChat в get_company_tickers: {str(e)}\nТип ошибки: {type(e).__name__}"
-                    print(error_msg)
-                    bot.send_message(chat_id, error_msg)
-                    return None
+            gigachat_client = LLM_CLIENTS.gigachat()
+            try:
+                response = gigachat_client.chat(prompt)
+                result = response.choices[0].message.content.strip()
+                if not result or "не найдена" in result.lower():
+                    return "Извините, компания не найдена. Попробуйте скорректировать запрос."
+                ticker_list = result.split(",")
+                ticker_list = [t.strip().upper() for t in ticker_list]
+                matched_rows = companies_list[companies_list["ticker"].isin(ticker_list)]
+                if matched_rows.empty:
+                    return "Извините, компания не найдена. Попробуйте скорректировать запрос."
+                return [(",".join(ticker_list), matched_rows.iloc[0]["official_name"])]
+            except Exception as e:
+                error_msg = f"Ошибка GigaChat в get_company_tickers: {str(e)}\nТип ошибки: {type(e).__name__}"
+                print(error_msg)
+                bot.send_message(chat_id, error_msg)
+                return None
         else:
             print("Using local LLM for ticker search")
-            openai_client = OpenAI(base_url="http://localhost:1234/v1", api_key="not-needed")
+            openai_client = LLM_CLIENTS.openai()
             prompt = f"""
 Ты помощник, анализирующий CSV-файл с данными о компаниях (столбцы: 'ticker', 'official_name'). Содержимое: 
 {companies_str}
@@ -92,16 +85,15 @@ def get_company_tickers(company_name: str, companies_df, chat_id, bot, model="lo
 - ОТВЕТ ДОЛЖЕН СОДЕРЖАТЬ ТОЛЬКО РЕЗУЛЬТАТ, НАПРИМЕР: 'SBER,SBERP' ИЛИ 'Извините, компания не найдена. Попробуйте скорректировать запрос.'
 """
             try:
-                # Проверка доступности сервера LLM
-                response = requests.get("http://localhost:1234/v1/models")
-                if response.status_code != 200:
+                # Быстрая проверка доступности сервера LLM (по тому же пулу соединений)
+                if not LLM_CLIENTS.openai_available():
                     error_msg = "Ошибка: Локальный сервер LLM недоступен. Проверьте, запущен ли сервер на localhost:1234."
                     print(error_msg)
                     bot.send_message(chat_id, error_msg)
                     return None
 
                 response = openai_client.chat.completions.create(
-                    model="deepseek-r1-distill-qwen-14b",
+                    model=LOCAL_LLM_MODEL,
                     messages=[
                         {"role": "system", "content": prompt},
                         {"role": "user", "content": f"Найди тикер для {company_name}"}
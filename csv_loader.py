@@ -0,0 +1,118 @@
+import csv
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# Схемы известных видов файлов: параметры pd.read_csv задаются заранее, без определения разделителя.
+# Не перечисленные в dtype столбцы типизируются pandas (числа с заданными decimal/thousands).
+CSV_SCHEMAS = {
+    # Годовой МСФО со smart-lab: первый столбец — показатель, далее годы и LTM, числа вида "1 234,5"
+    'msfo': {'sep': ';', 'decimal': ',', 'thousands': ' ', 'dtype': None},
+    'monthly_macro': {'sep': ',', 'decimal': '.', 'thousands': None, 'dtype': {'Дата': str}},
+    'yearly_macro': {'sep': ',', 'decimal': '.', 'thousands': None, 'dtype': {'Год': 'int64'}},
+    # Списки компаний (moex_companies*.csv): все столбцы строковые
+    'companies': {'sep': ',', 'decimal': '.', 'thousands': None, 'dtype': str},
+}
+# Сколько разобранных файлов держать в памяти
+CSV_CACHE_ITEMS = 128
+
+
+def detect_kind(file_path):
+    """
+    Определяет вид файла по имени (None — неизвестный вид).
+    """
+    name = os.path.basename(file_path)
+    if 'МСФО' in name:
+        return 'msfo'
+    if name.startswith('monthly_macro'):
+        return 'monthly_macro'
+    if name.startswith('yearly_macro'):
+        return 'yearly_macro'
+    if name.startswith('moex_companies'):
+        return 'companies'
+    return None
+
+
+def _sniff_schema(file_path):
+    # Для файлов без схемы: разделитель определяется один раз на версию файла (далее — из кэша)
+    with open(file_path, 'r', encoding='utf-8') as file:
+        separator = csv.Sniffer().sniff(file.read(1024)).delimiter
+    return {'sep': separator, 'decimal': ',', 'thousands': ' ', 'dtype': None}
+
+
+def _parse(file_path, schema):
+    df = pd.read_csv(file_path, sep=schema['sep'], decimal=schema['decimal'], thousands=schema['thousands'],
+                     dtype=schema['dtype'], encoding='utf-8')
+    df.columns = df.columns.str.strip()
+    # Обрезаются только строковые столбцы, векторно
+    for col in df.columns:
+        if pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].str.strip()
+    return df
+
+
+class CsvLoader:
+    """
+    Чтение CSV по схемам с кэшем разобранных кадров по (путь, mtime, размер).
+
+    Повторное чтение неизменённого файла возвращает копию из памяти без разбора.
+    """
+
+    def __init__(self, schemas=None, max_items=CSV_CACHE_ITEMS):
+        self.schemas = CSV_SCHEMAS if schemas is None else schemas
+        self.max_items = max_items
+        self.cache = OrderedDict()
+        self.counters = {'hits': 0, 'parsed': 0}
+        self._lock = threading.Lock()
+
+    def read(self, file_path, kind=None):
+        """
+        Читает CSV-файл по схеме вида kind (по умолчанию — по имени файла).
+
+        Args:
+            file_path (str): Путь к файлу.
+            kind (str): Ключ CSV_SCHEMAS; для неизвестного вида разделитель определяется по содержимому.
+
+        Returns:
+            pd.DataFrame: Копия разобранного кадра или None, если файла нет или он не читается.
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            print(f"Файл '{file_path}' не найден в директории {os.getcwd()}")
+            return None
+        kind = kind or detect_kind(file_path)
+        key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, kind)
+        with self._lock:
+            df = self.cache.get(key)
+            if df is not None:
+                self.cache.move_to_end(key)
+                self.counters['hits'] += 1
+                return df.copy()
+
+        try:
+            schema = self.schemas[kind] if kind in self.schemas else _sniff_schema(file_path)
+            df = _parse(file_path, schema)
+        except Exception as e:
+            print(f"Ошибка чтения CSV '{file_path}': {e}")
+            return None
+        with self._lock:
+            # Старые версии того же файла больше не нужны
+            for stale in [k for k in self.cache if k[0] == key[0] and k[3] == kind]:
+                del self.cache[stale]
+            self.cache[key] = df
+            self.counters['parsed'] += 1
+            while len(self.cache) > self.max_items:
+                self.cache.popitem(last=False)
+        return df.copy()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters['items'] = len(self.cache)
+            return counters
+
+
+# Общий загрузчик CSV процесса
+CSV_LOADER = CsvLoader()
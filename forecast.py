@@ -1,116 +1,202 @@
 import pandas as pd
-from gigachat import GigaChat
-from bot_config import GIGACHAT_API_KEY, VERIFY_SSL_CERTS
-from openai import OpenAI
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from datetime import datetime
-from data_processing import save_historical_data, download_reports, read_csv_file, read_monthly_macro_content, read_yearly_macro_content, optimize_msfo_content, optimize_monthly_macro, optimize_yearly_macro, calculate_indicators
-from moex_parser import get_historical_data
+from data_processing import save_historical_data, download_reports
+from macro_fragments import MACRO, MACRO_BASE_YEAR, MONTHLY_MACRO_FILE, YEARLY_MACRO_FILE
+from indicator_state import load_indicator_data
+from msfo_store import MSFO_STORE, report_content
+from report_cache import report_path
+from forecast_cache import FORECAST_CACHE, FORECAST_REQUESTS, cached_note
+from single_flight import SingleFlight
+from llm_clients import LLM_CLIENTS, LOCAL_LLM_MODEL
+from llm_stream import LLM_STREAMING, TelegramStreamWriter, gigachat_deltas, openai_deltas, send_chunks, strip_think
+import storage
 import re
 
-def short_term_forecast(ticker, chat_id, bot, base_ticker=None, is_preferred=False, model="local"):
-    """
-    Генерирует краткосрочный прогноз (1-3 месяца) для акции с таймфреймом 'daily' за 1 год.
-    Использует столбцы: date, close, SMA_20, SMA_50, MACD, ADX_14, RSI_14, VWAP.
-    Включает текущую цену в ответ бота.
-    Сохраняет промпт в папку 'prompts'.
-    """
-    print(f"short_term_forecast called with ticker={ticker}, model={model}")
-    timeframe = "daily"
-    period_years = 1
-
-    if base_ticker is None:
-        base_ticker = ticker
-
-    prompts_dir = os.path.join(os.getcwd(), "prompts")
-    if not os.path.exists(prompts_dir):
-        os.makedirs(prompts_dir)
-
-    data = save_historical_data(ticker, timeframe, period_years)
+# Горизонты прогноза: источник данных, столбцы для LLM и тексты промпта.
+# spec=None — дневной набор save_historical_data (со снимком в historical_data).
+FORECASTS = {
+    'short': {
+        'name': "краткосрочный",
+        'timeframe': "daily",
+        'period_years': 1,
+        'spec': None,
+        'columns': ['date', 'close', 'SMA_20', 'SMA_50', 'MACD', 'ADX_14', 'RSI_14', 'VWAP'],
+        'macro_from': 2024,
+        'horizon': "на 1-3 месяца по данным за год (daily)",
+        'data_label': "год, daily",
+        'legend': [
+            "SMA_20:простая скользящая (20 дней)",
+            "SMA_50:простая скользящая (50 дней)",
+            "MACD:(12,26,9)",
+            "ADX_14:сила тренда (14 дней)",
+            "RSI_14:относительная сила (14 дней)",
+            "VWAP:объёмно-взвешенная цена (дневная)",
+        ],
+        'trend_task': "Анализируй краткосрочный тренд (SMA_20), среднесрочный тренд (SMA_50), импульс (MACD), "
+                      "силу тренда (ADX_14), перекупленность/перепроданность (RSI_14), сравни close с VWAP.",
+        'forecast_period': "1-3 месяца",
+        'max_tokens': 500,
+    },
+    'medium': {
+        'name': "среднесрочный",
+        'timeframe': "weekly",
+        'period_years': 5,
+        'spec': {'sma': (20, 50), 'rsi': 14, 'macd': (12, 26, 9), 'vwap': True, 'adx': 14},
+        'columns': ['date', 'close', 'SMA_20', 'SMA_50', 'MACD', 'ADX_14', 'RSI_14', 'VWAP'],
+        'macro_from': 2020,
+        'horizon': "на 3-9 месяцев по данным за 5 лет (weekly)",
+        'data_label': "5 лет, weekly",
+        'legend': [
+            "SMA_20:простая скользящая (20 недель)",
+            "SMA_50:простая скользящая (50 недель)",
+            "MACD:(12,26,9)",
+            "ADX_14:сила тренда (14 недель)",
+            "RSI_14:относительная сила (14 недель)",
+            "VWAP:объёмно-взвешенная цена (недельная)",
+        ],
+        'trend_task': "Анализируй среднесрочный тренд (SMA_20, SMA_50), импульс (MACD), силу тренда (ADX_14), "
+                      "перекупленность/перепроданность (RSI_14), сравни close с VWAP.",
+        'forecast_period': "3-6 месяцев",
+        'max_tokens': 500,
+    },
+    'long': {
+        'name': "долгосрочный",
+        'timeframe': "weekly",
+        'period_years': 10,
+        'spec': {'sma': (50, 200), 'rsi': 21, 'macd': (24, 52, 9), 'vwap': True, 'adx': 14},
+        'columns': ['date', 'close', 'SMA_50', 'SMA_200', 'MACD', 'ADX_14', 'RSI_21', 'VWAP'],
+        'macro_from': 2015,
+        'horizon': "на более чем 1 год по данным за 10 лет (weekly)",
+        'data_label': "10 лет, weekly",
+        'legend': [
+            "SMA_50:простая скользящая (50 недель)",
+            "SMA_200:простая скользящая (200 недель)",
+            "MACD:(24,52,9)",
+            "ADX_14:сила тренда (14 недель)",
+            "RSI_21:относительная сила (21 неделя)",
+            "VWAP:объёмно-взвешенная цена (недельная)",
+        ],
+        'trend_task': "Анализируй долгосрочный тренд (SMA_50, SMA_200), импульс (MACD), силу тренда (ADX_14), "
+                      "перекупленность/перепроданность (RSI_21), сравни close с VWAP.",
+        'forecast_period': "6-12 месяцев",
+        'max_tokens': 50000,
+    },
+}
+# Предельное время этапов сбора данных от постановки в очередь (включая ожидание воркера), сек.;
+# не успевший этап заменяется "Отсутствует". Макро — поиск в памяти MACRO, выполняется без пула.
+FORECAST_STAGE_TIMEOUTS = {'indicators': 90, 'msfo': 20}
+# Общий пул сетевых этапов сбора данных (свечи, МСФО) для всех одновременных прогнозов
+FORECAST_MAX_WORKERS = int(os.environ.get("FORECAST_MAX_WORKERS", 8))
+FORECAST_EXECUTOR = ThreadPoolExecutor(max_workers=FORECAST_MAX_WORKERS, thread_name_prefix="forecast")
+# Одинаковые прогнозы (тикер, горизонт, модель), запрошенные одновременно, считаются один раз
+FORECAST_FLIGHT = SingleFlight("forecast")
+
+
+def _indicator_stage(config, ticker):
+    timeframe, period_years = config['timeframe'], config['period_years']
+    if config['spec'] is None:
+        data = save_historical_data(ticker, timeframe, period_years)
+    else:
+        print(f"Загрузка данных с индикаторами для {ticker} ({timeframe}, {period_years}Y)")
+        data = load_indicator_data(ticker, timeframe, period_years, config['spec'])
     if data is None or data.empty:
-        bot.send_message(chat_id, f"Не удалось получить исторические данные для {ticker}.")
-        print(f"Ошибка: исторические данные для {ticker} ({timeframe}, {period_years}Y) недоступны")
-        return
+        return None
+    print(f"Данные с индикаторами для {ticker}: {len(data)} строк, столбцы: {list(data.columns)}")
+    return data
 
-    current_price = data['close'].iloc[-1] if 'close' in data.columns else None
-    if current_price is None:
-        bot.send_message(chat_id, f"Ошибка: не удалось определить текущую цену для {ticker}.")
-        print(f"Ошибка: столбец close отсутствует в данных для {ticker}")
-        return
 
-    forecast_columns = ['date', 'close', 'SMA_20', 'SMA_50', 'MACD', 'ADX_14', 'RSI_14', 'VWAP']
-    missing_columns = [col for col in forecast_columns if col not in data.columns]
-    if missing_columns:
-        bot.send_message(chat_id, f"Ошибка: отсутствуют столбцы {missing_columns} в данных для {ticker}.")
-        print(f"Ошибка: отсутствуют столбцы {missing_columns}")
-        return
+def _msfo_stage(ticker, base_ticker, is_preferred):
+    download_reports(ticker, is_preferred, base_ticker)
+    return report_content(base_ticker)
 
-    forecast_data = data[forecast_columns].copy()
-    forecast_data['date'] = pd.to_datetime(forecast_data['date']).dt.strftime('%Y-%m-%d')
-    indicators = forecast_data.to_csv(index=False, header=True, sep='|', lineterminator='\n')
-    indicators = re.sub(r'[ \t]+', '', indicators)
 
-    download_reports(ticker, is_preferred, base_ticker)
-    msfo_file = os.path.join("reports", f"{base_ticker}-МСФО-годовые.csv")
+class _Stage:
+    # Этап в общем пуле: не взятый из очереди к сроку отменяется и не занимает воркер
+    def __init__(self):
+        self.begun = threading.Event()
+        self.abandoned = False
 
-    msfo_content = "Отсутствует"
-    if os.path.exists(msfo_file):
-        try:
-            msfo_df = read_csv_file(msfo_file)
-            if msfo_df is not None:
-                msfo_content = optimize_msfo_content(msfo_df)
-            else:
-                print(f"Ошибка: не удалось прочитать МСФО для {base_ticker}")
-        except Exception as e:
-            print(f"Ошибка чтения МСФО для {base_ticker}: {str(e)}")
+    def run(self, fn, *args):
+        if self.abandoned:
+            return None
+        self.begun.set()
+        return fn(*args)
 
-    monthly_macro_content = "Отсутствует"
-    try:
-        monthly_macro_df = read_monthly_macro_content()
-        if monthly_macro_df is not None and not monthly_macro_df.empty:
-            monthly_macro_df['Дата'] = pd.to_datetime(monthly_macro_df['Дата'], format='%Y-%m', errors='coerce')
-            monthly_macro_df = monthly_macro_df[monthly_macro_df['Дата'].dt.year >= 2024]
-            monthly_macro_content = optimize_monthly_macro(monthly_macro_df)
-        else:
-            print("Месячные макро-данные недоступны")
-    except Exception as e:
-        print(f"Ошибка обработки месячных макро-данных: {str(e)}")
+    def result(self, future, deadline):
+        if not self.begun.wait(max(0.0, deadline - time.monotonic())):
+            self.abandoned = True
+            future.cancel()
+            raise TimeoutError()
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
 
-    yearly_macro_content = "Отсутствует"
-    try:
-        yearly_macro_df = read_yearly_macro_content()
-        if yearly_macro_df is not None and not yearly_macro_df.empty:
-            yearly_macro_df = yearly_macro_df[yearly_macro_df['Год'] >= 2024]
-            yearly_macro_content = optimize_yearly_macro(yearly_macro_df)
-        else:
-            print("Годовые макро-данные недоступны")
-    except Exception as e:
-        print(f"Ошибка обработки годовых макро-данных: {str(e)}")
 
-    bot.send_message(chat_id, "Формируется краткосрочный прогноз, подождите.")
+def gather_forecast_inputs(config, ticker, base_ticker, is_preferred, timeouts=None):
+    """
+    Параллельно собирает независимые входы прогноза: свечи с индикаторами, МСФО и макро.
+
+    Сетевые этапы идут в FORECAST_EXECUTOR, каждый ограничен своим сроком от постановки в очередь
+    (FORECAST_STAGE_TIMEOUTS), так что сбор данных не дольше наибольшего срока; макро берётся из MACRO
+    в текущем потоке. Не начатый к сроку этап отменяется, начатый дорабатывает без ожидания.
+    Этап, не успевший к сроку или завершившийся ошибкой, даёт None (индикаторы) или "Отсутствует" — это пишется в лог.
 
-    gigachat_prompt = f"""
-Ты финансовый аналитик, прогнозирующий цену акции (тикер: {ticker}) на 1-3 месяца по данным за год (daily), МСФО и макроэкономике России.
+    Returns:
+        dict: 'indicators' (DataFrame или None), 'msfo', 'monthly_macro', 'yearly_macro' (строки).
+    """
+    timeouts = timeouts or FORECAST_STAGE_TIMEOUTS
+    started = time.monotonic()
+    stages = {'indicators': _Stage(), 'msfo': _Stage()}
+    futures = {
+        'indicators': FORECAST_EXECUTOR.submit(stages['indicators'].run, _indicator_stage, config, ticker),
+        'msfo': FORECAST_EXECUTOR.submit(stages['msfo'].run, _msfo_stage, ticker, base_ticker, is_preferred),
+    }
+    inputs = {}
+    for stage, lookup in (('monthly_macro', MACRO.monthly), ('yearly_macro', MACRO.yearly)):
+        try:
+            inputs[stage] = lookup(config['macro_from'])
+        except Exception as e:
+            print(f"Ошибка этапа '{stage}' для {ticker}: {str(e)}; в промпт идёт \"Отсутствует\"")
+            inputs[stage] = "Отсутствует"
+    for stage, future in futures.items():
+        fallback = None if stage == 'indicators' else "Отсутствует"
+        try:
+            inputs[stage] = stages[stage].result(future, started + timeouts[stage])
+            continue
+        except TimeoutError:
+            print(f"Этап '{stage}' для {ticker} не уложился в {timeouts[stage]} с")
+        except Exception as e:
+            print(f"Ошибка этапа '{stage}' для {ticker}: {str(e)}")
+        print(f"Этап '{stage}' для {ticker} заменён на {fallback!r}")
+        inputs[stage] = fallback
+    print(f"Данные для прогноза {ticker} собраны за {time.monotonic() - started:.2f} с")
+    return inputs
+
+
+def build_forecast_prompt(config, ticker, current_price, indicators, msfo_content, monthly_macro_content,
+                          yearly_macro_content):
+    header = "|".join(['дата'] + config['columns'][1:])
+    macro_years = f"{config['macro_from']}-{MACRO_BASE_YEAR}"
+    legend = "\n".join(config['legend'])
+    return f"""
+Ты финансовый аналитик, прогнозирующий цену акции (тикер: {ticker}) {config['horizon']}, МСФО и макроэкономике России.
 Текущая цена:{current_price}
-Данные (год, daily, дата|close|SMA_20|SMA_50|MACD|ADX_14|RSI_14|VWAP, |, \n):
+Данные ({config['data_label']}, {header}, |, \n):
 {indicators}
 МСФО (показатели|годы, |, \n):
 {msfo_content}
-Макро (месячные, 2024-2025, дата|CPI|Rate|USD/RUB, |, \n):
+Макро (месячные, {macro_years}, дата|CPI|Rate|USD/RUB, |, \n):
 {monthly_macro_content}
-Макро (годовые, 2024-2025, год|GDP|CPI|Unemployment|Rate|TradeBalance|BudgetDeficit|MOEX|USD/RUB|CCI, |, \n):
+Макро (годовые, {macro_years}, год|GDP|CPI|Unemployment|Rate|TradeBalance|BudgetDeficit|MOEX|USD/RUB|CCI, |, \n):
 {yearly_macro_content}
 Индикаторы:
-SMA_20:простая скользящая (20 дней)
-SMA_50:простая скользящая (50 дней)
-MACD:(12,26,9)
-ADX_14:сила тренда (14 дней)
-RSI_14:относительная сила (14 дней)
-VWAP:объёмно-взвешенная цена (дневная)
+{legend}
 Задача:
-1.Анализируй краткосрочный тренд (SMA_20), среднесрочный тренд (SMA_50), импульс (MACD), силу тренда (ADX_14), перекупленность/перепроданность (RSI_14), сравни close с VWAP.
+1.{config['trend_task']}
 2.Учти МСФО (NP, Assets, EV/EBITDA) и макро (GDP, CPI, Unemployment, Rate, TradeBalance, BudgetDeficit, MOEX, USD/RUB, CCI).
-3.Прогноз на 1-3 месяца:направление (рост,падение,боковик), вероятность (%), поддержка/сопротивление.
+3.Прогноз на {config['forecast_period']}:направление (рост,падение,боковик), вероятность (%), поддержка/сопротивление.
 4.Рекомендация:Активно продавать/Продавать/Держать/Покупать/Активно покупать (по всем данным и по индикаторам с обоснованием).
 Формат ответа:
 Текущая цена:[число]
@@ -125,97 +211,45 @@ VWAP:объёмно-взвешенная цена (дневная)
 Текст должен быть поделен на абзацы.
 """
 
-    local_llm_prompt = f"""
-Ты финансовый аналитик, прогнозирующий цену акции (тикер: {ticker}) на 1-3 месяца по данным за год (daily), МСФО и макроэкономике России.
-Текущая цена:{current_price}
-Данные (год, daily, дата|close|SMA_20|SMA_50|MACD|ADX_14|RSI_14|VWAP, |, \n):
-{indicators}
-МСФО (показатели|годы, |, \n):
-{msfo_content}
-Макро (месячные, 2024-2025, дата|CPI|Rate|USD/RUB, |, \n):
-{monthly_macro_content}
-Макро (годовые, 2024-2025, год|GDP|CPI|Unemployment|Rate|TradeBalance|BudgetDeficit|MOEX|USD/RUB|CCI, |, \n):
-{yearly_macro_content}
-Индикаторы:
-SMA_20:простая скользящая (20 дней)
-SMA_50:простая скользящая (50 дней)
-MACD:(12,26,9)
-ADX_14:сила тренда (14 дней)
-RSI_14:относительная сила (14 дней)
-VWAP:объёмно-взвешенная цена (дневная)
-Задача:
-1.Анализируй краткосрочный тренд (SMA_20), среднесрочный тренд (SMA_50), импульс (MACD), силу тренда (ADX_14), перекупленность/перепроданность (RSI_14), сравни close с VWAP.
-2.Учти МСФО (NP, Assets, EV/EBITDA) и макро (GDP, CPI, Unemployment, Rate, TradeBalance, BudgetDeficit, MOEX, USD/RUB, CCI).
-3.Прогноз на 1-3 месяца:направление (рост,падение,боковик), вероятность (%), поддержка/сопротивление.
-4.Рекомендация:Активно продавать/Продавать/Держать/Покупать/Активно покупать (по всем данным и по индикаторам с обоснованием).
-Формат ответа:
-Текущая цена:[число]
-Прогноз:[направление] ([число])
-Поддержка:[число],Сопротивление:[число]
-Рекомендация (все данные):[действие]
-Рекомендация (индикаторы):[действие]|[обоснование]
-Комментарий:[обоснование: индикаторы, МСФО, макро]
-Правила:
-Без Markdown
 
-Текст должен быть поделен на абзацы.
-"""
+def _forecast_cache_key(horizon, ticker, base_ticker, model, data):
+    # Ключ считается после сбора данных: в него входят последняя загруженная свеча и только что скачанный отчёт
+    input_paths = [report_path(base_ticker), storage.storage_path(MSFO_STORE.base_path),
+                   MONTHLY_MACRO_FILE, YEARLY_MACRO_FILE]
+    return FORECAST_CACHE.key(ticker, horizon, model, data, input_paths)
 
-    system_message = gigachat_prompt if model == "gigachat" else local_llm_prompt
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    prompt_filename = f"prompt_{ticker}_{timestamp}.txt"
-    prompt_filepath = os.path.join(prompts_dir, prompt_filename)
-    with open(prompt_filepath, "w", encoding="utf-8") as f:
-        f.write(system_message)
-    print(f"Промпт сохранён в файл: {prompt_filepath}")
+def forecast_flight_key(horizon, ticker, model):
+    """
+    Ключ FORECAST_FLIGHT: одинаковые прогнозы бота и ночного расчёта считаются один раз.
+    """
+    return ticker.upper(), horizon, model
 
-    try:
-        if model == "gigachat":
-            print("Using GigaChat for forecast")
-            with GigaChat(
-                credentials=GIGACHAT_API_KEY,
-                verify_ssl_certs=VERIFY_SSL_CERTS,
-                model="GigaChat-2-Max"
-            ) as gigachat_client:
-                response = gigachat_client.chat(system_message)
-                raw_response = response.choices[0].message.content.strip()
-                print(f"Raw GigaChat response: {raw_response}")
-                result = re.sub(r'<think>.*?(</think>|\s*$)', '', raw_response, flags=re.DOTALL).strip()
-                bot.send_message(chat_id, result)
-                print(f"Краткосрочный прогноз для {ticker} отправлен: {result}")
-        else:
-            print("Using local LLM for forecast")
-            openai_client = OpenAI(base_url="http://localhost:1234/v1", api_key="not-needed")
-            response = openai_client.chat.completions.create(
-                model="deepseek-r1-distill-qwen-14b",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": f"Сделай краткосрочный прогноз для акции {ticker}."}
-                ],
-                max_tokens=500,
-                temperature=0.3
-            )
-            raw_response = response.choices[0].message.content.strip()
-            print(f"Raw local LLM response: {raw_response}")
-            result = re.sub(r'<think>.*?(</think>|\s*$)', '', raw_response, flags=re.DOTALL).strip()
-            bot.send_message(chat_id, result)
-            print(f"Краткосрочный прогноз для {ticker} отправлен: {result}")
-    except Exception as e:
-        error_msg = f"Ошибка при формировании прогноза для {ticker}: {str(e)}\nТип ошибки: {type(e).__name__}"
-        bot.send_message(chat_id, error_msg)
-        print(error_msg)
 
-def medium_term_forecast(ticker, chat_id, bot, base_ticker=None, is_preferred=False, model="local"):
+def produce_forecast(horizon, ticker, base_ticker=None, is_preferred=False, model="local", notify=None,
+                     writer=None):
     """
-    Генерирует среднесрочный прогноз (3-6 месяцев) для акции с таймфреймом 'weekly' за 5 лет.
-    Использует столбцы: date, close, SMA_20, SMA_50, MACD, ADX_14, RSI_14, VWAP.
-    Включает текущую цену в ответ бота.
-    Сохраняет промпт в папку 'prompts'.
+    Прогноз по конфигурации FORECASTS[horizon]: сбор данных, промпт (сохраняется в 'prompts'), ответ LLM.
+    Если для последней загруженной свечи и тех же входных файлов ответ уже есть в FORECAST_CACHE,
+    LLM не вызывается; новый ответ сохраняется в FORECAST_CACHE.
+
+    Args:
+        horizon (str): 'short', 'medium' или 'long'.
+        ticker (str): Тикер.
+        base_ticker (str): Тикер отчётов (для префа — обыкновенная акция).
+        is_preferred (bool): Привилегированная акция.
+        model (str): "gigachat" или "local".
+        notify (callable): Получает сообщения о ходе и ошибках для пользователя (None — только лог).
+        writer (TelegramStreamWriter): Показывает ответ по мере генерации (None — ответ целиком).
+
+    Returns:
+        dict: Запись FORECAST_CACHE ('result' — текст прогноза, 'created_at'; 'cached' — True,
+            если она взята из кэша) или None при ошибке.
     """
-    print(f"medium_term_forecast called with ticker={ticker}, model={model}")
-    timeframe = "weekly"
-    period_years = 5
+    config = FORECASTS[horizon]
+    name = config['name']
+    notify = notify or (lambda text: None)
+    print(f"{horizon}_term_forecast called with ticker={ticker}, model={model}")
 
     if base_ticker is None:
         base_ticker = ticker
@@ -224,159 +258,41 @@ def medium_term_forecast(ticker, chat_id, bot, base_ticker=None, is_preferred=Fa
     if not os.path.exists(prompts_dir):
         os.makedirs(prompts_dir)
 
-    print(f"Загрузка сырых данных для {ticker} ({timeframe}, {period_years}Y)")
-    raw_data = get_historical_data(ticker, timeframe, period_years)
-    if raw_data is None or raw_data.empty:
-        bot.send_message(chat_id, f"Не удалось получить исторические данные для {ticker}.")
-        print(f"Ошибка: исторические данные для {ticker} ({timeframe}, {period_years}Y) недоступны")
-        return
-
-    print(f"Сырые данные для {ticker}: {len(raw_data)} строк, столбцы: {list(raw_data.columns)}")
-
-    data = calculate_indicators(
-        raw_data,
-        sma_periods=[20, 50],
-        macd_params=(12, 26, 9),
-        adx_period=14,
-        rsi_period=14
-    )
+    inputs = gather_forecast_inputs(config, ticker, base_ticker, is_preferred)
+    data = inputs['indicators']
     if data is None or data.empty:
-        bot.send_message(chat_id, f"Не удалось рассчитать индикаторы для {ticker}.")
-        print(f"Ошибка: не удалось рассчитать индикаторы для {ticker}")
-        return
-
-    print(f"Данные с индикаторами для {ticker}: {len(data)} строк, столбцы: {list(data.columns)}")
+        notify(f"Не удалось получить исторические данные для {ticker}.")
+        print(f"Ошибка: исторические данные для {ticker} ({config['timeframe']}, {config['period_years']}Y) недоступны")
+        return None
 
     current_price = data['close'].iloc[-1] if 'close' in data.columns else None
     if current_price is None:
-        bot.send_message(chat_id, f"Ошибка: не удалось определить текущую цену для {ticker}.")
+        notify(f"Ошибка: не удалось определить текущую цену для {ticker}.")
         print(f"Ошибка: столбец close отсутствует в данных для {ticker}")
-        return
+        return None
+
+    cache_key = _forecast_cache_key(horizon, ticker, base_ticker, model, data)
+    entry = FORECAST_CACHE.get(cache_key)
+    if entry is not None:
+        print(f"{name.capitalize()} прогноз для {ticker} взят из кэша (свеча {data['date'].iloc[-1]})")
+        return dict(entry, cached=True)
 
-    forecast_columns = ['date', 'close', 'SMA_20', 'SMA_50', 'MACD', 'ADX_14', 'RSI_14', 'VWAP']
+    forecast_columns = config['columns']
     missing_columns = [col for col in forecast_columns if col not in data.columns]
     if missing_columns:
-        bot.send_message(chat_id, f"Ошибка: отсутствуют столбцы {missing_columns} в данных для {ticker}.")
+        notify(f"Ошибка: отсутствуют столбцы {missing_columns} в данных для {ticker}.")
         print(f"Ошибка: отсутствуют столбцы {missing_columns}")
-        return
+        return None
 
     forecast_data = data[forecast_columns].copy()
     forecast_data['date'] = pd.to_datetime(forecast_data['date']).dt.strftime('%Y-%m-%d')
     indicators = forecast_data.to_csv(index=False, header=True, sep='|', lineterminator='\n')
     indicators = re.sub(r'[ \t]+', '', indicators)
 
-    download_reports(ticker, is_preferred, base_ticker)
-    msfo_file = os.path.join("reports", f"{base_ticker}-МСФО-годовые.csv")
-
-    msfo_content = "Отсутствует"
-    if os.path.exists(msfo_file):
-        try:
-            msfo_df = read_csv_file(msfo_file)
-            if msfo_df is not None:
-                msfo_content = optimize_msfo_content(msfo_df)
-            else:
-                print(f"Ошибка: не удалось прочитать МСФО для {base_ticker}")
-        except Exception as e:
-            print(f"Ошибка чтения МСФО для {base_ticker}: {str(e)}")
-
-    monthly_macro_content = "Отсутствует"
-    try:
-        monthly_macro_df = read_monthly_macro_content()
-        if monthly_macro_df is not None and not monthly_macro_df.empty:
-            monthly_macro_df['Дата'] = pd.to_datetime(monthly_macro_df['Дата'], format='%Y-%m', errors='coerce')
-            monthly_macro_df = monthly_macro_df[monthly_macro_df['Дата'].dt.year >= 2020]
-            monthly_macro_content = optimize_monthly_macro(monthly_macro_df)
-        else:
-            print("Месячные макро-данные недоступны")
-    except Exception as e:
-        print(f"Ошибка обработки месячных макро-данных: {str(e)}")
-
-    yearly_macro_content = "Отсутствует"
-    try:
-        yearly_macro_df = read_yearly_macro_content()
-        if yearly_macro_df is not None and not yearly_macro_df.empty:
-            yearly_macro_df = yearly_macro_df[yearly_macro_df['Год'] >= 2020]
-            yearly_macro_content = optimize_yearly_macro(yearly_macro_df)
-        else:
-            print("Годовые макро-данные недоступны")
-    except Exception as e:
-        print(f"Ошибка обработки годовых макро-данных: {str(e)}")
+    notify(f"Формируется {name} прогноз, подождите.")
 
-    bot.send_message(chat_id, "Формируется среднесрочный прогноз, подождите.")
-
-    gigachat_prompt = f"""
-Ты финансовый аналитик, прогнозирующий цену акции (тикер: {ticker}) на 3-9 месяцев по данным за 5 лет (weekly), МСФО и макроэкономике России.
-Текущая цена:{current_price}
-Данные (5 лет, weekly, дата|close|SMA_20|SMA_50|MACD|ADX_14|RSI_14|VWAP, |, \n):
-{indicators}
-МСФО (показатели|годы, |, \n):
-{msfo_content}
-Макро (месячные, 2020-2025, дата|CPI|Rate|USD/RUB, |, \n):
-{monthly_macro_content}
-Макро (годовые, 2020-2025, год|GDP|CPI|Unemployment|Rate|TradeBalance|BudgetDeficit|MOEX|USD/RUB|CCI, |, \n):
-{yearly_macro_content}
-Индикаторы:
-SMA_20:простая скользящая (20 недель)
-SMA_50:простая скользящая (50 недель)
-MACD:(12,26,9)
-ADX_14:сила тренда (14 недель)
-RSI_14:относительная сила (14 недель)
-VWAP:объёмно-взвешенная цена (недельная)
-Задача:
-1.Анализируй среднесрочный тренд (SMA_20, SMA_50), импульс (MACD), силу тренда (ADX_14), перекупленность/перепроданность (RSI_14), сравни close с VWAP.
-2.Учти МСФО (NP, Assets, EV/EBITDA) и макро (GDP, CPI, Unemployment, Rate, TradeBalance, BudgetDeficit, MOEX, USD/RUB, CCI).
-3.Прогноз на 3-6 месяцев:направление (рост,падение,боковик), вероятность (%), поддержка/сопротивление.
-4.Рекомендация:Активно продавать/Продавать/Держать/Покупать/Активно покупать (по всем данным и по индикаторам с обоснованием).
-Формат ответа:
-Текущая цена:[число]
-Прогноз:[направление] ([число])
-Поддержка:[число],Сопротивление:[число]
-Рекомендация (все данные):[действие]
-Рекомендация (индикаторы):[действие]|[обоснование]
-Комментарий:[обоснование: индикаторы, МСФО, макро]
-Правила:
-Без Markdown
-
-Текст должен быть поделен на абзацы.
-"""
-
-    local_llm_prompt = f"""
-Ты финансовый аналитик, прогнозирующий цену акции (тикер: {ticker}) на 3-9 месяцев по данным за 5 лет (weekly), МСФО и макроэкономике России.
-Текущая цена:{current_price}
-Данные (5 лет, weekly, дата|close|SMA_20|SMA_50|MACD|ADX_14|RSI_14|VWAP, |, \n):
-{indicators}
-МСФО (показатели|годы, |, \n):
-{msfo_content}
-Макро (месячные, 2020-2025, дата|CPI|Rate|USD/RUB, |, \n):
-{monthly_macro_content}
-Макро (годовые, 2020-2025, год|GDP|CPI|Unemployment|Rate|TradeBalance|BudgetDeficit|MOEX|USD/RUB|CCI, |, \n):
-{yearly_macro_content}
-Индикаторы:
-SMA_20:простая скользящая (20 недель)
-SMA_50:простая скользящая (50 недель)
-MACD:(12,26,9)
-ADX_14:сила тренда (14 недель)
-RSI_14:относительная сила (14 недель)
-VWAP:объёмно-взвешенная цена (недельная)
-Задача:
-1.Анализируй среднесрочный тренд (SMA_20, SMA_50), импульс (MACD), силу тренда (ADX_14), перекупленность/перепроданность (RSI_14), сравни close с VWAP.
-2.Учти МСФО (NP, Assets, EV/EBITDA) и макро (GDP, CPI, Unemployment, Rate, TradeBalance, BudgetDeficit, MOEX, USD/RUB, CCI).
-3.Прогноз на 3-6 месяцев:направление (рост,падение,боковик), вероятность (%), поддержка/сопротивление.
-4.Рекомендация:Активно продавать/Продавать/Держать/Покупать/Активно покупать (по всем данным и по индикаторам с обоснованием).
-Формат ответа:
-Текущая цена:[число]
-Прогноз:[направление] ([число])
-Поддержка:[число],Сопротивление:[число]
-Рекомендация (все данные):[действие]
-Рекомендация (индикаторы):[действие]|[обоснование]
-Комментарий:[обоснование: индикаторы, МСФО, макро]
-Правила:
-Без Markdown
-
-Текст должен быть поделен на абзацы.
-"""
-
-    system_message = gigachat_prompt if model == "gigachat" else local_llm_prompt
+    system_message = build_forecast_prompt(config, ticker, current_price, indicators, inputs['msfo'],
+                                           inputs['monthly_macro'], inputs['yearly_macro'])
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     prompt_filename = f"prompt_{ticker}_{timestamp}.txt"
@@ -388,250 +304,102 @@ VWAP:объёмно-взвешенная цена (недельная)
     try:
         if model == "gigachat":
             print("Using GigaChat for forecast")
-            with GigaChat(
-                credentials=GIGACHAT_API_KEY,
-                verify_ssl_certs=VERIFY_SSL_CERTS,
-                model="GigaChat-2-Max"
-            ) as gigachat_client:
+            gigachat_client = LLM_CLIENTS.gigachat()
+            if writer is not None:
+                raw_response = writer.consume(gigachat_deltas(gigachat_client.stream(system_message))).strip()
+            else:
                 response = gigachat_client.chat(system_message)
                 raw_response = response.choices[0].message.content.strip()
-                print(f"Raw GigaChat response: {raw_response}")
-                result = re.sub(r'<think>.*?(</think>|\s*$)', '', raw_response, flags=re.DOTALL).strip()
-                bot.send_message(chat_id, result)
-                print(f"Среднесрочный прогноз для {ticker} отправлен: {result}")
+            print(f"Raw GigaChat response: {raw_response}")
         else:
             print("Using local LLM for forecast")
-            openai_client = OpenAI(base_url="http://localhost:1234/v1", api_key="not-needed")
+            openai_client = LLM_CLIENTS.openai()
             response = openai_client.chat.completions.create(
-                model="deepseek-r1-distill-qwen-14b",
+                model=LOCAL_LLM_MODEL,
                 messages=[
                     {"role": "system", "content": system_message},
-                    {"role": "user", "content": f"Сделай среднесрочный прогноз для акции {ticker}."}
+                    {"role": "user", "content": f"Сделай {name} прогноз для акции {ticker}."}
                 ],
-                max_tokens=500,
-                temperature=0.3
+                max_tokens=config['max_tokens'],
+                temperature=0.3,
+                stream=writer is not None
             )
-            raw_response = response.choices[0].message.content.strip()
+            if writer is not None:
+                raw_response = writer.consume(openai_deltas(response)).strip()
+            else:
+                raw_response = response.choices[0].message.content.strip()
             print(f"Raw local LLM response: {raw_response}")
-            result = re.sub(r'<think>.*?(</think>|\s*$)', '', raw_response, flags=re.DOTALL).strip()
-            bot.send_message(chat_id, result)
-            print(f"Среднесрочный прогноз для {ticker} отправлен: {result}")
+        # При потоке — тот же очищенный текст, что показывался, чтобы совпали границы сообщений
+        result = writer.text if writer is not None else strip_think(raw_response)
     except Exception as e:
         error_msg = f"Ошибка при формировании прогноза для {ticker}: {str(e)}\nТип ошибки: {type(e).__name__}"
-        bot.send_message(chat_id, error_msg)
+        notify(error_msg)
         print(error_msg)
+        return None
 
-def long_term_forecast(ticker, chat_id, bot, base_ticker=None, is_preferred=False, model="local"):
-    """
-    Генерирует долгосрочный прогноз (более 1 года) для акции с таймфреймом 'weekly' за 10 лет.
-    Использует столбцы: date, close, SMA_50, SMA_200, MACD, ADX_14, RSI_21, VWAP.
-    Включает текущую цену в ответ бота.
-    Сохраняет промпт в папку 'prompts'.
-    """
-    print(f"long_term_forecast called with ticker={ticker}, model={model}")
-    timeframe = "weekly"
-    period_years = 10
+    entry = FORECAST_CACHE.put(cache_key, result, ticker=ticker, horizon=horizon, model=model)
+    return dict(entry, cached=False)
 
-    if base_ticker is None:
-        base_ticker = ticker
 
-    prompts_dir = os.path.join(os.getcwd(), "prompts")
-    if not os.path.exists(prompts_dir):
-        os.makedirs(prompts_dir)
-
-    print(f"Загрузка сырых данных для {ticker} ({timeframe}, {period_years}Y)")
-    raw_data = get_historical_data(ticker, timeframe, period_years)
-    if raw_data is None or raw_data.empty:
-        bot.send_message(chat_id, f"Не удалось получить исторические данные для {ticker}.")
-        print(f"Ошибка: исторические данные для {ticker} ({timeframe}, {period_years}Y) недоступны")
-        return
-
-    print(f"Сырые данные для {ticker}: {len(raw_data)} строк, столбцы: {list(raw_data.columns)}")
+def run_forecast(horizon, ticker, chat_id, bot, base_ticker=None, is_preferred=False, model="local"):
+    """
+    Отправляет прогноз в чат через produce_forecast (одновременные одинаковые запросы ждут один расчёт);
+    если с последней загруженной свечи входы не менялись, ответ берётся из FORECAST_CACHE.
 
-    data = calculate_indicators(
-        raw_data,
-        sma_periods=[50, 200],
-        macd_params=(24, 52, 9),
-        adx_period=14,
-        rsi_period=21
+    При LLM_STREAMING ответ показывается по мере генерации правкой одного сообщения;
+    ожидавшие чужого расчёта получают уведомление, а затем готовый текст или сообщение о неудаче.
+    """
+    config = FORECASTS[horizon]
+    base_ticker = base_ticker or ticker
+    FORECAST_REQUESTS.record(ticker, base_ticker)
+
+    name = config['name']
+    writer = TelegramStreamWriter(bot, chat_id) if LLM_STREAMING else None
+    led = []
+
+    def produce():
+        led.append(True)
+        return produce_forecast(horizon, ticker, base_ticker, is_preferred, model,
+                                lambda text: bot.send_message(chat_id, text), writer)
+
+    # Ожидающие чужого расчёта не получают его сообщений о ходе: им отдельное уведомление
+    entry = FORECAST_FLIGHT.do_notify(
+        forecast_flight_key(horizon, ticker, model),
+        lambda: bot.send_message(chat_id, f"{name.capitalize()} прогноз для {ticker} уже формируется, подождите."),
+        produce
     )
-    if data is None or data.empty:
-        bot.send_message(chat_id, f"Не удалось рассчитать индикаторы для {ticker}.")
-        print(f"Ошибка: не удалось рассчитать индикаторы для {ticker}")
+    if entry is None:
+        # Лидер уже сообщил об ошибке в свой чат, ожидавшим — отдельно
+        if not led:
+            bot.send_message(chat_id, f"Не удалось сформировать {name} прогноз для {ticker}. Попробуйте позже.")
         return
+    result = entry['result']
+    if entry['cached']:
+        send_chunks(bot, chat_id, f"{cached_note(entry)}\n\n{result}")
+    elif writer is not None and writer.started:
+        if not writer.finish(result):
+            writer.fallback(result)
+    else:
+        send_chunks(bot, chat_id, result)
+    print(f"{config['name'].capitalize()} прогноз для {ticker} отправлен: {result}")
 
-    print(f"Данные с индикаторами для {ticker}: {len(data)} строк, столбцы: {list(data.columns)}")
-
-    current_price = data['close'].iloc[-1] if 'close' in data.columns else None
-    if current_price is None:
-        bot.send_message(chat_id, f"Ошибка: не удалось определить текущую цену для {ticker}.")
-        print(f"Ошибка: столбец close отсутствует в данных для {ticker}")
-        return
-
-    forecast_columns = ['date', 'close', 'SMA_50', 'SMA_200', 'MACD', 'ADX_14', 'RSI_21', 'VWAP']
-    missing_columns = [col for col in forecast_columns if col not in data.columns]
-    if missing_columns:
-        bot.send_message(chat_id, f"Ошибка: отсутствуют столбцы {missing_columns} в данных для {ticker}.")
-        print(f"Ошибка: отсутствуют столбцы {missing_columns}")
-        return
-
-    forecast_data = data[forecast_columns].copy()
-    forecast_data['date'] = pd.to_datetime(forecast_data['date']).dt.strftime('%Y-%m-%d')
-    indicators = forecast_data.to_csv(index=False, header=True, sep='|', lineterminator='\n')
-    indicators = re.sub(r'[ \t]+', '', indicators)
-
-    download_reports(ticker, is_preferred, base_ticker)
-    msfo_file = os.path.join("reports", f"{base_ticker}-МСФО-годовые.csv")
-
-    msfo_content = "Отсутствует"
-    if os.path.exists(msfo_file):
-        try:
-            msfo_df = read_csv_file(msfo_file)
-            if msfo_df is not None:
-                msfo_content = optimize_msfo_content(msfo_df)
-            else:
-                print(f"Ошибка: не удалось прочитать МСФО для {base_ticker}")
-        except Exception as e:
-            print(f"Ошибка чтения МСФО для {base_ticker}: {str(e)}")
-
-    monthly_macro_content = "Отсутствует"
-    try:
-        monthly_macro_df = read_monthly_macro_content()
-        if monthly_macro_df is not None and not monthly_macro_df.empty:
-            monthly_macro_df['Дата'] = pd.to_datetime(monthly_macro_df['Дата'], format='%Y-%m', errors='coerce')
-            monthly_macro_df = monthly_macro_df[monthly_macro_df['Дата'].dt.year >= 2015]
-            monthly_macro_content = optimize_monthly_macro(monthly_macro_df)
-        else:
-            print("Месячные макро-данные недоступны")
-    except Exception as e:
-        print(f"Ошибка обработки месячных макро-данных: {str(e)}")
-
-    yearly_macro_content = "Отсутствует"
-    try:
-        yearly_macro_df = read_yearly_macro_content()
-        if yearly_macro_df is not None and not yearly_macro_df.empty:
-            yearly_macro_df = yearly_macro_df[yearly_macro_df['Год'] >= 2015]
-            yearly_macro_content = optimize_yearly_macro(yearly_macro_df)
-        else:
-            print("Годовые макро-данные недоступны")
-    except Exception as e:
-        print(f"Ошибка обработки годовых макро-данных: {str(e)}")
-
-    bot.send_message(chat_id, "Формируется долгосрочный прогноз, подождите.")
-
-    gigachat_prompt = f"""
-Ты финансовый аналитик, прогнозирующий цену акции (тикер: {ticker}) на более чем 1 год по данным за 10 лет (weekly), МСФО и макроэкономике России.
-Текущая цена:{current_price}
-Данные (10 лет, weekly, дата|close|SMA_50|SMA_200|MACD|ADX_14|RSI_21|VWAP, |, \n):
-{indicators}
-МСФО (показатели|годы, |, \n):
-{msfo_content}
-Макро (месячные, 2015-2025, дата|CPI|Rate|USD/RUB, |, \n):
-{monthly_macro_content}
-Макро (годовые, 2015-2025, год|GDP|CPI|Unemployment|Rate|TradeBalance|BudgetDeficit|MOEX|USD/RUB|CCI, |, \n):
-{yearly_macro_content}
-Индикаторы:
-SMA_50:простая скользящая (50 недель)
-SMA_200:простая скользящая (200 недель)
-MACD:(24,52,9)
-ADX_14:сила тренда (14 недель)
-RSI_21:относительная сила (21 неделя)
-VWAP:объёмно-взвешенная цена (недельная)
-Задача:
-1.Анализируй долгосрочный тренд (SMA_50, SMA_200), импульс (MACD), силу тренда (ADX_14), перекупленность/перепроданность (RSI_21), сравни close с VWAP.
-2.Учти МСФО (NP, Assets, EV/EBITDA) и макро (GDP, CPI, Unemployment, Rate, TradeBalance, BudgetDeficit, MOEX, USD/RUB, CCI).
-3.Прогноз на 6-12 месяцев:направление (рост,падение,боковик), вероятность (%), поддержка/сопротивление.
-4.Рекомендация:Активно продавать/Продавать/Держать/Покупать/Активно покупать (по всем данным и по индикаторам с обоснованием).
-Формат ответа:
-Текущая цена:[число]
-Прогноз:[направление] ([число])
-Поддержка:[число],Сопротивление:[число]
-Рекомендация (все данные):[действие]
-Рекомендация (индикаторы):[действие]|[обоснование]
-Комментарий:[обоснование: индикаторы, МСФО, макро]
-Правила:
-Без Markdown
-
-Текст должен быть поделен на абзацы.
-"""
 
-    local_llm_prompt = f"""
-Ты финансовый аналитик, прогнозирующий цену акции (тикер: {ticker}) на более чем 1 год по данным за 10 лет (weekly), МСФО и макроэкономике России.
-Текущая цена:{current_price}
-Данные (10 лет, weekly, дата|close|SMA_50|SMA_200|MACD|ADX_14|RSI_21|VWAP, |, \n):
-{indicators}
-МСФО (показатели|годы, |, \n):
-{msfo_content}
-Макро (месячные, 2015-2025, дата|CPI|Rate|USD/RUB, |, \n):
-{monthly_macro_content}
-Макро (годовые, 2015-2025, год|GDP|CPI|Unemployment|Rate|TradeBalance|BudgetDeficit|MOEX|USD/RUB|CCI, |, \n):
-{yearly_macro_content}
-Индикаторы:
-SMA_50:простая скользящая (50 недель)
-SMA_200:простая скользящая (200 недель)
-MACD:(24,52,9)
-ADX_14:сила тренда (14 недель)
-RSI_21:относительная сила (21 неделя)
-VWAP:объёмно-взвешенная цена (недельная)
-Задача:
-1.Анализируй долгосрочный тренд (SMA_50, SMA_200), импульс (MACD), силу тренда (ADX_14), перекупленность/перепроданность (RSI_21), сравни close с VWAP.
-2.Учти МСФО (NP, Assets, EV/EBITDA) и макро (GDP, CPI, Unemployment, Rate, TradeBalance, BudgetDeficit, MOEX, USD/RUB, CCI).
-3.Прогноз на 6-12 месяцев:направление (рост,падение,боковик), вероятность (%), поддержка/сопротивление.
-4.Рекомендация:Активно продавать/Продавать/Держать/Покупать/Активно покупать (по всем данным и по индикаторам с обоснованием).
-Формат ответа:
-Текущая цена:[число]
-Прогноз:[направление] ([число])
-Поддержка:[число],Сопротивление:[число]
-Рекомендация (все данные):[действие]
-Рекомендация (индикаторы):[действие]|[обоснование]
-Комментарий:[обоснование: индикаторы, МСФО, макро]
-Правила:
-Без Markdown
+def short_term_forecast(ticker, chat_id, bot, base_ticker=None, is_preferred=False, model="local"):
+    """
+    Краткосрочный прогноз (1-3 месяца) по дневным данным за 1 год.
+    """
+    run_forecast('short', ticker, chat_id, bot, base_ticker, is_preferred, model)
 
-Текст должен быть поделен на абзацы.
-"""
 
-    system_message = gigachat_prompt if model == "gigachat" else local_llm_prompt
+def medium_term_forecast(ticker, chat_id, bot, base_ticker=None, is_preferred=False, model="local"):
+    """
+    Среднесрочный прогноз (3-6 месяцев) по недельным данным за 5 лет.
+    """
+    run_forecast('medium', ticker, chat_id, bot, base_ticker, is_preferred, model)
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    prompt_filename = f"prompt_{ticker}_{timestamp}.txt"
-    prompt_filepath = os.path.join(prompts_dir, prompt_filename)
-    with open(prompt_filepath, "w", encoding="utf-8") as f:
-        f.write(system_message)
-    print(f"Промпт сохранён в файл: {prompt_filepath}")
 
-    try:
-        if model == "gigachat":
-            print("Using GigaChat for forecast")
-            with GigaChat(
-                credentials=GIGACHAT_API_KEY,
-                verify_ssl_certs=VERIFY_SSL_CERTS,
-                model="GigaChat-2-Max"
-            ) as gigachat_client:
-                response = gigachat_client.chat(system_message)
-                raw_response = response.choices[0].message.content.strip()
-                print(f"Raw GigaChat response: {raw_response}")
-                result = re.sub(r'<think>.*?(</think>|\s*$)', '', raw_response, flags=re.DOTALL).strip()
-                bot.send_message(chat_id, result)
-                print(f"Долгосрочный прогноз для {ticker} отправлен: {result}")
-        else:
-            print("Using local LLM for forecast")
-            openai_client = OpenAI(base_url="http://localhost:1234/v1", api_key="not-needed")
-            response = openai_client.chat.completions.create(
-                model="deepseek-r1-distill-qwen-14b",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": f"Сделай долгосрочный прогноз для акции {ticker}."}
-                ],
-                max_tokens=50000,
-                temperature=0.3
-            )
-            raw_response = response.choices[0].message.content.strip()
-            print(f"Raw local LLM response: {raw_response}")
-            result = re.sub(r'<think>.*?(</think>|\s*$)', '', raw_response, flags=re.DOTALL).strip()
-            bot.send_message(chat_id, result)
-            print(f"Долгосрочный прогноз для {ticker} отправлен: {result}")
-    except Exception as e:
-        error_msg = f"Ошибка при формировании прогноза для {ticker}: {str(e)}\nТип ошибки: {type(e).__name__}"
-        bot.send_message(chat_id, error_msg)
-        print(error_msg)
\ No newline at end of file
+def long_term_forecast(ticker, chat_id, bot, base_ticker=None, is_preferred=False, model="local"):
+    """
+    Долгосрочный прогноз (более 1 года) по недельным данным за 10 лет.
+    """
+    run_forecast('long', ticker, chat_id, bot, base_ticker, is_preferred, model)
@@ -0,0 +1,264 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+FORECAST_CACHE_DIR = os.path.join("historical_data", "forecast_cache")
+# Записи старше недельной свечи с запасом удаляются при очистке, сек.
+FORECAST_CACHE_MAX_AGE = 8 * 24 * 3600
+# Не чаще, чем раз в столько секунд, запись в кэш запускает очистку
+FORECAST_CACHE_PRUNE_INTERVAL = 3600
+# Счётчики запросов прогнозов по тикерам (для выбора самых популярных в ночном расчёте)
+FORECAST_REQUESTS_FILE = os.path.join("historical_data", "forecast_requests.json")
+# Как часто накопленные в памяти счётчики сливаются с файлом, сек. (и при завершении процесса)
+FORECAST_REQUESTS_FLUSH_INTERVAL = 60
+
+
+def input_version(paths):
+    """
+    Версия входных файлов: время изменения и размер каждого (отсутствующий файл — отдельная версия).
+    """
+    parts = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            parts.append([path, stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            parts.append([path, None, None])
+    return hashlib.sha1(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+def cached_note(entry):
+    """
+    Пометка для ответа из кэша: когда сформирован прогноз.
+    """
+    created = datetime.fromtimestamp(entry['created_at'])
+    return f"Прогноз сформирован {created:%d.%m.%Y %H:%M} (свечи и отчёты с тех пор не изменились)."
+
+
+class ForecastCache:
+    """
+    Кэш готовых ответов LLM: в памяти и JSON-файлами на диске (общий для бота и пакетного расчёта).
+
+    Ключ включает тикер, горизонт, модель, время и close последней свечи загруженных данных и версию
+    файлов МСФО/макро, поэтому запись перестаёт находиться, как только в данных появилась новая или
+    обновилась последняя свеча, или при изменении любого входного файла.
+    """
+
+    def __init__(self, directory=FORECAST_CACHE_DIR, max_age=FORECAST_CACHE_MAX_AGE):
+        self.directory = directory
+        self.max_age = max_age
+        self.memory = {}
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stored': 0}
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+
+    def key(self, ticker, horizon, model, data, input_paths):
+        """
+        Ключ записи по загруженным свечам data (колонки 'date' и 'close') и входным файлам.
+        """
+        source = {
+            'ticker': ticker.upper(),
+            'horizon': horizon,
+            'model': model,
+            'bar': pd.Timestamp(data['date'].iloc[-1]).isoformat(),
+            'close': float(data['close'].iloc[-1]),
+            'inputs': input_version(input_paths),
+        }
+        return hashlib.sha1(json.dumps(source, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """
+        Возвращает запись {'result', 'created_at', ...} или None.
+        """
+        with self._lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.counters['memory_hits'] += 1
+                return entry
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.counters['misses'] += 1
+            return None
+        with self._lock:
+            self.memory[key] = entry
+            self.counters['disk_hits'] += 1
+        return entry
+
+    def put(self, key, result, **fields):
+        entry = dict(fields, result=result, created_at=time.time())
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.memory[key] = entry
+            self.counters['stored'] += 1
+            prune = time.time() - self._pruned_at > FORECAST_CACHE_PRUNE_INTERVAL
+        if prune:
+            self.prune()
+        return entry
+
+    def prune(self):
+        """
+        Удаляет записи старше max_age из памяти и с диска.
+        """
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            self._pruned_at = time.time()
+            self.memory = {key: entry for key, entry in self.memory.items() if entry['created_at'] >= cutoff}
+        removed = 0
+        if os.path.exists(self.directory):
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        return removed
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters['memory_items'] = len(self.memory)
+            return counters
+
+
+class _FileLock:
+    """
+    Межпроцессная блокировка на время слияния счётчиков (бот и отдельный процесс ночного расчёта).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a+')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+
+
+class ForecastRequests:
+    """
+    Число запросов прогноза по тикерам.
+
+    Запрос только увеличивает счётчик в памяти; фоновый поток раз в FORECAST_REQUESTS_FLUSH_INTERVAL
+    (и atexit) под файловой блокировкой перечитывает JSON, добавляет накопленные приращения и
+    записывает его, поэтому счётчики нескольких процессов складываются, а не затирают друг друга.
+    """
+
+    def __init__(self, path=FORECAST_REQUESTS_FILE, flush_interval=FORECAST_REQUESTS_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.counts = None
+        self.pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, ticker, base_ticker=None):
+        with self._lock:
+            entry = self.pending.setdefault(ticker.upper(), {'count': 0, 'base_ticker': (base_ticker or ticker).upper()})
+            entry['count'] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="forecast-requests", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """
+        Сливает накопленные приращения с файлом.
+
+        Returns:
+            dict: Итоговые счётчики всех процессов.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self.pending = self.pending, {}
+            if not pending:
+                # Нечего добавлять: файл заменяется атомарно, поэтому читается без блокировки
+                self.counts = self._read()
+                return self.counts
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            try:
+                with _FileLock(f"{self.path}.lock"):
+                    counts = self._read()
+                    for ticker, entry in pending.items():
+                        merged = counts.setdefault(ticker, {'count': 0, 'base_ticker': entry['base_ticker']})
+                        merged['count'] += entry['count']
+                    tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        json.dump(counts, f, ensure_ascii=False)
+                    os.replace(tmp_path, self.path)
+            except OSError as e:
+                # Приращения не теряются: вернутся в следующую попытку
+                print(f"Ошибка записи счётчиков прогнозов '{self.path}': {e}")
+                with self._lock:
+                    for ticker, entry in pending.items():
+                        current = self.pending.setdefault(ticker, {'count': 0, 'base_ticker': entry['base_ticker']})
+                        current['count'] += entry['count']
+                return self.counts or {}
+            self.counts = counts
+            return counts
+
+    def top(self, n):
+        """
+        Самые запрашиваемые тикеры всех процессов: список (тикер, базовый тикер) по убыванию числа запросов.
+        """
+        counts = self.flush()
+        ranked = sorted(counts.items(), key=lambda item: item[1]['count'], reverse=True)[:n]
+        return [(ticker, entry['base_ticker']) for ticker, entry in ranked]
+
+
+# Общий кэш прогнозов процесса
+FORECAST_CACHE = ForecastCache()
+FORECAST_REQUESTS = ForecastRequests()
+atexit.register(FORECAST_REQUESTS.flush)
@@ -1,16 +1,13 @@
-from gigachat import GigaChat
-from bot_config import GIGACHAT_API_KEY, GIGACHAT_MODEL, VERIFY_SSL_CERTS
+from bot_config import GIGACHAT_MODEL
+from llm_clients import LLM_CLIENTS
 
 # Синхронная функция для получения ответа от GigaChat
 def get_gigachat_response(prompt: str) -> str:
-    with GigaChat(
-        credentials=GIGACHAT_API_KEY,  # Используем credentials вместо api_key
-        verify_ssl_certs=VERIFY_SSL_CERTS,
-        model=GIGACHAT_MODEL
-    ) as client:
-        try:
-            # Синхронный запрос к GigaChat API с использованием позиционного аргумента
-            response = client.chat(prompt)
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Ошибка GigaChat: {str(e)}"
\ No newline at end of file
+    # Общий клиент процесса: соединение и токен переиспользуются между запросами
+    client = LLM_CLIENTS.gigachat(GIGACHAT_MODEL)
+    try:
+        # Синхронный запрос к GigaChat API с использованием позиционного аргумента
+        response = client.chat(prompt)
+        return response.choices[0].message.content
+    except Exception as e:
+        return f"Ошибка GigaChat: {str(e)}"
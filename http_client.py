@@ -0,0 +1,192 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+# Лимиты по хостам: (запросов в секунду, размер всплеска)
+HOST_RATE_LIMITS = {
+    "iss.moex.com": (10.0, 20),
+    "smart-lab.ru": (1.0, 3),
+}
+DEFAULT_RATE_LIMIT = (5.0, 10)
+# Пул соединений и таймауты (подключение, чтение), сек.
+HTTP_POOL_SIZE = 8
+HTTP_TIMEOUT = (5, 30)
+# Повторы: число попыток, база и потолок экспоненциальной задержки, сек.
+HTTP_MAX_RETRIES = 4
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_CAP = 20.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HttpError(Exception):
+    """
+    Запрос не выполнен: исчерпаны повторы, истёк дедлайн или сервер вернул неповторяемый статус.
+    """
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """
+    Адаптивный token bucket: при 429 скорость снижается вдвое, после успешных
+    ответов постепенно возвращается к настроенной.
+    """
+
+    def __init__(self, rate, capacity):
+        self.max_rate = rate
+        self.min_rate = rate / 16
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, deadline=None):
+        """
+        Ждёт свободный токен.
+
+        Returns:
+            float: Время ожидания в секундах.
+
+        Raises:
+            HttpError: Если токен не освободится до дедлайна.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            if deadline is not None and now + delay > deadline:
+                raise HttpError("Дедлайн запроса истёк в ожидании лимита")
+            time.sleep(delay)
+            waited += delay
+
+    def throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def recover(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+class HttpClient:
+    """
+    Общий исходящий HTTP-слой: keep-alive пул, лимит по хостам, повторы с
+    экспоненциальной задержкой и джиттером, дедлайн на запрос и счётчики.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, max_retries=HTTP_MAX_RETRIES):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": "Mozilla/5.0"})
+        self.buckets = {}
+        self.counters = {'requests': 0, 'retries': 0, 'throttled': 0, 'failures': 0, 'rate_wait_seconds': 0.0}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host):
+        with self._lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                rate, capacity = HOST_RATE_LIMITS.get(host, DEFAULT_RATE_LIMIT)
+                bucket = self.buckets[host] = TokenBucket(rate, capacity)
+            return bucket
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(HTTP_BACKOFF_CAP, float(retry_after))
+        return random.uniform(0, min(HTTP_BACKOFF_CAP, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+    def get(self, url, params=None, headers=None, timeout=None, deadline=60.0, max_retries=None):
+        """
+        Выполняет GET с лимитом по хосту и повторами.
+
+        Args:
+            url (str): Адрес.
+            params (dict): Параметры запроса.
+            headers (dict): Дополнительные заголовки.
+            timeout (tuple): Таймауты (подключение, чтение).
+            deadline (float): Общий бюджет времени на запрос вместе с повторами, сек.
+            max_retries (int): Число повторов (по умолчанию HTTP_MAX_RETRIES).
+
+        Returns:
+            requests.Response: Ответ со статусом < 400 (например, 200 или 304).
+
+        Raises:
+            HttpError: Если запрос не удался.
+        """
+        bucket = self._bucket(urlparse(url).hostname)
+        timeout = timeout or self.timeout
+        max_retries = self.max_retries if max_retries is None else max_retries
+        deadline_at = time.monotonic() + deadline if deadline else None
+        last_error = None
+
+        for attempt in range(max_retries + 1):
+            self._count('rate_wait_seconds', bucket.acquire(deadline_at))
+            self._count('requests')
+            response = None
+            try:
+                request_timeout = timeout
+                if deadline_at is not None:
+                    remaining = deadline_at - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    request_timeout = (min(timeout[0], remaining), min(timeout[1], remaining))
+                response = self.session.get(url, params=params, headers=headers, timeout=request_timeout)
+                if response.status_code < 400:
+                    bucket.recover()
+                    return response
+                if response.status_code == 429:
+                    self._count('throttled')
+                    bucket.throttle()
+                if response.status_code not in RETRY_STATUSES:
+                    self._count('failures')
+                    raise HttpError(f"{url}: статус {response.status_code}", response.status_code)
+                last_error = HttpError(f"{url}: статус {response.status_code}", response.status_code)
+            except requests.RequestException as e:
+                last_error = HttpError(f"{url}: {e}")
+
+            if attempt == max_retries:
+                break
+            delay = self._backoff(attempt, response)
+            if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+                break
+            self._count('retries')
+            print(f"Повтор запроса через {delay:.1f} с: {last_error}")
+            time.sleep(delay)
+
+        self._count('failures')
+        raise last_error or HttpError(f"{url}: дедлайн запроса истёк")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters['rates'] = {host: round(bucket.rate, 2) for host, bucket in self.buckets.items()}
+            return counters
+
+
+# Общий клиент процесса
+HTTP = HttpClient()
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import storage
+from cache_manager import CacheManager
+from write_behind import PERSISTER
+
+INDICATOR_CACHE_DIR = os.path.join("historical_data", "indicator_cache")
+# Размер памяти (число кадров) и бюджет диска для кэша индикаторов
+INDICATOR_CACHE_MEMORY_ITEMS = int(os.environ.get("INDICATOR_CACHE_MEMORY_ITEMS", 64))
+INDICATOR_CACHE_MAX_BYTES = int(os.environ.get("INDICATOR_CACHE_MAX_BYTES", 256 * 1024 ** 2))
+
+
+def content_key(series_key, spec, data):
+    """
+    Адрес кадра индикаторов: серия, хэш набора параметров, время и значения последней свечи и число строк.
+
+    Пока в серии не появилась новая свеча и не изменилась последняя, адрес остаётся тем же.
+
+    Args:
+        series_key (str): Ключ исходной серии.
+        spec (dict): Набор индикаторов.
+        data (pd.DataFrame): Исходные свечи.
+
+    Returns:
+        str: Hex-дайджест.
+    """
+    last = data.iloc[-1]
+    source = {
+        'series': series_key,
+        'spec': spec,
+        'rows': len(data),
+        'last_date': pd.Timestamp(last['date']).isoformat(),
+        # Цены в точности хранилища: свежая загрузка и чтение с диска дают один адрес
+        'last_candle': [float(np.float32(last[col])) for col in ('open', 'high', 'low', 'close', 'volume')],
+    }
+    return hashlib.sha1(json.dumps(source, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class IndicatorCache:
+    """
+    Двухуровневый кэш рассчитанных кадров индикаторов: LRU в памяти и файлы
+    на диске (вытеснение по LRU через CacheManager).
+    """
+
+    def __init__(self, directory=INDICATOR_CACHE_DIR, memory_items=INDICATOR_CACHE_MEMORY_ITEMS,
+                 max_bytes=INDICATOR_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.memory = OrderedDict()
+        self.disk = CacheManager(directory=directory, max_bytes=max_bytes)
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+
+    def _remember(self, key, frame):
+        with self._lock:
+            self.memory[key] = frame
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        """
+        Возвращает копию кадра по адресу или None.
+        """
+        with self._lock:
+            frame = self.memory.get(key)
+            if frame is not None:
+                self.memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return frame.copy()
+
+        base_path = os.path.join(self.directory, key)
+        frame = storage.read_frame(base_path)
+        if frame is None:
+            self._count('misses')
+            self.disk.record_miss()
+            return None
+        self._count('disk_hits')
+        self.disk.record_hit()
+        self.disk.touch(storage.storage_path(base_path))
+        self._remember(key, frame)
+        return frame.copy()
+
+    def put(self, key, frame):
+        self._remember(key, frame.copy())
+        # Дисковая копия пишется в фоне: до записи кадр отдаётся из памяти
+        PERSISTER.submit(os.path.join(self.directory, key), frame, after=self.disk.maybe_evict)
+
+    def get_or_compute(self, key, compute, *args, **kwargs):
+        """
+        Возвращает кадр из кэша или рассчитывает его через compute(*args, **kwargs) и сохраняет.
+        """
+        frame = self.get(key)
+        if frame is not None:
+            return frame
+        frame = compute(*args, **kwargs)
+        if frame is not None and not frame.empty:
+            self.put(key, frame)
+        return frame
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters['memory_items'] = len(self.memory)
+        lookups = counters['memory_hits'] + counters['disk_hits'] + counters['misses']
+        counters['hit_rate'] = (counters['memory_hits'] + counters['disk_hits']) / lookups if lookups else 0.0
+        disk = self.disk.stats()
+        counters['disk_files'] = disk['files']
+        counters['disk_bytes'] = disk['bytes']
+        return counters
+
+
+# Общий кэш индикаторов процесса
+INDICATOR_CACHE = IndicatorCache()
@@ -0,0 +1,453 @@
+import copy
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import candle_store
+import storage
+from indicator_cache import INDICATOR_CACHE, content_key
+from indicators import (compute_arrays, compute_indicators, ema, prepare_ohlcv, rolling_max, rolling_mean,
+                        rolling_min, synthetic_candles, true_range, wilder_smooth, TIMEFRAME_INDICATORS)
+from moex_parser import get_historical_data
+from single_flight import KeyedLock
+
+# Сохранённое состояние индикаторов и уже рассчитанные строки по (серия, набор индикаторов)
+STATE_DIR = os.path.join("historical_data", "indicator_state")
+STATE_LOCKS = KeyedLock()
+
+
+class IndicatorStream:
+    """
+    Потоковый расчёт набора индикаторов: каждая новая свеча обрабатывается за O(1)
+    (для скользящих окон — за O(окно)) с теми же формулами, что и indicators.compute_arrays.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.count = 0
+        self.prev_close = None
+        self.prev_high = None
+        self.prev_low = None
+        self.closes = deque(maxlen=max([*spec.get('sma', ()), spec['bb'][0] if 'bb' in spec else 1]))
+        self.emas = {}
+        if 'rsi' in spec:
+            self.gains = deque(maxlen=spec['rsi'])
+            self.losses = deque(maxlen=spec['rsi'])
+        if 'macd' in spec:
+            self.macd_signal = None
+        if 'stoch' in spec:
+            k, d, smooth = spec['stoch']
+            self.highs = deque(maxlen=k)
+            self.lows = deque(maxlen=k)
+            self.stoch_k = deque(maxlen=d)
+            self.stoch_d = deque(maxlen=smooth)
+        self.obv = 0.0
+        self.cum_volume = 0.0
+        self.cum_vol_price = 0.0
+        self.vwap = 0.0
+        if 'adx' in spec:
+            self.adx_state = {'tr': 0.0, 'pos': 0.0, 'neg': 0.0, 'dx': [], 'adx': 0.0}
+
+    def _ema(self, span, value):
+        prev = self.emas.get(span)
+        alpha = 2.0 / (span + 1)
+        self.emas[span] = value if prev is None else (1.0 - alpha) * prev + alpha * value
+        return self.emas[span]
+
+    def _adx(self, high, low, close):
+        # Уайлдер, как indicators.directional_index: суммы за бары 1..w, затем сглаживание; ADX — с бара 2w-1
+        w = self.spec['adx']
+        state = self.adx_state
+        t = self.count
+        if t == 0:
+            return 0.0
+        tr = max(high, self.prev_close) - min(low, self.prev_close)
+        up = high - self.prev_high
+        down = self.prev_low - low
+        pos = up if up > down and up > 0 else 0.0
+        neg = down if down > up and down > 0 else 0.0
+        if t <= w:
+            state['tr'] += tr
+            state['pos'] += pos
+            state['neg'] += neg
+        else:
+            state['tr'] = state['tr'] - state['tr'] / w + tr
+            state['pos'] = state['pos'] - state['pos'] / w + pos
+            state['neg'] = state['neg'] - state['neg'] / w + neg
+        if t < w:
+            return 0.0
+        di_pos = 100 * state['pos'] / state['tr'] if state['tr'] != 0 else 0.0
+        di_neg = 100 * state['neg'] / state['tr'] if state['tr'] != 0 else 0.0
+        dx = 100 * abs((di_pos - di_neg) / (di_pos + di_neg)) if di_pos + di_neg != 0 else 0.0
+        if t < 2 * w - 1:
+            state['dx'].append(dx)
+            return 0.0
+        if t == 2 * w - 1:
+            state['dx'].append(dx)
+            state['adx'] = float(np.mean(state['dx']))
+            state['dx'] = []
+        else:
+            state['adx'] = (state['adx'] * (w - 1) + dx) / w
+        return state['adx']
+
+    def step(self, high, low, close, volume):
+        """
+        Обрабатывает одну свечу.
+
+        Returns:
+            dict: Значения индикаторов на этой свече.
+        """
+        spec = self.spec
+        row = {}
+        self.closes.append(close)
+        delta = 0.0 if self.prev_close is None else close - self.prev_close
+
+        for period in spec.get('sma', ()):
+            window = list(self.closes)[-period:]
+            row[f'SMA_{period}'] = math.fsum(window) / len(window)
+        for period in spec.get('ema', ()):
+            row[f'EMA_{period}'] = self._ema(period, close)
+
+        if 'rsi' in spec:
+            period = spec['rsi']
+            self.gains.append(max(delta, 0.0))
+            self.losses.append(max(-delta, 0.0))
+            avg_gain = math.fsum(self.gains) / len(self.gains)
+            avg_loss = math.fsum(self.losses) / len(self.losses)
+            if avg_loss == 0:
+                row[f'RSI_{period}'] = 100.0 if avg_gain > 0 else 50.0
+            else:
+                row[f'RSI_{period}'] = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+        if 'bb' in spec:
+            period, width = spec['bb']
+            window = list(self.closes)[-period:]
+            middle = math.fsum(window) / len(window)
+            std = math.sqrt(math.fsum((v - middle) ** 2 for v in window) / (len(window) - 1)) \
+                if len(window) > 1 else math.nan
+            row['BB_middle'] = middle
+            row['BB_upper'] = middle + width * std
+            row['BB_lower'] = middle - width * std
+
+        if 'macd' in spec:
+            fast, slow, signal = spec['macd']
+            macd = self._ema(fast, close) - self._ema(slow, close)
+            alpha = 2.0 / (signal + 1)
+            self.macd_signal = macd if self.macd_signal is None else (1.0 - alpha) * self.macd_signal + alpha * macd
+            row['MACD'] = macd
+            row['MACD_signal'] = self.macd_signal
+            row['MACD_histogram'] = macd - self.macd_signal
+
+        if 'stoch' in spec:
+            self.highs.append(high)
+            self.lows.append(low)
+            low_n, high_n = min(self.lows), max(self.highs)
+            stoch_k = 100.0 * (close - low_n) / (high_n - low_n) if high_n > low_n else 50.0
+            self.stoch_k.append(stoch_k)
+            self.stoch_d.append(math.fsum(self.stoch_k) / len(self.stoch_k))
+            row['Stoch_K'] = stoch_k
+            row['Stoch_D'] = self.stoch_d[-1]
+            row['Stoch_Slow'] = math.fsum(self.stoch_d) / len(self.stoch_d)
+
+        if spec.get('obv'):
+            self.obv += math.copysign(volume, delta) if delta != 0 else 0.0
+            row['OBV'] = self.obv
+
+        if spec.get('vwap'):
+            self.cum_volume += volume
+            self.cum_vol_price += close * volume
+            if self.cum_volume > 0:
+                self.vwap = self.cum_vol_price / self.cum_volume
+            row['VWAP'] = self.vwap
+
+        if 'adx' in spec:
+            row[f"ADX_{spec['adx']}"] = self._adx(high, low, close)
+
+        self.prev_close, self.prev_high, self.prev_low = close, high, low
+        self.count += 1
+        return row
+
+    def run(self, high, low, close, volume):
+        """
+        Обрабатывает массивы свечей подряд.
+
+        Returns:
+            pd.DataFrame: Значения индикаторов (float32) по каждой свече.
+        """
+        rows = [self.step(h, l, c, v) for h, l, c, v in zip(high, low, close, volume)]
+        return pd.DataFrame(rows).astype(np.float32)
+
+    @classmethod
+    def from_arrays(cls, spec, high, low, close, volume):
+        """
+        Состояние после обработки всех свечей массивов — то же, что после run по ним,
+        но рассчитанное векторными ядрами indicators без цикла по барам.
+        """
+        stream = cls(spec)
+        n = len(close)
+        if n == 0:
+            return stream
+        high, low, close, volume = (np.asarray(v, dtype=np.float64) for v in (high, low, close, volume))
+        delta = np.zeros_like(close)
+        delta[1:] = close[1:] - close[:-1]
+        stream.count = n
+        stream.prev_close, stream.prev_high, stream.prev_low = float(close[-1]), float(high[-1]), float(low[-1])
+        stream.closes.extend(close[-stream.closes.maxlen:].tolist())
+
+        spans = list(spec.get('ema', ())) + (list(spec['macd'][:2]) if 'macd' in spec else [])
+        emas = {span: ema(close, span) for span in dict.fromkeys(spans)}
+        stream.emas = {span: float(values[-1]) for span, values in emas.items()}
+
+        if 'rsi' in spec:
+            stream.gains.extend(np.maximum(delta, 0.0)[-spec['rsi']:].tolist())
+            stream.losses.extend(np.maximum(-delta, 0.0)[-spec['rsi']:].tolist())
+
+        if 'macd' in spec:
+            fast, slow, signal = spec['macd']
+            stream.macd_signal = float(ema(emas[fast] - emas[slow], signal)[-1])
+
+        if 'stoch' in spec:
+            k, d, smooth = spec['stoch']
+            low_n, high_n = rolling_min(low, k), rolling_max(high, k)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                stoch_k = np.where(high_n > low_n, 100.0 * (close - low_n) / (high_n - low_n), 50.0)
+            stream.highs.extend(high[-k:].tolist())
+            stream.lows.extend(low[-k:].tolist())
+            stream.stoch_k.extend(stoch_k[-d:].tolist())
+            stream.stoch_d.extend(rolling_mean(stoch_k, d)[-smooth:].tolist())
+
+        if spec.get('obv'):
+            stream.obv = float(np.sum(np.sign(delta) * volume))
+
+        if spec.get('vwap'):
+            stream.cum_volume = float(volume.sum())
+            stream.cum_vol_price = float((close * volume).sum())
+            if stream.cum_volume > 0:
+                stream.vwap = stream.cum_vol_price / stream.cum_volume
+
+        if 'adx' in spec:
+            stream.adx_state = _adx_state(spec['adx'], high, low, close)
+        return stream
+
+    def to_dict(self):
+        state = {name: list(value) if isinstance(value, deque) else value
+                 for name, value in self.__dict__.items() if name != 'spec'}
+        state['emas'] = {str(span): value for span, value in self.emas.items()}
+        return state
+
+    @classmethod
+    def from_dict(cls, spec, state):
+        stream = cls(spec)
+        for name, value in state.items():
+            current = getattr(stream, name, None)
+            if isinstance(current, deque):
+                current.extend(value)
+            elif name == 'emas':
+                stream.emas = {int(span): v for span, v in value.items()}
+            else:
+                setattr(stream, name, value)
+        return stream
+
+
+def _adx_state(w, high, low, close):
+    # Суммы Уайлдера (tr, +DM, −DM) после последнего бара: w * RMA; DX копятся до бара 2w-1, затем ADX
+    state = {'tr': 0.0, 'pos': 0.0, 'neg': 0.0, 'dx': [], 'adx': 0.0}
+    last = len(close) - 1
+    if last < 1:
+        return state
+    tr = true_range(high, low, close)[1:]
+    up = high[1:] - high[:-1]
+    down = low[:-1] - low[1:]
+    pos = np.where((up > down) & (up > 0), up, 0.0)
+    neg = np.where((down > up) & (down > 0), down, 0.0)
+    if last < w:
+        state['tr'], state['pos'], state['neg'] = float(tr.sum()), float(pos.sum()), float(neg.sum())
+        return state
+    tr_sum, pos_sum, neg_sum = (w * wilder_smooth(v, w) for v in (tr, pos, neg))
+    state['tr'], state['pos'], state['neg'] = float(tr_sum[-1]), float(pos_sum[-1]), float(neg_sum[-1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        di_pos = np.where(tr_sum != 0, 100 * pos_sum / tr_sum, 0.0)
+        di_neg = np.where(tr_sum != 0, 100 * neg_sum / tr_sum, 0.0)
+        di_sum = di_pos + di_neg
+        dx = np.where(di_sum != 0, 100 * np.abs(di_pos - di_neg) / di_sum, 0.0)
+    if last < 2 * w - 1:
+        state['dx'] = dx.tolist()
+    else:
+        state['adx'] = float(wilder_smooth(dx, w)[-1])
+    return state
+
+
+def spec_hash(spec):
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()[:10]
+
+
+def _state_paths(key):
+    base_path = os.path.join(STATE_DIR, key)
+    return base_path, base_path + ".json"
+
+
+def _load_state(key):
+    base_path, meta_path = _state_paths(key)
+    if not os.path.exists(meta_path) or not storage.frame_exists(base_path):
+        return None, None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка чтения состояния индикаторов '{meta_path}': {e}")
+        return None, None
+    rows = storage.read_frame(base_path)
+    if rows is None or len(rows) != meta['stream']['count']:
+        return None, None
+    return meta, rows
+
+
+def _save_state(key, meta, rows):
+    base_path, meta_path = _state_paths(key)
+    storage.write_frame(base_path, rows)
+    tmp_path = f"{meta_path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+
+
+def update_indicators(key, data, spec):
+    """
+    Рассчитывает индикаторы для серии, продвигая сохранённое состояние только по новым свечам.
+
+    Состояние фиксируется по предпоследнюю свечу: последняя (возможно, незакрытая)
+    пересчитывается при каждом вызове из копии состояния. Если начало серии или
+    последняя зафиксированная свеча изменились, состояние строится заново.
+
+    Args:
+        key (str): Ключ серии (например, candle_store.series_key + якорь).
+        data (pd.DataFrame): Свечи с колонками candle_store.CANDLE_COLUMNS, отсортированные по дате.
+        spec (dict): Набор индикаторов.
+
+    Returns:
+        pd.DataFrame: Свечи с добавленными индикаторами.
+    """
+    # Типы как в хранилище: свежая загрузка и чтение с диска дают одинаковые значения
+    data = storage.apply_dtypes(prepare_ohlcv(data)).reset_index(drop=True)
+    dates = pd.to_datetime(data['date'])
+    key = f"{key}_{spec_hash(spec)}"
+
+    with STATE_LOCKS.get(key):
+        meta, rows = _load_state(key)
+        committed = meta['stream']['count'] if meta else 0
+        if meta is not None and not (
+                0 < committed < len(data)
+                and meta['first_date'] == dates.iloc[0].isoformat()
+                and meta['last_date'] == dates.iloc[committed - 1].isoformat()
+                and np.isclose(meta['last_close'], data['close'].iloc[committed - 1])):
+            print(f"Состояние индикаторов {key} не совпадает с серией, полный пересчёт")
+            meta, rows, committed = None, None, 0
+
+        columns = [data[col].to_numpy(np.float64) for col in ('high', 'low', 'close', 'volume')]
+        if meta is not None:
+            stream = IndicatorStream.from_dict(spec, meta['stream'])
+            new_rows = stream.run(*(values[committed:len(data) - 1] for values in columns))
+        else:
+            # Первое построение и смена якоря — векторным движком; поток только продолжает состояние
+            head = [values[:len(data) - 1] for values in columns]
+            stream = IndicatorStream.from_arrays(spec, *head)
+            new_rows = pd.DataFrame(compute_arrays(*head, spec)) if len(data) > 1 else pd.DataFrame()
+        if len(new_rows):
+            rows = new_rows if rows is None else pd.concat([rows, new_rows], ignore_index=True)
+            last = len(data) - 2
+            meta = {'first_date': dates.iloc[0].isoformat(), 'last_date': dates.iloc[last].isoformat(),
+                    'last_close': float(data['close'].iloc[last]), 'stream': stream.to_dict()}
+            _save_state(key, meta, rows)
+            print(f"Индикаторы {key}: обработано новых свечей {len(new_rows)}")
+
+        provisional = copy.deepcopy(stream).run(*(values[-1:] for values in columns))
+        indicators = pd.concat([rows, provisional], ignore_index=True) if rows is not None else provisional
+    return pd.concat([data, indicators], axis=1)
+
+
+def load_indicator_data(ticker, timeframe, period_years, spec, market="shares", board="TQBR"):
+    """
+    Возвращает свечи за period_years лет с индикаторами, рассчитанными инкрементально.
+
+    Индикаторы считаются от якоря — 1 января года начала окна, поэтому состояние
+    остаётся действительным, пока окно сдвигается внутри года (полный пересчёт — раз в год).
+    Готовый кадр кэшируется в indicator_cache по содержимому исходной серии.
+
+    Returns:
+        pd.DataFrame: Данные с индикаторами или None при ошибке.
+    """
+    now = datetime.now()
+    anchor = datetime(now.year - period_years, 1, 1)
+    # Загружается только история от якоря, а не лишний год целиком
+    data = get_historical_data(ticker, timeframe, period_years, market, board, start_date=anchor)
+    if data is None or data.empty:
+        print(f"Ошибка: данные для {ticker} ({timeframe}, {period_years} лет) не получены из moex_parser")
+        return None
+    key = f"{candle_store.series_key(ticker, timeframe, market, board)}_{anchor.year}"
+    # Повторный запрос при неизменной последней свече обходится без расчёта индикаторов
+    data = INDICATOR_CACHE.get_or_compute(content_key(key, spec, data), update_indicators, key, data, spec)
+    return candle_store.slice_period(data, now - timedelta(days=period_years * 365))
+
+
+def check_stream_parity(data=None, spec=None, tail=20, rtol=1e-4):
+    """
+    Сверяет расчёт как в update_indicators (история без последних tail свечей векторным движком
+    с состоянием from_arrays, затем по одной свече потоком) с полным пересчётом indicators.compute_indicators.
+
+    Returns:
+        pd.DataFrame: Максимальное относительное расхождение и число несовпадений по каждому столбцу.
+    """
+    data = prepare_ohlcv(synthetic_candles(2600) if data is None else data)
+    spec = spec or TIMEFRAME_INDICATORS['default']
+    columns = [data[col].to_numpy(np.float64) for col in ('high', 'low', 'close', 'volume')]
+    head_columns = [values[:-tail] for values in columns]
+    head = pd.DataFrame(compute_arrays(*head_columns, spec))
+    stream = IndicatorStream.from_arrays(spec, *head_columns)
+    stream = IndicatorStream.from_dict(spec, json.loads(json.dumps(stream.to_dict())))
+    streamed = pd.concat([head, stream.run(*(values[-tail:] for values in columns))], ignore_index=True)
+    full = compute_indicators(data, spec)
+    rows = []
+    for col in full.columns:
+        a = streamed[col].to_numpy(np.float64)
+        b = full[col].to_numpy(np.float64)
+        valid = np.isfinite(b)
+        diff = np.abs(a[valid] - b[valid])
+        scale = np.maximum(np.abs(b[valid]), 1.0)
+        rows.append({'column': col, 'max_rel_diff': float((diff / scale).max()) if valid.any() else 0.0,
+                     'mismatches': int((diff > rtol * scale).sum())})
+    result = pd.DataFrame(rows)
+    print(f"Сверка потокового расчёта: столбцов {len(result)}, с расхождениями {(result['mismatches'] > 0).sum()}")
+    return result
+
+
+def benchmark_update(rows=2600, spec=None):
+    """
+    Замеряет полный расчёт и обновление состояния после добавления одной свечи.
+    """
+    spec = spec or TIMEFRAME_INDICATORS['default']
+    data = synthetic_candles(rows + 1)
+    key = f"BENCH_{rows}"
+    started = time.perf_counter()
+    update_indicators(key, data.iloc[:-1], spec)
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    update_indicators(key, data, spec)
+    warm = time.perf_counter() - started
+    for path in _state_paths(f"{key}_{spec_hash(spec)}"):
+        for candidate in (path, storage.storage_path(path)):
+            if os.path.exists(candidate):
+                os.remove(candidate)
+    print(f"Индикаторы ({rows} свечей): полный расчёт {cold:.3f} с, одна новая свеча {warm:.3f} с")
+    return {'cold': cold, 'warm': warm}
+
+
+if __name__ == "__main__":
+    print(check_stream_parity())
+    print(check_stream_parity(spec=TIMEFRAME_INDICATORS['weekly']))
+    benchmark_update()
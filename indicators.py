@@ -0,0 +1,540 @@
+import time
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Наборы индикаторов: ключ — индикатор, значение — параметры.
+#   sma/ema: периоды; rsi: период; macd: (fast, slow, signal); bb: (период, число σ);
+#   stoch: (k, d, smooth); adx: период; obv/vwap: True.
+FORECAST_INDICATORS = {'sma': (20, 50), 'rsi': 14, 'macd': (12, 26, 9), 'vwap': True, 'adx': 14}
+
+TIMEFRAME_INDICATORS = {
+    'default': {
+        'sma': (20, 50), 'ema': (20, 50), 'rsi': 14, 'bb': (20, 2), 'macd': (12, 26, 9),
+        'stoch': (14, 3, 3), 'obv': True, 'vwap': True, 'adx': 14
+    },
+    'weekly': {
+        'sma': (50, 100, 200), 'ema': (50, 100, 200), 'rsi': 21, 'bb': (20, 2), 'macd': (24, 52, 9),
+        'stoch': (21, 5, 5), 'obv': True, 'vwap': True, 'adx': 20
+    },
+}
+
+# Блочная EMA: внутри блока множитель decay**-k не превышает e**EMA_BLOCK_LOG_RANGE,
+# чтобы сумма в замкнутой форме не теряла точность
+EMA_BLOCK_LOG_RANGE = np.log(1e6)
+
+
+def timeframe_indicators(timeframe):
+    """
+    Возвращает набор индикаторов для сохранения истории с индикаторами по таймфрейму.
+    """
+    return TIMEFRAME_INDICATORS.get(timeframe.lower(), TIMEFRAME_INDICATORS['default'])
+
+
+def prepare_ohlcv(data):
+    """
+    Дополняет отсутствующие столбцы OHLCV и заполняет пропуски.
+
+    Args:
+        data (pd.DataFrame): Данные с колонкой 'close' и, по возможности, 'open', 'high', 'low', 'volume'.
+
+    Returns:
+        pd.DataFrame: Копия данных с полным набором столбцов.
+    """
+    data = data.copy()
+    required_columns = ['open', 'high', 'low', 'close', 'volume']
+    missing_columns = [col for col in required_columns if col not in data.columns]
+    if missing_columns:
+        print(f"Предупреждение: отсутствуют столбцы {missing_columns}, аппроксимация")
+        for col in missing_columns:
+            if col in ['high', 'low']:
+                volatility = data['close'].pct_change().std() * np.sqrt(20) if not data['close'].empty else 0.05
+                data['high'] = data['close'] * (1 + volatility)
+                data['low'] = data['close'] * (1 - volatility)
+            elif col == 'open':
+                data['open'] = data['close']
+            elif col == 'volume':
+                data['volume'] = 0
+
+    if data[['high', 'low', 'close']].isna().any().any():
+        print("Предупреждение: найдены пропуски в high, low или close, заполняются последним значением")
+        data[['high', 'low', 'close']] = data[['high', 'low', 'close']].ffill().bfill()
+    if data['volume'].isna().any():
+        print("Предупреждение: найдены пропуски в volume, заполняются нулями")
+        data['volume'] = data['volume'].fillna(0)
+    return data
+
+
+def _column_shape(values, x):
+    # Вектор по времени, приведённый к размерности x (для панелей время × тикеры)
+    return values.reshape((-1,) + (1,) * (x.ndim - 1))
+
+
+def exp_smooth(x, alpha):
+    """
+    Экспоненциальное сглаживание y_t = (1 - alpha) * y_{t-1} + alpha * x_t с y_0 = x_0 по оси 0.
+
+    Считается блоками в замкнутой форме через cumsum, без цикла по барам.
+
+    Args:
+        x (np.ndarray): Значения без NaN, ось 0 — время.
+        alpha (float): Вес нового значения (0 < alpha <= 1).
+
+    Returns:
+        np.ndarray: Сглаженные значения той же формы (float64).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    decay = 1.0 - alpha
+    if len(x) == 0 or decay == 0:
+        return x.copy()
+    block = max(1, int(EMA_BLOCK_LOG_RANGE / -np.log(decay)))
+    powers = decay ** np.arange(1, block + 1)
+    out = np.empty_like(x)
+    out[0] = x[0]
+    prev = x[0]
+    for start in range(1, len(x), block):
+        chunk = x[start:start + block]
+        p = _column_shape(powers[:len(chunk)], x)
+        # y_t = decay^t * (y_0 + alpha * sum_{k<=t} x_k * decay^-k)
+        out[start:start + len(chunk)] = p * (prev + alpha * np.cumsum(chunk / p, axis=0))
+        prev = out[start + len(chunk) - 1]
+    return out
+
+
+def ema(x, span):
+    """
+    Экспоненциальная средняя (как pandas ewm(span, adjust=False)) по оси 0.
+    """
+    return exp_smooth(x, 2.0 / (span + 1))
+
+
+def wilder_smooth(x, period):
+    """
+    Сглаживание Уайлдера (RMA): первое значение — среднее первых period значений x,
+    далее r_t = r_{t-1} + (x_t - r_{t-1}) / period.
+
+    Returns:
+        np.ndarray: Значения начиная с бара period-1 (длина len(x) - period + 1).
+    """
+    seeded = np.concatenate([x[:period].mean(axis=0, keepdims=True), x[period:]])
+    return exp_smooth(seeded, 1.0 / period)
+
+
+def rolling_mean(x, window):
+    """
+    Скользящее среднее с min_periods=1 по оси 0 (первые window-1 значений — по неполному окну).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    cumsum = np.cumsum(x, axis=0)
+    sums = cumsum.copy()
+    sums[window:] = cumsum[window:] - cumsum[:-window]
+    counts = np.minimum(np.arange(1, len(x) + 1), window)
+    return sums / _column_shape(counts, x)
+
+
+def rolling_std(x, window):
+    """
+    Скользящее стандартное отклонение (ddof=1, min_periods=1); для окна из одного значения — NaN.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    centered = x - x[:1]  # сдвиг к первому значению уменьшает потерю точности в сумме квадратов
+    counts = _column_shape(np.minimum(np.arange(1, len(x) + 1), window).astype(np.float64), x)
+    mean = rolling_mean(centered, window)
+    mean_sq = rolling_mean(centered * centered, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = (mean_sq - mean * mean) * counts / (counts - 1)
+    var = np.where(counts > 1, np.maximum(var, 0.0), np.nan)
+    return np.sqrt(var)
+
+
+def rolling_min(x, window):
+    padded = np.concatenate([np.full((window - 1,) + x.shape[1:], np.inf), x])
+    return sliding_window_view(padded, window, axis=0).min(axis=-1)
+
+
+def rolling_max(x, window):
+    padded = np.concatenate([np.full((window - 1,) + x.shape[1:], -np.inf), x])
+    return sliding_window_view(padded, window, axis=0).max(axis=-1)
+
+
+def _rsi(gain, loss, period):
+    avg_gain = rolling_mean(gain, period)
+    avg_loss = rolling_mean(loss, period)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    # Без падений RSI = 100, без движения цены — нейтральные 50
+    rsi = np.where(avg_loss == 0, np.where(avg_gain > 0, 100.0, 50.0), rsi)
+    return rsi
+
+
+def true_range(high, low, close):
+    """
+    Истинный диапазон; для первого бара — high - low.
+    """
+    high, low, close = (np.asarray(v, dtype=np.float64) for v in (high, low, close))
+    tr = high - low
+    prev_close = close[:-1]
+    tr[1:] = np.maximum(high[1:], prev_close) - np.minimum(low[1:], prev_close)
+    return tr
+
+
+def atr(high, low, close, period):
+    """
+    Средний истинный диапазон Уайлдера (как ta.volatility.AverageTrueRange): 0 до бара period-1.
+    """
+    tr = true_range(high, low, close)
+    out = np.zeros_like(tr)
+    if len(tr) >= period:
+        out[period - 1:] = wilder_smooth(tr, period)
+    return out
+
+
+def directional_index(high, low, close, period):
+    """
+    +DI, −DI и ADX Уайлдера (как ta.trend.ADXIndicator).
+
+    Сглаженные суммы начинаются со средних за бары 1..period, поэтому DI определены
+    с бара period, ADX — с бара 2 * period - 1; раньше значения равны 0.
+
+    Returns:
+        tuple: (di_pos, di_neg, adx) — массивы формы close.
+    """
+    high, low, close = (np.asarray(v, dtype=np.float64) for v in (high, low, close))
+    di_pos, di_neg, adx = np.zeros_like(close), np.zeros_like(close), np.zeros_like(close)
+    if len(close) <= period:
+        return di_pos, di_neg, adx
+
+    tr = true_range(high, low, close)[1:]
+    up = high[1:] - high[:-1]
+    down = low[:-1] - low[1:]
+    pos = np.where((up > down) & (up > 0), up, 0.0)
+    neg = np.where((down > up) & (down > 0), down, 0.0)
+    tr_smooth, pos_smooth, neg_smooth = (wilder_smooth(v, period) for v in (tr, pos, neg))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        di_pos[period:] = np.where(tr_smooth != 0, 100 * pos_smooth / tr_smooth, 0.0)
+        di_neg[period:] = np.where(tr_smooth != 0, 100 * neg_smooth / tr_smooth, 0.0)
+        di_sum = di_pos[period:] + di_neg[period:]
+        dx = np.where(di_sum != 0, 100 * np.abs(di_pos[period:] - di_neg[period:]) / di_sum, 0.0)
+    if len(dx) >= period:
+        adx[2 * period - 1:] = wilder_smooth(dx, period)
+    return di_pos, di_neg, adx
+
+
+def wilder_rsi(close, period):
+    """
+    RSI Уайлдера (как ta.momentum.RSIIndicator): NaN на первых period-1 барах, 100 при нулевых падениях.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    delta = np.zeros_like(close)
+    delta[1:] = close[1:] - close[:-1]
+    avg_up = exp_smooth(np.maximum(delta, 0.0), 1.0 / period)
+    avg_down = exp_smooth(np.maximum(-delta, 0.0), 1.0 / period)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rsi = np.where(avg_down == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_up / avg_down))
+    rsi[:period - 1] = np.nan
+    return rsi
+
+
+def compute_arrays(high, low, close, volume, spec):
+    """
+    Рассчитывает набор индикаторов по массивам OHLCV.
+
+    Общие промежуточные величины (изменение цены, EMA и SMA одинаковых периодов,
+    накопленные суммы) считаются один раз на весь набор.
+
+    Args:
+        high, low, close, volume (np.ndarray): Массивы без пропусков, ось 0 — время.
+        spec (dict): Набор индикаторов (см. TIMEFRAME_INDICATORS).
+
+    Returns:
+        dict: Имя столбца -> np.ndarray float32.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    volume = np.asarray(volume, dtype=np.float64)
+    result = {}
+    emas = {}
+    smas = {}
+
+    def cached_ema(span):
+        if span not in emas:
+            emas[span] = ema(close, span)
+        return emas[span]
+
+    def cached_sma(period):
+        if period not in smas:
+            smas[period] = rolling_mean(close, period)
+        return smas[period]
+
+    for period in spec.get('sma', ()):
+        result[f'SMA_{period}'] = cached_sma(period)
+    for period in spec.get('ema', ()):
+        result[f'EMA_{period}'] = cached_ema(period)
+
+    delta = None
+    if 'rsi' in spec or spec.get('obv'):
+        delta = np.zeros_like(close)
+        delta[1:] = close[1:] - close[:-1]
+
+    if 'rsi' in spec:
+        period = spec['rsi']
+        result[f'RSI_{period}'] = _rsi(np.maximum(delta, 0.0), np.maximum(-delta, 0.0), period)
+
+    if 'bb' in spec:
+        period, width = spec['bb']
+        middle = cached_sma(period)
+        std = rolling_std(close, period)
+        result['BB_middle'] = middle
+        result['BB_upper'] = middle + width * std
+        result['BB_lower'] = middle - width * std
+
+    if 'macd' in spec:
+        fast, slow, signal = spec['macd']
+        macd = cached_ema(fast) - cached_ema(slow)
+        macd_signal = ema(macd, signal)
+        result['MACD'] = macd
+        result['MACD_signal'] = macd_signal
+        result['MACD_histogram'] = macd - macd_signal
+
+    if 'stoch' in spec:
+        k, d, smooth = spec['stoch']
+        low_n = rolling_min(np.asarray(low, dtype=np.float64), k)
+        high_n = rolling_max(np.asarray(high, dtype=np.float64), k)
+        price_range = high_n - low_n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stoch_k = np.where(price_range > 0, 100.0 * (close - low_n) / price_range, 50.0)
+        stoch_d = rolling_mean(stoch_k, d)
+        result['Stoch_K'] = stoch_k
+        result['Stoch_D'] = stoch_d
+        result['Stoch_Slow'] = rolling_mean(stoch_d, smooth)
+
+    if spec.get('obv'):
+        result['OBV'] = np.cumsum(np.sign(delta) * volume, axis=0)
+
+    if spec.get('vwap'):
+        cum_volume = np.cumsum(volume, axis=0)
+        cum_vol_price = np.cumsum(close * volume, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            vwap = np.where(cum_volume > 0, cum_vol_price / cum_volume, np.nan)
+        # До первой сделки VWAP = 0, при нулевом объёме держится последнее значение
+        result['VWAP'] = pd.DataFrame(vwap).ffill().fillna(0).to_numpy().reshape(vwap.shape)
+
+    if 'adx' in spec:
+        period = spec['adx']
+        result[f'ADX_{period}'] = directional_index(high, low, close, period)[2]
+
+    return {name: values.astype(np.float32) for name, values in result.items()}
+
+
+def compute_indicators(data, spec=FORECAST_INDICATORS):
+    """
+    Рассчитывает индикаторы для серии свечей.
+
+    Args:
+        data (pd.DataFrame): Подготовленные данные (см. prepare_ohlcv).
+        spec (dict): Набор индикаторов.
+
+    Returns:
+        pd.DataFrame: Столбцы индикаторов (float32) с индексом data.
+    """
+    arrays = compute_arrays(data['high'].to_numpy(np.float64), data['low'].to_numpy(np.float64),
+                            data['close'].to_numpy(np.float64), data['volume'].to_numpy(np.float64), spec)
+    # Один непрерывный блок float32 вместо отдельного массива на столбец
+    return pd.DataFrame(np.column_stack(list(arrays.values())), columns=list(arrays), index=data.index)
+
+
+def _reference_indicators(data, spec):
+    # Прежний расчёт на pandas и ta (из data_processing), эталон для сверки
+    from ta.trend import ADXIndicator
+
+    close, volume = data['close'], data['volume']
+    result = {}
+    for period in spec.get('sma', ()):
+        result[f'SMA_{period}'] = close.rolling(window=period, min_periods=1).mean()
+    for period in spec.get('ema', ()):
+        result[f'EMA_{period}'] = close.ewm(span=period, adjust=False).mean()
+    if 'rsi' in spec:
+        period = spec['rsi']
+        delta = close.diff()
+        gain = delta.where(delta > 0, 0).rolling(window=period, min_periods=1).mean()
+        loss = (-delta.where(delta < 0, 0)).rolling(window=period, min_periods=1).mean()
+        result[f'RSI_{period}'] = (100 - (100 / (1 + gain / loss))).where(loss > 0)
+    if 'bb' in spec:
+        period, width = spec['bb']
+        middle = close.rolling(window=period, min_periods=1).mean()
+        std = close.rolling(window=period, min_periods=1).std()
+        result['BB_middle'] = middle
+        result['BB_upper'] = middle + width * std
+        result['BB_lower'] = middle - width * std
+    if 'macd' in spec:
+        fast, slow, signal = spec['macd']
+        macd = close.ewm(span=fast, adjust=False).mean() - close.ewm(span=slow, adjust=False).mean()
+        result['MACD'] = macd
+        result['MACD_signal'] = macd.ewm(span=signal, adjust=False).mean()
+        result['MACD_histogram'] = macd - result['MACD_signal']
+    if 'stoch' in spec:
+        k, d, smooth = spec['stoch']
+        low_n = data['low'].rolling(window=k, min_periods=1).min()
+        high_n = data['high'].rolling(window=k, min_periods=1).max()
+        stoch_k = 100 * (close - low_n) / (high_n - low_n)
+        result['Stoch_K'] = stoch_k
+        result['Stoch_D'] = stoch_k.rolling(window=d, min_periods=1).mean()
+        result['Stoch_Slow'] = result['Stoch_D'].rolling(window=smooth, min_periods=1).mean()
+    if spec.get('obv'):
+        result['OBV'] = pd.Series(np.where(close > close.shift(1), volume,
+                                           np.where(close < close.shift(1), -volume, 0)).cumsum(), index=data.index)
+    if spec.get('vwap'):
+        result['VWAP'] = ((close * volume).cumsum() / volume.cumsum().replace(0, np.nan)).ffill().fillna(0)
+    if 'adx' in spec:
+        period = spec['adx']
+        result[f'ADX_{period}'] = ADXIndicator(high=data['high'], low=data['low'], close=close, window=period,
+                                               fillna=True).adx()
+    return pd.DataFrame(result, index=data.index)
+
+
+def synthetic_candles(rows, seed=0):
+    """
+    Генерирует случайное блуждание OHLCV для сверки и замеров.
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, rows)))
+    spread = close * rng.uniform(0, 0.02, rows)
+    return pd.DataFrame({
+        'date': pd.bdate_range('2015-01-01', periods=rows),
+        'open': np.roll(close, 1),
+        'high': close + spread,
+        'low': close - spread,
+        'close': close,
+        'volume': rng.integers(0, 1_000_000, rows),
+    })
+
+
+def check_parity(data=None, spec=None, rtol=1e-4):
+    """
+    Сверяет движок с прежним расчётом на pandas.
+
+    Строки, где прежний расчёт давал NaN/inf (RSI без падений цены, стохастик
+    при нулевом диапазоне), не сравниваются: там движок возвращает 100/50.
+
+    Returns:
+        pd.DataFrame: Максимальное относительное расхождение и число несовпадений по каждому столбцу.
+    """
+    data = prepare_ohlcv(synthetic_candles(2600) if data is None else data)
+    spec = spec or TIMEFRAME_INDICATORS['default']
+    fast = compute_indicators(data, spec)
+    reference = _reference_indicators(data, spec)
+    rows = []
+    for col in reference.columns:
+        a = fast[col].to_numpy(np.float64)
+        b = reference[col].to_numpy(np.float64)
+        valid = np.isfinite(b)
+        diff = np.abs(a[valid] - b[valid])
+        scale = np.maximum(np.abs(b[valid]), 1.0)
+        rows.append({'column': col, 'max_rel_diff': float((diff / scale).max()) if valid.any() else 0.0,
+                     'mismatches': int((diff > rtol * scale).sum())})
+    result = pd.DataFrame(rows)
+    print(f"Сверка индикаторов: столбцов {len(result)}, с расхождениями {(result['mismatches'] > 0).sum()}")
+    return result
+
+
+def benchmark(tickers=260, years=10, spec=None):
+    """
+    Сравнивает время расчёта движком и прежним кодом на pandas (дневные свечи, tickers × years).
+
+    Returns:
+        dict: Время в секундах для обоих вариантов.
+    """
+    spec = spec or TIMEFRAME_INDICATORS['default']
+    series = [prepare_ohlcv(synthetic_candles(years * 260, seed)) for seed in range(tickers)]
+    started = time.perf_counter()
+    for data in series:
+        _reference_indicators(data, spec)
+    pandas_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for data in series:
+        compute_indicators(data, spec)
+    engine_seconds = time.perf_counter() - started
+    print(f"Индикаторы для {tickers} тикеров × {years} лет: pandas {pandas_seconds:.2f} с, "
+          f"движок {engine_seconds:.2f} с")
+    return {'pandas': pandas_seconds, 'engine': engine_seconds}
+
+
+def _ta_wilder(data, period):
+    from ta.momentum import RSIIndicator
+    from ta.trend import ADXIndicator
+    from ta.volatility import AverageTrueRange
+
+    adx_indicator = ADXIndicator(high=data['high'], low=data['low'], close=data['close'], window=period)
+    return {
+        'ATR': AverageTrueRange(high=data['high'], low=data['low'], close=data['close'],
+                                window=period).average_true_range(),
+        'DI_pos': adx_indicator.adx_pos(),
+        'DI_neg': adx_indicator.adx_neg(),
+        'ADX': adx_indicator.adx(),
+        'RSI': RSIIndicator(close=data['close'], window=period).rsi(),
+    }
+
+
+def _wilder(data, period):
+    high, low, close = (data[col].to_numpy(np.float64) for col in ('high', 'low', 'close'))
+    di_pos, di_neg, adx = directional_index(high, low, close, period)
+    return {'ATR': atr(high, low, close, period), 'DI_pos': di_pos, 'DI_neg': di_neg, 'ADX': adx,
+            'RSI': wilder_rsi(close, period)}
+
+
+def check_wilder_parity(data=None, period=14, rtol=1e-9):
+    """
+    Сверяет ядра Уайлдера с пакетом ta.
+
+    Допуск — rtol относительно max(|значение ta|, 1). Единственное известное отличие:
+    ta оставляет +DI/−DI на баре period равными 0, ядро считает их по определению;
+    этот бар не сравнивается.
+
+    Returns:
+        pd.DataFrame: Максимальное относительное расхождение и число несовпадений по каждому показателю.
+    """
+    data = synthetic_candles(10 * 252 * 14) if data is None else data
+    ours = _wilder(data, period)
+    reference = _ta_wilder(data, period)
+    rows = []
+    for name, values in ours.items():
+        a, b = values.copy(), reference[name].to_numpy(np.float64)
+        if name in ('DI_pos', 'DI_neg'):
+            a[period] = b[period]
+        valid = np.isfinite(b)
+        same_nan = np.array_equal(np.isnan(a), np.isnan(b))
+        diff = np.abs(a[valid] - b[valid])
+        scale = np.maximum(np.abs(b[valid]), 1.0)
+        rows.append({'indicator': name, 'max_rel_diff': float((diff / scale).max()),
+                     'mismatches': int((diff > rtol * scale).sum()) + (0 if same_nan else 1)})
+    result = pd.DataFrame(rows)
+    print(f"Сверка ядер Уайлдера с ta (rtol={rtol}): с расхождениями {(result['mismatches'] > 0).sum()}")
+    return result
+
+
+def benchmark_wilder(rows=10 * 252 * 14, period=14, repeat=3):
+    """
+    Микро-бенчмарк ATR, ±DI, ADX и RSI Уайлдера против ta (по умолчанию 10 лет часовых свечей).
+
+    Returns:
+        dict: Лучшее время из repeat запусков для ta и для ядер, сек.
+    """
+    data = synthetic_candles(rows)
+    timings = {}
+    for name, fn in (('ta', _ta_wilder), ('kernels', _wilder)):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn(data, period)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    print(f"Уайлдер на {rows} свечах: ta {timings['ta']:.3f} с, ядра {timings['kernels']:.4f} с")
+    return timings
+
+
+if __name__ == "__main__":
+    print(check_parity())
+    print(check_wilder_parity())
+    benchmark_wilder()
+    benchmark()
@@ -0,0 +1,368 @@
+"""
+Локальная замена ISS MOEX для офлайн-замеров и регрессионных проверок moex_parser.
+
+Отдаёт candles.csv для досок shares/index/currency и history по дате в формате ISS:
+разделитель ';', имя блока и пустая строка перед заголовком, страницы по 500 строк
+(history — по 100). Свечи берутся из записанных фикстур (FIXTURES_DIR) или
+детерминированно генерируются. Задержка и ошибки (500/429) настраиваются.
+Годовые отчёты МСФО в формате smart-lab отдаются с ETag/Last-Modified и ответом 304.
+
+Запуск: python iss_stub_server.py --port 8765 --latency 0.05 --error-rate 0.01
+Клиент: ISS_BASE_URL=http://127.0.0.1:8765 REPORTS_BASE_URL=http://127.0.0.1:8765 python Main.py
+"""
+
+import argparse
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+
+FIXTURES_DIR = os.path.join("fixtures", "iss")
+CANDLE_PAGE_SIZE = 500
+HISTORY_PAGE_SIZE = 100
+ISS_CANDLE_COLUMNS = ['open', 'close', 'high', 'low', 'value', 'volume', 'begin', 'end']
+# Часы торгов для синтетических внутридневных свечей (основная и вечерняя сессии)
+SESSION_HOURS = (10, 24)
+INTERVAL_TIMEFRAMES = {1: '1m', 10: '10m', 60: '1h', 24: 'daily', 7: 'weekly', 31: 'monthly', 4: 'quarterly'}
+
+CANDLES_PATH = re.compile(
+    r'^/iss/engines/(?:stock/markets/(?:shares|index)|currency/markets/selt)'
+    r'/boards/(?P<board>[^/]+)/securities/(?P<ticker>[^/]+)/candles\.csv$'
+)
+HISTORY_PATH = re.compile(r'^/iss/history/engines/stock/markets/[^/]+/boards/(?P<board>[^/]+)/securities\.csv$')
+REPORT_PATH = re.compile(r'^/q/(?P<ticker>[^/]+)/f/y/MSFO/download/$')
+# Дата публикации синтетических отчётов (заголовок Last-Modified)
+REPORT_LAST_MODIFIED = "Mon, 03 Mar 2025 09:00:00 GMT"
+
+
+def _noise(seconds, seed):
+    # Детерминированный шум в [0, 1) от времени свечи: страницы согласованы между запросами
+    value = np.sin(seconds * 12.9898 + seed * 78.233) * 43758.5453
+    return value - np.floor(value)
+
+
+def _period_of(begin, interval):
+    # Период ISS для старших интервалов: неделя ISO, календарный месяц или квартал
+    if interval == 7:
+        return begin.isocalendar()[:2]
+    if interval == 31:
+        return begin.year, begin.month
+    return begin.year, (begin.month - 1) // 3
+
+
+def aggregate_candles(daily, interval):
+    """
+    Собирает бары интервала 7, 31 или 4 из дневных свечей так, как их отдаёт ISS:
+    open первой торговой свечи периода, close последней, экстремумы и суммы объёма и оборота;
+    begin — начало первой свечи, end — конец последней.
+
+    Намеренно не использует resample, чтобы сверка resample с заглушкой не была самопроверкой.
+    """
+    bars = []
+    for row in daily.itertuples(index=False):
+        begin = pd.Timestamp(row.begin)
+        period = _period_of(begin, interval)
+        if bars and bars[-1]['period'] == period:
+            bar = bars[-1]
+            bar['high'] = max(bar['high'], row.high)
+            bar['low'] = min(bar['low'], row.low)
+            bar['close'] = row.close
+            bar['value'] += row.value
+            bar['volume'] += row.volume
+            bar['end'] = row.end
+        else:
+            bars.append({'period': period, 'open': row.open, 'close': row.close, 'high': row.high,
+                         'low': row.low, 'value': row.value, 'volume': row.volume,
+                         'begin': row.begin, 'end': row.end})
+    return pd.DataFrame(bars, columns=ISS_CANDLE_COLUMNS)
+
+
+def generate_candles(ticker, interval, start, end):
+    """
+    Генерирует детерминированные свечи ISS для тикера в диапазоне [start, end].
+
+    Старшие интервалы (7, 31, 4) собираются из сгенерированных дневных свечей (aggregate_candles).
+
+    Returns:
+        pd.DataFrame: Свечи с колонками ISS_CANDLE_COLUMNS.
+    """
+    if interval in (7, 31, 4):
+        return aggregate_candles(generate_candles(ticker, 24, start, end), interval)
+
+    days = pd.bdate_range(start.normalize(), end.normalize())
+    if interval == 24:
+        begins = days
+        step = pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    else:
+        offsets = pd.timedelta_range(
+            start=pd.Timedelta(hours=SESSION_HOURS[0]), end=pd.Timedelta(hours=SESSION_HOURS[1]),
+            freq=f"{interval}min", closed='left'
+        )
+        begins = pd.DatetimeIndex((days.values[:, None] + offsets.values[None, :]).ravel())
+        step = pd.Timedelta(minutes=interval) - pd.Timedelta(seconds=1)
+    begins = begins[(begins >= start) & (begins <= end)]
+
+    seed = zlib.crc32(ticker.encode()) % 1000
+    seconds = ((begins - pd.Timestamp('1970-01-01')) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64)
+    base = 100 + seed / 10
+    close = base * (1 + 0.2 * np.sin(seconds / 8.64e6)) * (1 + 0.01 * (_noise(seconds, seed) - 0.5))
+    open_ = close * (1 + 0.005 * (_noise(seconds + 1, seed) - 0.5))
+    high = np.maximum(open_, close) * (1 + 0.005 * _noise(seconds + 2, seed))
+    low = np.minimum(open_, close) * (1 - 0.005 * _noise(seconds + 3, seed))
+    volume = (1000 + 9000 * _noise(seconds + 4, seed)).astype(np.int64)
+    return pd.DataFrame({
+        'open': open_.round(2), 'close': close.round(2), 'high': high.round(2), 'low': low.round(2),
+        'value': (volume * close).round(1), 'volume': volume,
+        'begin': begins.strftime('%Y-%m-%d %H:%M:%S'), 'end': (begins + step).strftime('%Y-%m-%d %H:%M:%S'),
+    })[ISS_CANDLE_COLUMNS]
+
+
+def load_fixture(ticker, interval, fixtures_dir=FIXTURES_DIR):
+    """
+    Загружает записанные свечи {TICKER}_{interval}.csv (формат ISS), если они есть.
+    """
+    path = os.path.join(fixtures_dir, f"{ticker.upper()}_{interval}.csv")
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, sep=';')
+
+
+def record_fixture(ticker, timeframe, start_date, end_date, market="shares", board="TQBR",
+                   fixtures_dir=FIXTURES_DIR):
+    """
+    Записывает свечи с настоящего ISS в фикстуру для заглушки.
+
+    Returns:
+        str: Путь к фикстуре или None при ошибке.
+    """
+    from moex_parser import fetch_moex_candles_all
+
+    intervals = {tf: interval for interval, tf in INTERVAL_TIMEFRAMES.items()}
+    data = fetch_moex_candles_all(ticker, start_date, end_date, timeframe, market, board,
+                                  base_url="https://iss.moex.com")
+    if data is None or data.empty:
+        print(f"Не удалось записать фикстуру для {ticker} ({timeframe})")
+        return None
+    if not os.path.exists(fixtures_dir):
+        os.makedirs(fixtures_dir)
+    path = os.path.join(fixtures_dir, f"{ticker.upper()}_{intervals[timeframe.lower()]}.csv")
+    data[ISS_CANDLE_COLUMNS].to_csv(path, sep=';', index=False)
+    print(f"Фикстура сохранена: {path}, {len(data)} строк")
+    return path
+
+
+def generate_report(ticker):
+    """
+    Детерминированный годовой отчёт МСФО в формате smart-lab: ';', десятичная запятая, пробел тысяч.
+    """
+    rng = np.random.default_rng(zlib.crc32(ticker.upper().encode('utf-8')))
+    years = [str(year) for year in range(2015, 2025)] + ['LTM']
+    rows = {
+        'Чистая прибыль, млрд руб': rng.uniform(10, 1500, len(years)),
+        'Операционная прибыль, млрд руб': rng.uniform(20, 2000, len(years)),
+        'Активы, млрд руб': rng.uniform(500, 40000, len(years)),
+        'Чистые активы, млрд руб': rng.uniform(100, 7000, len(years)),
+        'P/E': rng.uniform(3, 15, len(years)),
+        'P/B': rng.uniform(0.5, 3, len(years)),
+        'EV/EBITDA': rng.uniform(2, 10, len(years)),
+    }
+    lines = [';' + ';'.join(years)]
+    for name, values in rows.items():
+        cells = [f'"{value:,.1f}"'.replace(',', ' ').replace('.', ',') for value in values]
+        lines.append(f'"{name}";' + ';'.join(cells))
+    return "\n".join(lines) + "\n"
+
+
+def _iss_csv(block, df):
+    # Формат ISS: имя блока, пустая строка, заголовок и строки через ';'
+    return f"{block}\n\n" + df.to_csv(sep=';', index=False, lineterminator='\n')
+
+
+class ISSStubHandler(BaseHTTPRequestHandler):
+    server_version = "ISSStub/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type="text/csv; charset=utf-8", headers=None):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        with server.stats_lock:
+            server.stats['requests'] += 1
+        latency = server.latency + random.uniform(0, server.jitter)
+        if latency > 0:
+            time.sleep(latency)
+        if server.error_rate and random.random() < server.error_rate:
+            with server.stats_lock:
+                server.stats['errors'] += 1
+            status = random.choice([429, 500])
+            self._send(status, f"error {status}\n", "text/plain")
+            return
+
+        parsed = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        match = CANDLES_PATH.match(parsed.path)
+        if match:
+            self._send(200, self._candles_page(match.group('ticker'), params))
+            return
+        match = HISTORY_PATH.match(parsed.path)
+        if match:
+            self._send(200, self._history_page(params))
+            return
+        match = REPORT_PATH.match(parsed.path)
+        if match:
+            self._report(match.group('ticker'))
+            return
+        self._send(404, "not found\n", "text/plain")
+
+    def _candles_page(self, ticker, params):
+        interval = int(params.get('interval', 24))
+        start = pd.Timestamp(params.get('from', '2000-01-01'))
+        till = params.get('till')
+        # Дата без времени в 'till' включает весь день, как у ISS
+        end = pd.Timestamp(till) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1) if till and len(till) == 10 \
+            else pd.Timestamp(till or pd.Timestamp.now())
+        offset = int(params.get('start', 0))
+
+        candles = load_fixture(ticker, interval, self.server.fixtures_dir)
+        if candles is not None:
+            begins = pd.to_datetime(candles['begin'])
+            candles = candles[(begins >= start) & (begins <= end)]
+        else:
+            candles = generate_candles(ticker, interval, start, end)
+        if params.get('iss.reverse') == 'true':
+            candles = candles.iloc[::-1]
+        return _iss_csv("candles", candles.iloc[offset:offset + CANDLE_PAGE_SIZE])
+
+    def _report(self, ticker):
+        body = generate_report(ticker)
+        headers = {'ETag': f'"{zlib.crc32(body.encode("utf-8")):08x}"', 'Last-Modified': REPORT_LAST_MODIFIED}
+        with self.server.stats_lock:
+            self.server.stats['reports'] += 1
+        if self.headers.get('If-None-Match') == headers['ETag']:
+            self._send(304, "", headers=headers)
+            return
+        self._send(200, body, headers=headers)
+
+    def _history_page(self, params):
+        date = pd.Timestamp(params.get('date', pd.Timestamp.now().normalize()))
+        offset = int(params.get('start', 0))
+        rows = []
+        if date.weekday() < 5:
+            for ticker in self.server.universe:
+                candle = generate_candles(ticker, 24, date, date)
+                if candle.empty:
+                    continue
+                candle = candle.iloc[0]
+                rows.append({
+                    'BOARDID': 'TQBR', 'TRADEDATE': date.strftime('%Y-%m-%d'), 'SECID': ticker,
+                    'OPEN': candle['open'], 'LOW': candle['low'], 'HIGH': candle['high'], 'CLOSE': candle['close'],
+                    'VOLUME': candle['volume'], 'VALUE': candle['value'],
+                })
+        history = pd.DataFrame(rows, columns=['BOARDID', 'TRADEDATE', 'SECID', 'OPEN', 'LOW', 'HIGH', 'CLOSE',
+                                              'VOLUME', 'VALUE'])
+        cursor = pd.DataFrame([{'INDEX': offset, 'TOTAL': len(history), 'PAGESIZE': HISTORY_PAGE_SIZE}])
+        page = history.iloc[offset:offset + HISTORY_PAGE_SIZE]
+        return _iss_csv("history", page) + "\n" + _iss_csv("history.cursor", cursor)
+
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                      fixtures_dir=FIXTURES_DIR, universe=None, verbose=False):
+    """
+    Запускает заглушку ISS в фоновом потоке.
+
+    Args:
+        host (str): Адрес.
+        port (int): Порт (0 — любой свободный).
+        latency (float): Базовая задержка ответа, сек.
+        jitter (float): Случайная добавка к задержке, сек.
+        error_rate (float): Доля ответов с ошибкой 429/500.
+        fixtures_dir (str): Директория записанных фикстур.
+        universe (list): Тикеры для history-эндпоинта (по умолчанию — moex_companies_no_etf.csv).
+        verbose (bool): Логировать запросы.
+
+    Returns:
+        tuple: (server, base_url). Остановка — server.shutdown().
+    """
+    server = ThreadingHTTPServer((host, port), ISSStubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.fixtures_dir = fixtures_dir
+    server.verbose = verbose
+    if universe is None:
+        universe = pd.read_csv("moex_companies_no_etf.csv")['ticker'].dropna().tolist() \
+            if os.path.exists("moex_companies_no_etf.csv") else ['SBER', 'GAZP', 'LKOH']
+    server.universe = universe
+    server.stats = {'requests': 0, 'errors': 0, 'reports': 0}
+    server.stats_lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    print(f"Заглушка ISS запущена: {base_url}")
+    return server, base_url
+
+
+def benchmark_fetch(ticker="SBER", timeframe="1h", period_years=1, latency=0.05):
+    """
+    Сравнивает последовательную и параллельную загрузку свечей через заглушку ISS.
+    """
+    from datetime import datetime, timedelta
+    import moex_parser
+
+    server, base_url = start_stub_server(latency=latency)
+    end = datetime.now()
+    start = end - timedelta(days=period_years * 365)
+    start_str, end_str = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+    try:
+        for parallel in (False, True):
+            requests_before = server.stats['requests']
+            began = time.perf_counter()
+            df = moex_parser.fetch_moex_candles_all(ticker, start_str, end_str, timeframe,
+                                                    parallel=parallel, base_url=base_url)
+            elapsed = time.perf_counter() - began
+            print(f"parallel={parallel}: {len(df)} строк, запросов {server.stats['requests'] - requests_before}, "
+                  f"{elapsed:.2f} с")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная заглушка ISS MOEX")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--benchmark", action="store_true", help="Замер последовательной и параллельной загрузки")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_fetch(latency=args.latency or 0.05)
+    else:
+        server, _ = start_stub_server(args.host, args.port, args.latency, args.jitter, args.error_rate,
+                                      args.fixtures, verbose=args.verbose)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
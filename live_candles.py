@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import candle_store
+from cache_manager import CACHE
+
+# Тикеры, для которых в фоне держатся свежие внутридневные свечи (через запятую)
+LIVE_WATCHLIST = [t.strip().upper() for t in os.environ.get(
+    "LIVE_WATCHLIST", "SBER,GAZP,LKOH,YDEX,ROSN,GMKN,NVTK,TATN,VTBR,MGNT").split(",") if t.strip()]
+# Интервалы, которые держит поллер (4h строится из 1h локально)
+LIVE_TIMEFRAMES = ('1h',)
+# Размер кольцевого буфера, свечей на серию
+LIVE_BUFFER_SIZE = 500
+# Период опроса ISS и сброса буфера в хранилище, сек.
+LIVE_POLL_INTERVAL = int(os.environ.get("LIVE_POLL_INTERVAL", 60))
+LIVE_PERSIST_INTERVAL = 15 * 60
+# Буфер старше этого возраста не используется для ответа, сек.
+LIVE_STALE_SECONDS = 3 * LIVE_POLL_INTERVAL
+# Глубина начальной загрузки серии в хранилище, дней
+LIVE_SEED_DAYS = 365
+
+
+class CandleRing:
+    """
+    Кольцевой буфер последних свечей фиксированного размера.
+
+    Свеча с той же датой, что и последняя, обновляется на месте (незакрытый бар),
+    более новая добавляется с вытеснением самой старой, более старые игнорируются.
+    """
+
+    def __init__(self, size=LIVE_BUFFER_SIZE):
+        self.size = size
+        self.dates = np.zeros(size, dtype='datetime64[ns]')
+        self.values = np.zeros((size, 5), dtype=np.float64)  # high, low, open, close, volume
+        self.count = 0
+        self.head = 0  # индекс следующей записи
+        self._lock = threading.Lock()
+
+    def _last_index(self):
+        return (self.head - 1) % self.size
+
+    def last_date(self):
+        with self._lock:
+            return self.dates[self._last_index()] if self.count else None
+
+    def upsert(self, candles):
+        """
+        Добавляет или обновляет свечи.
+
+        Args:
+            candles (pd.DataFrame): Свечи с колонками candle_store.CANDLE_COLUMNS, отсортированные по дате.
+
+        Returns:
+            int: Количество добавленных новых свечей.
+        """
+        dates = pd.to_datetime(candles['date']).to_numpy(dtype='datetime64[ns]')
+        values = candles[['high', 'low', 'open', 'close', 'volume']].to_numpy(dtype=np.float64)
+        added = 0
+        with self._lock:
+            for date, row in zip(dates, values):
+                if self.count:
+                    last = self._last_index()
+                    if date == self.dates[last]:
+                        self.values[last] = row
+                        continue
+                    if date < self.dates[last]:
+                        continue
+                self.dates[self.head] = date
+                self.values[self.head] = row
+                self.head = (self.head + 1) % self.size
+                self.count = min(self.count + 1, self.size)
+                added += 1
+        return added
+
+    def to_frame(self):
+        """
+        Возвращает содержимое буфера в хронологическом порядке.
+        """
+        with self._lock:
+            order = (np.arange(self.count) + self.head - self.count) % self.size
+            dates = self.dates[order]
+            values = self.values[order]
+        df = pd.DataFrame(values, columns=['high', 'low', 'open', 'close', 'volume'])
+        df.insert(0, 'date', dates)
+        df['volume'] = df['volume'].astype(np.int64)
+        return df[candle_store.CANDLE_COLUMNS]
+
+
+class _LiveSeries:
+    def __init__(self, ticker, timeframe, market, board):
+        self.ticker = ticker
+        self.timeframe = timeframe
+        self.market = market
+        self.board = board
+        self.key = candle_store.series_key(ticker, timeframe, market, board)
+        self.ring = CandleRing()
+        self.polled_at = None
+        self.persisted_at = None
+        self.seeded = False
+
+
+class LiveCandlePoller:
+    """
+    Фоновый опрос ISS для списка тикеров: держит в памяти последние свечи
+    каждого тикера и отдаёт их вместе с сохранённой серией без обращения к сети.
+    """
+
+    def __init__(self, tickers=None, timeframes=LIVE_TIMEFRAMES, market="shares", board="TQBR",
+                 poll_interval=LIVE_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.feeds = {}
+        for ticker in (LIVE_WATCHLIST if tickers is None else tickers):
+            for timeframe in timeframes:
+                self.add(ticker, timeframe, market, board)
+        self.counters = {'polls': 0, 'poll_errors': 0, 'served': 0, 'fallbacks': 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, ticker, timeframe, market="shares", board="TQBR"):
+        key = candle_store.series_key(ticker, timeframe, market, board)
+        if key not in self.feeds:
+            self.feeds[key] = _LiveSeries(ticker.upper(), timeframe.lower(), market, board)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _seed(self, feed, now):
+        from moex_parser import update_series
+
+        series = update_series(feed.ticker, feed.timeframe, now - timedelta(days=LIVE_SEED_DAYS),
+                               feed.market, feed.board, now)
+        if series is None or series.empty:
+            return False
+        feed.ring.upsert(series.tail(feed.ring.size))
+        feed.persisted_at = now
+        feed.seeded = True
+        return True
+
+    def _poll(self, feed, now):
+        from moex_parser import fetch_moex_candles_all
+
+        last_date = feed.ring.last_date()
+        start_str = pd.Timestamp(last_date).strftime('%Y-%m-%d')
+        data = fetch_moex_candles_all(feed.ticker, start_str, now.strftime('%Y-%m-%d'), feed.timeframe,
+                                      feed.market, feed.board, raise_errors=True)
+        if data is not None and not data.empty:
+            data = data[['begin', 'high', 'low', 'open', 'close', 'volume']].rename(columns={'begin': 'date'})
+            feed.ring.upsert(data)
+
+    def _persist(self, feed, now):
+        with candle_store.SERIES_LOCKS.get(feed.key):
+            stored = candle_store.load_series(feed.key)
+            merged = candle_store.merge_candles(stored, feed.ring.to_frame())
+            candle_store.save_series(feed.key, merged)
+            meta = candle_store.load_meta(feed.key)
+            meta['updated_at'] = now.isoformat(timespec='seconds')
+            candle_store.save_meta(feed.key, meta)
+        feed.persisted_at = now
+
+    def poll_once(self, now=None):
+        """
+        Один цикл опроса: начальная загрузка новых серий, догрузка свечей за текущий день
+        и периодический сброс буфера в хранилище. Ошибка серии (сеть, разбор ответа ISS, запись)
+        пишется в лог и считается в poll_errors, остальные серии опрашиваются дальше.
+        """
+        for feed in list(self.feeds.values()):
+            current = now or datetime.now()
+            try:
+                if not feed.seeded and not self._seed(feed, current):
+                    continue
+                self._poll(feed, current)
+                feed.polled_at = time.monotonic()
+                self._count('polls')
+                if (current - feed.persisted_at).total_seconds() >= LIVE_PERSIST_INTERVAL:
+                    self._persist(feed, current)
+            except Exception as e:
+                self._count('poll_errors')
+                print(f"Опрос {feed.key} не удался: {type(e).__name__}: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            # Поток не должен погибнуть молча: иначе все запросы уходят в сеть без следа в логе
+            try:
+                self.poll_once()
+            except Exception as e:
+                self._count('poll_errors')
+                print(f"Ошибка цикла опроса внутридневных свечей: {type(e).__name__}: {e}")
+            self._stop.wait(max(0.0, self.poll_interval - (time.monotonic() - started)))
+
+    def start(self):
+        """
+        Запускает фоновый поток опроса (повторный вызов ничего не делает).
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="live-candles", daemon=True)
+        self._thread.start()
+        print(f"Опрос внутридневных свечей запущен: {len(self.feeds)} серий, каждые {self.poll_interval} с")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def get_series(self, ticker, timeframe, start_date, market="shares", board="TQBR"):
+        """
+        Возвращает серию из хранилища, дополненную свечами из буфера, без обращения к сети.
+
+        Returns:
+            pd.DataFrame: Серия или None, если тикер не отслеживается, буфер устарел,
+            хранилище не покрывает start_date или между хранилищем и буфером есть разрыв.
+        """
+        key = candle_store.series_key(ticker, timeframe, market, board)
+        feed = self.feeds.get(key)
+        if feed is None:
+            return None
+        if feed.polled_at is None or time.monotonic() - feed.polled_at > LIVE_STALE_SECONDS:
+            self._count('fallbacks')
+            return None
+
+        covered_from = candle_store.load_meta(key).get('covered_from')
+        stored = candle_store.load_series(key)
+        live = feed.ring.to_frame()
+        if (covered_from is None or start_date.strftime('%Y-%m-%d') < covered_from
+                or stored is None or stored.empty or live.empty
+                or pd.to_datetime(stored['date'].iloc[-1]) < live['date'].iloc[0]):
+            self._count('fallbacks')
+            return None
+
+        CACHE.record_hit()
+        CACHE.touch(candle_store.series_file(key))
+        self._count('served')
+        return candle_store.merge_candles(stored, live)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters['series'] = len(self.feeds)
+        return counters
+
+
+# Общий поллер процесса; запускается вызовом LIVE.start()
+LIVE = LiveCandlePoller()
@@ -0,0 +1,128 @@
+import atexit
+import os
+import threading
+import time
+import httpx
+from gigachat import GigaChat
+from openai import OpenAI
+from bot_config import GIGACHAT_API_KEY, VERIFY_SSL_CERTS
+
+# Локальная LLM (LM Studio, OpenAI-совместимый API)
+LOCAL_LLM_BASE_URL = os.environ.get("LOCAL_LLM_BASE_URL", "http://localhost:1234/v1")
+LOCAL_LLM_MODEL = "deepseek-r1-distill-qwen-14b"
+GIGACHAT_MAX_MODEL = "GigaChat-2-Max"
+# Одновременных соединений с каждым API и сколько из них держать открытыми между запросами
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 8))
+LLM_MAX_KEEPALIVE = int(os.environ.get("LLM_MAX_KEEPALIVE", 4))
+# Таймауты, сек.: соединение и ответ (генерация длинного прогноза локальной моделью идёт минутами)
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 10))
+LOCAL_LLM_TIMEOUT = float(os.environ.get("LOCAL_LLM_TIMEOUT", 600))
+GIGACHAT_TIMEOUT = float(os.environ.get("GIGACHAT_TIMEOUT", 120))
+# Проверка доступности локальной LLM: таймаут без повторов и сколько помнить её результат, сек.
+LOCAL_LLM_PROBE_TIMEOUT = float(os.environ.get("LOCAL_LLM_PROBE_TIMEOUT", 3))
+LOCAL_LLM_PROBE_TTL = 30
+# Токен GigaChat обновляется заранее, если до его истечения осталось меньше этого, сек.
+GIGACHAT_TOKEN_MARGIN = 60
+
+
+class LLMClients:
+    """
+    Долгоживущие клиенты LLM процесса: соединения переиспользуются (keep-alive),
+    а токен OAuth GigaChat получается один раз и обновляется до истечения, а не на каждый запрос.
+
+    Клиенты создаются при первом обращении; openai и gigachat потокобезопасны и общие для всех потоков.
+    """
+
+    def __init__(self):
+        self._openai = None
+        self._gigachat = {}
+        self._token_expires = {}
+        self._probe = None
+        self.counters = {'openai_created': 0, 'gigachat_created': 0, 'token_refreshes': 0}
+        self._lock = threading.Lock()
+
+    def openai(self):
+        """
+        Клиент локальной LLM с общим пулом соединений.
+        """
+        with self._lock:
+            if self._openai is None:
+                http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                        max_keepalive_connections=LLM_MAX_KEEPALIVE),
+                    timeout=httpx.Timeout(LOCAL_LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+                )
+                self._openai = OpenAI(base_url=LOCAL_LLM_BASE_URL, api_key="not-needed", http_client=http_client)
+                self.counters['openai_created'] += 1
+            return self._openai
+
+    def openai_available(self):
+        """
+        Отвечает ли локальная LLM: models.list() с коротким таймаутом и без повторов,
+        чтобы при выключенном сервере не ждать LOCAL_LLM_TIMEOUT; результат помнится LOCAL_LLM_PROBE_TTL.
+        """
+        with self._lock:
+            if self._probe is not None and time.monotonic() - self._probe[0] < LOCAL_LLM_PROBE_TTL:
+                return self._probe[1]
+        try:
+            self.openai().with_options(timeout=LOCAL_LLM_PROBE_TIMEOUT, max_retries=0).models.list()
+            available = True
+        except Exception as e:
+            print(f"Локальная LLM {LOCAL_LLM_BASE_URL} недоступна: {e}")
+            available = False
+        with self._lock:
+            self._probe = (time.monotonic(), available)
+        return available
+
+    def gigachat(self, model=GIGACHAT_MAX_MODEL):
+        """
+        Клиент GigaChat для модели с действующим токеном (один на модель).
+        """
+        with self._lock:
+            client = self._gigachat.get(model)
+            if client is None:
+                client = GigaChat(
+                    credentials=GIGACHAT_API_KEY,
+                    verify_ssl_certs=VERIFY_SSL_CERTS,
+                    model=model,
+                    timeout=GIGACHAT_TIMEOUT,
+                    max_connections=LLM_MAX_CONNECTIONS
+                )
+                self._gigachat[model] = client
+                self.counters['gigachat_created'] += 1
+            refresh = self._token_expires.get(model, 0) - time.time() < GIGACHAT_TOKEN_MARGIN
+        if refresh:
+            self._refresh_token(model, client)
+        return client
+
+    def _refresh_token(self, model, client):
+        # Обмен токена до запроса, а не посреди него; при действующем токене get_token сеть не трогает
+        token = client.get_token()
+        if token is None or not token.expires_at:
+            return
+        with self._lock:
+            expires = token.expires_at / 1000
+            if expires != self._token_expires.get(model):
+                self.counters['token_refreshes'] += 1
+            self._token_expires[model] = expires
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters['gigachat_models'] = sorted(self._gigachat)
+            return counters
+
+    def close(self):
+        with self._lock:
+            clients = list(self._gigachat.values()) + ([self._openai] if self._openai is not None else [])
+            self._openai, self._gigachat, self._token_expires, self._probe = None, {}, {}, None
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                print(f"Ошибка закрытия клиента LLM: {e}")
+
+
+# Общие клиенты LLM процесса
+LLM_CLIENTS = LLMClients()
+atexit.register(LLM_CLIENTS.close)
@@ -0,0 +1,223 @@
+import os
+import re
+import time
+
+# Потоковый вывод ответа LLM правкой одного сообщения Telegram (LLM_STREAMING=0 — отключить)
+LLM_STREAMING = os.environ.get("LLM_STREAMING", "1") != "0"
+# Минимальный интервал между правками сообщения (лимиты Telegram на edit_message_text), сек.
+TELEGRAM_EDIT_INTERVAL = float(os.environ.get("TELEGRAM_EDIT_INTERVAL", 1.5))
+# Максимальная длина сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Не отправлять первое сообщение, пока видимого текста меньше этого числа символов
+STREAM_MIN_FIRST_CHARS = 20
+# Попыток доставить окончательный текст, если Telegram отклоняет правки
+STREAM_FINISH_ATTEMPTS = 3
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+class ThinkFilter:
+    """
+    Вырезает блоки <think>...</think> из потока токенов по мере поступления,
+    в том числе когда тег разрезан между фрагментами.
+    """
+
+    def __init__(self):
+        self.inside = False
+        self.buffer = ""
+
+    def feed(self, chunk):
+        """
+        Принимает очередной фрагмент и возвращает текст, который уже можно показать.
+        """
+        self.buffer += chunk
+        visible = []
+        while self.buffer:
+            tag = THINK_CLOSE if self.inside else THINK_OPEN
+            position = self.buffer.find(tag)
+            if position >= 0:
+                if not self.inside:
+                    visible.append(self.buffer[:position])
+                self.buffer = self.buffer[position + len(tag):]
+                self.inside = not self.inside
+                continue
+            # Хвост может оказаться началом тега: он ждёт следующего фрагмента
+            keep = next((size for size in range(min(len(tag) - 1, len(self.buffer)), 0, -1)
+                         if tag.startswith(self.buffer[-size:])), 0)
+            if not self.inside:
+                visible.append(self.buffer[:len(self.buffer) - keep])
+            self.buffer = self.buffer[len(self.buffer) - keep:]
+            break
+        return "".join(visible)
+
+    def close(self):
+        """
+        Конец потока: хвост, ждавший продолжения тега, показывается, если он не внутри <think>.
+        """
+        tail = "" if self.inside else self.buffer
+        self.buffer = ""
+        return tail
+
+
+def split_message(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """
+    Части текста по лимиту Telegram — по тем же границам, по которым TelegramStreamWriter начинает новое сообщение.
+    """
+    return [text[start:start + limit] for start in range(0, len(text), limit)]
+
+
+def send_chunks(bot, chat_id, text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """
+    Отправляет текст одним или несколькими сообщениями, не превышая лимит Telegram.
+    """
+    for part in split_message(text, limit):
+        if part.strip():
+            bot.send_message(chat_id, part)
+
+
+def openai_deltas(stream):
+    """
+    Текстовые фрагменты потока chat.completions.create(..., stream=True).
+    Поток закрывается и при обрыве чтения, чтобы соединение вернулось в общий пул.
+    """
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            close()
+
+
+def gigachat_deltas(stream):
+    """
+    Текстовые фрагменты потока GigaChat.stream(...).
+    """
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def _retry_after(error):
+    # telebot.ApiTelegramException при 429 передаёт parameters.retry_after
+    result = getattr(error, 'result_json', None) or {}
+    return (result.get('parameters') or {}).get('retry_after')
+
+
+class TelegramStreamWriter:
+    """
+    Показывает ответ LLM по мере генерации: первое сообщение отправляется с первым видимым текстом,
+    дальше оно правится не чаще TELEGRAM_EDIT_INTERVAL; текст длиннее лимита продолжается новым сообщением.
+    """
+
+    def __init__(self, bot, chat_id, interval=TELEGRAM_EDIT_INTERVAL, limit=TELEGRAM_MESSAGE_LIMIT):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.interval = interval
+        self.limit = limit
+        self.message_id = None
+        self.shown = ""
+        self.text = ""
+        self.offset = 0
+        self.next_edit = 0.0
+        self.edits = 0
+
+    @property
+    def started(self):
+        return self.message_id is not None
+
+    def _publish(self, text, force=False):
+        """
+        Returns:
+            bool: True, если в чате показан весь текст.
+        """
+        now = time.monotonic()
+        if not force and now < self.next_edit:
+            return False
+        # Сообщение заполнено: оно закрывается, а остаток текста идёт в новое.
+        # Недоставленный кусок не пропускается: повтор при следующей публикации или в finish
+        while len(text) - self.offset > self.limit:
+            chunk = text[self.offset:self.offset + self.limit]
+            if chunk != self.shown and not self._set(chunk):
+                return False
+            self.offset += self.limit
+            self.message_id = None
+            self.shown = ""
+        part = text[self.offset:]
+        delivered = not part.strip() or part == self.shown or self._set(part)
+        self.next_edit = max(self.next_edit, now + self.interval)
+        return delivered
+
+    def _set(self, part):
+        """
+        Отправляет или правит текущее сообщение.
+
+        Returns:
+            bool: True, если Telegram принял текст.
+        """
+        try:
+            if self.message_id is None:
+                self.message_id = self.bot.send_message(self.chat_id, part).message_id
+            else:
+                self.bot.edit_message_text(part, chat_id=self.chat_id, message_id=self.message_id)
+                self.edits += 1
+            self.shown = part
+            return True
+        except Exception as e:
+            retry_after = _retry_after(e)
+            self.next_edit = time.monotonic() + (retry_after or self.interval)
+            print(f"Не удалось обновить сообщение в чате {self.chat_id}: {e}")
+            return False
+
+    def consume(self, deltas):
+        """
+        Читает поток фрагментов, показывая текст без <think>. Очищенный ответ остаётся в self.text:
+        его и нужно передать в finish, чтобы границы сообщений совпали с показанными при потоке.
+
+        Returns:
+            str: Полный сырой ответ (с <think>), как у обычного вызова.
+        """
+        think = ThinkFilter()
+        raw = []
+        visible = ""
+        for delta in deltas:
+            raw.append(delta)
+            visible += think.feed(delta)
+            if self.started or len(visible.strip()) >= STREAM_MIN_FIRST_CHARS:
+                self._publish(visible.strip())
+        self.text = (visible + think.close()).strip()
+        return "".join(raw)
+
+    def finish(self, text):
+        """
+        Заменяет показанный текст окончательным (после очистки) без учёта интервала;
+        при отказе Telegram повторяет после паузы (retry_after), до STREAM_FINISH_ATTEMPTS раз.
+        """
+        for attempt in range(STREAM_FINISH_ATTEMPTS):
+            if attempt:
+                time.sleep(max(0.0, self.next_edit - time.monotonic()))
+            if self._publish(text, force=True):
+                return True
+        return False
+
+    def fallback(self, text):
+        """
+        Если finish не удался: недоставленный остаток текста (с текущего сообщения) уходит новыми
+        сообщениями, а недописанное сообщение по возможности удаляется.
+        """
+        if self.message_id is not None:
+            try:
+                self.bot.delete_message(self.chat_id, self.message_id)
+            except Exception as e:
+                print(f"Не удалось удалить недописанное сообщение в чате {self.chat_id}: {e}")
+            self.message_id = None
+        send_chunks(self.bot, self.chat_id, text[self.offset:], self.limit)
+
+
+def strip_think(raw_response):
+    """
+    Окончательная очистка ответа от рассуждений <think> (в том числе незакрытого блока).
+    """
+    return re.sub(r'<think>.*?(</think>|\s*$)', '', raw_response, flags=re.DOTALL).strip()
@@ -0,0 +1,183 @@
+import os
+import re
+import threading
+import pandas as pd
+from utils import read_monthly_macro_content, read_yearly_macro_content
+
+MONTHLY_MACRO_FILE = "monthly_macro_indicators_russia.csv"
+YEARLY_MACRO_FILE = "yearly_macro_indicators_russia.csv"
+# Год, от которого анализ МСФО отсчитывает период (start_year = MACRO_BASE_YEAR - period_years)
+MACRO_BASE_YEAR = 2025
+# Начальные годы, для которых фрагменты строятся при запуске: горизонты прогнозов (2024/2020/2015)
+# и все периоды анализа МСФО (1-10 лет)
+MACRO_START_YEARS = tuple(MACRO_BASE_YEAR - years for years in range(1, 11))
+
+
+def optimize_monthly_macro(monthly_macro_df):
+    """
+    Оптимизирует месячные макроэкономические данные для экономии токенов.
+    """
+    if monthly_macro_df is None or monthly_macro_df.empty:
+        return "Отсутствует"
+
+    key_columns = {
+        'Дата': 'Date',
+        'Инфляция (CPI, %, год к году)': 'CPI',
+        'Ключевая ставка (%)': 'Rate',
+        'Обменный курс USD/RUB (ср. за месяц)': 'USD/RUB'
+    }
+
+    available_columns = [col for col in key_columns.keys() if col in monthly_macro_df.columns]
+    if not available_columns:
+        return "Отсутствует"
+
+    monthly_macro_df = monthly_macro_df[available_columns]
+    monthly_macro_df = monthly_macro_df.rename(columns=key_columns)
+
+    try:
+        monthly_macro_df['Date'] = pd.to_datetime(monthly_macro_df['Date'], errors='coerce').dt.strftime('%Y-%m')
+        if monthly_macro_df['Date'].isna().any():
+            print("Предупреждение: некорректные даты в месячных макро-данных")
+            return "Отсутствует"
+    except Exception as e:
+        print(f"Ошибка обработки дат в месячных макро-данных: {str(e)}")
+        return "Отсутствует"
+
+    monthly_macro_df = monthly_macro_df.dropna(how='all', subset=['CPI', 'Rate', 'USD/RUB'])
+    monthly_macro_df = monthly_macro_df.fillna('н/д')
+
+    macro_str = monthly_macro_df.to_csv(index=False, header=True, sep='|', lineterminator='\n')
+    macro_str = re.sub(r'[ \t]+', '', macro_str)
+    return macro_str
+
+
+def optimize_yearly_macro(yearly_macro_df):
+    """
+    Оптимизирует годовые макроэкономические данные для экономии токенов.
+    """
+    if yearly_macro_df is None or yearly_macro_df.empty:
+        return "Отсутствует"
+
+    key_columns = {
+        'Год': 'Year',
+        'Рост ВВП (%)': 'GDP',
+        'Инфляция (CPI, %, дек к дек)': 'CPI',
+        'Уровень безработицы (%)': 'Unemployment',
+        'Ключевая ставка (%)': 'Rate',
+        'Торговый баланс (млрд USD)': 'TradeBalance',
+        'Бюджетный дефицит (% ВВП)': 'BudgetDeficit',
+        'MOEX (конец года)': 'MOEX',
+        'Обменный курс USD/RUB (ср. за год)': 'USD/RUB',
+        'Индекс доверия потребителей (%)': 'CCI'
+    }
+
+    available_columns = [col for col in key_columns.keys() if col in yearly_macro_df.columns]
+    if not available_columns:
+        return "Отсутствует"
+
+    yearly_macro_df = yearly_macro_df[available_columns]
+    yearly_macro_df = yearly_macro_df.rename(columns=key_columns)
+
+    yearly_macro_df = yearly_macro_df.dropna(how='all',
+                                             subset=[col for col in yearly_macro_df.columns if col != 'Year'])
+    yearly_macro_df = yearly_macro_df.fillna('н/д')
+
+    macro_str = yearly_macro_df.to_csv(index=False, header=True, sep='|', lineterminator='\n')
+    macro_str = re.sub(r'[ \t]+', '', macro_str)
+    return macro_str
+
+
+def _monthly_fragment(file_path, start_year):
+    monthly_macro_df = read_monthly_macro_content(file_path)
+    if monthly_macro_df is None or monthly_macro_df.empty:
+        print("Месячные макро-данные недоступны")
+        return "Отсутствует"
+    monthly_macro_df['Дата'] = pd.to_datetime(monthly_macro_df['Дата'], format='%Y-%m', errors='coerce')
+    monthly_macro_df = monthly_macro_df[monthly_macro_df['Дата'].dt.year >= start_year]
+    return optimize_monthly_macro(monthly_macro_df)
+
+
+def _yearly_fragment(file_path, start_year):
+    yearly_macro_df = read_yearly_macro_content(file_path)
+    if yearly_macro_df is None or yearly_macro_df.empty:
+        print("Годовые макро-данные недоступны")
+        return "Отсутствует"
+    yearly_macro_df = yearly_macro_df[yearly_macro_df['Год'] >= start_year]
+    return optimize_yearly_macro(yearly_macro_df)
+
+
+class MacroFragments:
+    """
+    Готовые строки макроданных для промптов по начальному году.
+
+    Строка строится один раз на (вид, год) и пересобирается, только когда у файла
+    меняются время изменения или размер.
+    """
+
+    def __init__(self, monthly_file=MONTHLY_MACRO_FILE, yearly_file=YEARLY_MACRO_FILE):
+        self.sources = {
+            'monthly': (monthly_file, _monthly_fragment),
+            'yearly': (yearly_file, _yearly_fragment),
+        }
+        self.fragments = {}
+        self.stamps = {}
+        self.counters = {'hits': 0, 'built': 0}
+        self._lock = threading.Lock()
+
+    def _fragment(self, kind, start_year):
+        file_path, build = self.sources[kind]
+        try:
+            stat = os.stat(file_path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+        with self._lock:
+            if self.stamps.get(kind, stamp) != stamp:
+                # Файл изменился: фрагменты этого вида строятся заново
+                self.fragments = {key: value for key, value in self.fragments.items() if key[0] != kind}
+            self.stamps[kind] = stamp
+            text = self.fragments.get((kind, start_year))
+            if text is not None:
+                self.counters['hits'] += 1
+                return text
+        try:
+            text = build(file_path, start_year)
+        except Exception as e:
+            print(f"Ошибка обработки {'месячных' if kind == 'monthly' else 'годовых'} макро-данных: {str(e)}")
+            return "Отсутствует"
+        with self._lock:
+            if self.stamps.get(kind) == stamp:
+                self.fragments[(kind, start_year)] = text
+            self.counters['built'] += 1
+        return text
+
+    def monthly(self, start_year):
+        """
+        Месячные данные с start_year: 'Date|CPI|Rate|USD/RUB' или "Отсутствует".
+        """
+        return self._fragment('monthly', start_year)
+
+    def yearly(self, start_year):
+        """
+        Годовые данные с start_year: 'Year|GDP|CPI|...' или "Отсутствует".
+        """
+        return self._fragment('yearly', start_year)
+
+    def warm(self, start_years=MACRO_START_YEARS):
+        """
+        Строит фрагменты для всех заданных начальных годов (вызывается при запуске бота).
+        """
+        for start_year in start_years:
+            self.monthly(start_year)
+            self.yearly(start_year)
+        print(f"Макро-фрагменты готовы: {len(self.fragments)}")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters['fragments'] = len(self.fragments)
+            return counters
+
+
+# Общий кэш макро-фрагментов процесса
+MACRO = MacroFragments()
@@ -1,13 +1,117 @@
 from datetime import datetime, timedelta
 import pandas as pd
-import requests
 from io import StringIO
 import os
+from concurrent.futures import ThreadPoolExecutor
+import candle_store
+from cache_manager import CACHE
+from http_client import HTTP, HttpError
+from single_flight import SingleFlight
+from resample import RESAMPLED_TIMEFRAMES, base_timeframe, resample_candles
+from live_candles import LIVE
 
 # Константа для директории
 HISTORICAL_DATA_DIR = "historical_data"
 
-def fetch_moex_candles_all(ticker, start_date, end_date, timeframe, market="shares", board="TQBR"):
+# Адрес ISS; для офлайн-замеров указывается локальный iss_stub_server (например, http://127.0.0.1:8765)
+ISS_BASE_URL = os.environ.get("ISS_BASE_URL", "https://iss.moex.com")
+# Параметры постраничной загрузки ISS
+ISS_PAGE_SIZE = 500
+ISS_MAX_WORKERS = 4
+# Ожидаемое число свечей за календарный день (с запасом) для нарезки окон
+CANDLES_PER_DAY = {
+    '1m': 700, '10m': 70, '1h': 12, 'daily': 1, 'weekly': 1 / 7, 'monthly': 1 / 28, 'quarterly': 1 / 90
+}
+# Таймфреймы, для которых get_historical_data грузит окна параллельно
+PARALLEL_TIMEFRAMES = ('1m', '10m', '1h')
+
+def _candles_url(ticker, market, board, base_url=None):
+    base_url = (base_url or ISS_BASE_URL).rstrip('/')
+    # Формирование URL в зависимости от рынка и доски
+    if market == "index":
+        return f"{base_url}/iss/engines/stock/markets/index/boards/{board}/securities/{ticker}/candles.csv"
+    elif market == "currency":
+        return f"{base_url}/iss/engines/currency/markets/selt/boards/{board}/securities/{ticker}/candles.csv"
+    return f"{base_url}/iss/engines/stock/markets/shares/boards/{board}/securities/{ticker}/candles.csv"
+
+
+def _fetch_pages(url, interval, ticker, timeframe, start_date, end_date):
+    """
+    Последовательно загружает все страницы ISS в диапазоне [start_date, end_date].
+
+    Returns:
+        list: Список DataFrame страниц.
+
+    Raises:
+        HttpError: Если страница не загрузилась после повторов — неполная серия не возвращается.
+    """
+    pages = []
+    current_start = start_date
+
+    while True:
+        params = {
+            "interval": interval,
+            "from": current_start,
+            "till": end_date,
+            "iss.reverse": "false"
+        }
+        response = HTTP.get(url, params=params)
+        csv_text = response.content.decode('utf-8')
+        df = pd.read_csv(StringIO(csv_text), sep=';', skiprows=2)
+        if df.empty:
+            print(f"Получены все данные для {ticker} ({timeframe}) с {start_date}")
+            break
+
+        if 'begin' not in df.columns:
+            raise HttpError(f"Нет столбца 'begin' в данных для {ticker}")
+
+        pages.append(df)
+        last_date = df['begin'].iloc[-1]
+        last_date_dt = pd.to_datetime(last_date) + timedelta(seconds=1)
+        current_start = last_date_dt.strftime('%Y-%m-%d %H:%M:%S')
+
+        if len(df) < ISS_PAGE_SIZE - 1:
+            break
+
+    return pages
+
+
+def split_date_windows(start_date, end_date, timeframe):
+    """
+    Делит диапазон дат на окна, в каждое из которых ожидается не больше одной страницы ISS.
+
+    Соседние окна пересекаются на одну дату: дубликаты на стыке удаляются по 'begin'.
+
+    Args:
+        start_date (str): Начало диапазона (YYYY-MM-DD или YYYY-MM-DD HH:MM:SS).
+        end_date (str): Конец диапазона (YYYY-MM-DD).
+        timeframe (str): Таймфрейм.
+
+    Returns:
+        list: Список пар (from, till).
+    """
+    start_dt = pd.to_datetime(start_date)
+    end_dt = pd.to_datetime(end_date)
+    per_day = CANDLES_PER_DAY.get(timeframe.lower(), 1)
+    window_days = max(1, int(ISS_PAGE_SIZE * 0.9 / per_day))
+
+    windows = []
+    window_start = start_date
+    window_start_dt = start_dt.normalize()
+    while True:
+        window_end_dt = window_start_dt + timedelta(days=window_days)
+        if window_end_dt >= end_dt:
+            windows.append((window_start, end_date))
+            break
+        window_end = window_end_dt.strftime('%Y-%m-%d')
+        windows.append((window_start, window_end))
+        window_start = window_end
+        window_start_dt = window_end_dt
+    return windows
+
+
+def fetch_moex_candles_all(ticker, start_date, end_date, timeframe, market="shares", board="TQBR",
+                           parallel=False, max_workers=ISS_MAX_WORKERS, base_url=None, raise_errors=False):
     """
     Получает свечи для указанного тикера с MOEX ISS API.
 
@@ -18,88 +122,64 @@ def fetch_moex_candles_all(ticker, start_date, end_date, timeframe, market="shar
         timeframe (str): Таймфрейм ('1m', '10m', '1h', 'daily', 'weekly', 'monthly', 'quarterly').
         market (str): Рынок ('shares', 'index', 'currency').
         board (str): Торговая доска ('TQBR', 'MICEXINDEXCF', 'RTSI', 'CETS').
+        parallel (bool): Делить диапазон на окна по датам и загружать их параллельно.
+        max_workers (int): Максимум одновременных запросов в параллельном режиме.
+        base_url (str): Адрес ISS (по умолчанию ISS_BASE_URL).
+        raise_errors (bool): Пробрасывать HttpError вместо возврата None.
 
     Returns:
-        pd.DataFrame: Данные свечей или None при ошибке.
+        pd.DataFrame: Данные свечей или None при ошибке (частичная история не возвращается).
     """
     timeframe_map = {
         '1m': 1, '10m': 10, '1h': 60, 'daily': 24, 'weekly': 7, 'monthly': 31, 'quarterly': 4
     }
     interval = timeframe_map.get(timeframe.lower(), 24)
+    url = _candles_url(ticker, market, board, base_url)
 
-    # Формирование URL в зависимости от рынка и доски
-    if market == "index":
-        url = f"https://iss.moex.com/iss/engines/stock/markets/index/boards/{board}/securities/{ticker}/candles.csv"
-    elif market == "currency":
-        url = f"https://iss.moex.com/iss/engines/currency/markets/selt/boards/{board}/securities/{ticker}/candles.csv"
-    else:
-        url = f"https://iss.moex.com/iss/engines/stock/markets/shares/boards/{board}/securities/{ticker}/candles.csv"
-
-    headers = {
-        "User-Agent": "Mozilla/5.0"
-    }
-    all_data = []
-    current_start = start_date
-
-    while True:
-        params = {
-            "interval": interval,
-            "from": current_start,
-            "till": end_date,
-            "iss.reverse": "false"
-        }
-        try:
-            response = requests.get(url, params=params, headers=headers)
-            if response.status_code != 200:
-                print(f"Ошибка запроса для {ticker}: {response.status_code}")
-                break
-            csv_text = response.content.decode('utf-8')
-            df = pd.read_csv(StringIO(csv_text), sep=';', skiprows=2)
-            if df.empty:
-                print(f"Получены все данные для {ticker} ({timeframe})")
-                break
-
-            if 'begin' not in df.columns:
-                print(f"Нет столбца 'begin' в данных для {ticker}")
-                break
-
-            all_data.append(df)
-            last_date = df['begin'].iloc[-1]
-            last_date_dt = pd.to_datetime(last_date) + timedelta(seconds=1)
-            current_start = last_date_dt.strftime('%Y-%m-%d %H:%M:%S')
-
-            if len(df) < 499:
-                break
-
-        except Exception as e:
-            print(f"Ошибка при запросе для {ticker}: {e}")
-            break
+    try:
+        if parallel:
+            windows = split_date_windows(start_date, end_date, timeframe)
+            print(f"Параллельная загрузка {ticker} ({timeframe}): {len(windows)} окон, потоков: {max_workers}")
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = executor.map(
+                    lambda window: _fetch_pages(url, interval, ticker, timeframe, window[0], window[1]),
+                    windows
+                )
+                all_data = [page for pages in results for page in pages]
+        else:
+            all_data = _fetch_pages(url, interval, ticker, timeframe, start_date, end_date)
+    except HttpError as e:
+        print(f"Ошибка при запросе для {ticker}: {e}")
+        if raise_errors:
+            raise
+        return None
 
     if all_data:
         full_df = pd.concat(all_data, ignore_index=True)
+        if parallel:
+            full_df = full_df.drop_duplicates(subset=['begin'], keep='first')
+            full_df = full_df.sort_values('begin', kind='stable').reset_index(drop=True)
         print(f"Объединено {len(full_df)} строк данных для {ticker}")
         return full_df
     else:
         return None
 
 def aggregate_to_4h(data):
-    try:
-        data['date'] = pd.to_datetime(data['date'])
-        data.set_index('date', inplace=True)
-        agg_dict = {
-            'high': 'max',
-            'low': 'min',
-            'open': 'first',
-            'close': 'last',
-            'volume': 'sum'
-        }
-        data_4h = data.resample('4h').agg(agg_dict).dropna()
-        data_4h.reset_index(inplace=True)
-        print(f"Агрегированы 4-часовые свечи: {len(data_4h)} строк")
-        return data_4h
-    except Exception as e:
-        print(f"Ошибка при агрегации 4-часовых свечей: {str(e)}")
-        return pd.DataFrame()
+    data_4h = resample_candles(data, '4h')
+    print(f"Агрегированы 4-часовые свечи: {len(data_4h)} строк")
+    return data_4h
+
+TIMEFRAME_THRESHOLDS = {
+    '1m': 1 * 60,
+    '10m': 10 * 60,
+    '1h': 1 * 3600,
+    '4h': 4 * 3600,
+    'daily': 1 * 24 * 3600,
+    'weekly': 7 * 24 * 3600,
+    'monthly': 31 * 24 * 3600,
+    'quarterly': 90 * 24 * 3600
+}
+
 
 def is_data_outdated(file_path, timeframe, period_years):
     if not os.path.exists(file_path):
@@ -108,87 +188,169 @@ def is_data_outdated(file_path, timeframe, period_years):
     mod_time = datetime.fromtimestamp(os.path.getmtime(file_path))
     now = datetime.now()
 
-    timeframe_thresholds = {
-        '1m': 1 * 60,
-        '10m': 10 * 60,
-        '1h': 1 * 3600,
-        '4h': 4 * 3600,
-        'daily': 1 * 24 * 3600,
-        'weekly': 7 * 24 * 3600,
-        'monthly': 31 * 24 * 3600,
-        'quarterly': 90 * 24 * 3600
-    }
-    threshold = timeframe_thresholds.get(timeframe.lower(), 24 * 3600)
+    threshold = TIMEFRAME_THRESHOLDS.get(timeframe.lower(), 24 * 3600)
     return (now - mod_time).total_seconds() >= threshold
 
-def get_historical_data(ticker, timeframe, period_years, market="shares", board="TQBR"):
+
+def _fetch_candles(ticker, start_date_str, end_date_str, timeframe, market, board):
+    """
+    Загружает свечи с MOEX и приводит их к колонкам хранилища.
+    """
+    parallel = timeframe.lower() in PARALLEL_TIMEFRAMES
+    data = fetch_moex_candles_all(ticker, start_date_str, end_date_str, timeframe, market, board,
+                                  parallel=parallel, raise_errors=True)
+    if data is None or data.empty:
+        return None
+    data = data[['begin', 'high', 'low', 'open', 'close', 'volume']].rename(columns={'begin': 'date'})
+    if (data['high'] < data['low']).any():
+        print(f"Ошибка: high < low в данных для {ticker} ({timeframe}), исправляем")
+        data['high'] = data[['high', 'low', 'close']].max(axis=1)
+        data['low'] = data[['high', 'low', 'close']].min(axis=1)
+    return data
+
+
+def update_series(ticker, timeframe, start_date, market="shares", board="TQBR", now=None):
+    """
+    Дополняет сохранённую серию свечей только недостающими данными.
+
+    Загружает с MOEX начало истории, если запрошено окно раньше уже покрытого,
+    и хвост начиная с последней сохранённой свечи (незакрытая свеча заменяется).
+    Если серия обновлялась в пределах порога таймфрейма, сеть не используется.
+
+    Args:
+        ticker (str): Тикер инструмента.
+        timeframe (str): Таймфрейм хранимой серии ('1m', '10m', '1h', 'daily', ...).
+        start_date (datetime): Самая ранняя нужная дата.
+        market (str): Рынок ('shares', 'index', 'currency').
+        board (str): Торговая доска.
+        now (datetime): Текущее время (для тестов), по умолчанию datetime.now().
+
+    Returns:
+        pd.DataFrame: Полная сохранённая серия или пустой DataFrame при ошибке.
+    """
+    now = now or datetime.now()
+    key = candle_store.series_key(ticker, timeframe, market, board)
+    with candle_store.SERIES_LOCKS.get(key):
+        return _update_series(key, ticker, timeframe, start_date, market, board, now)
+
+
+def _update_series(key, ticker, timeframe, start_date, market, board, now):
+    stored = candle_store.load_series(key)
+    if stored is None:
+        # Первое обращение после перехода на хранилище: свечи из снимка старого формата не скачиваются заново
+        stored = candle_store.import_snapshot(key, ticker, timeframe)
+    meta = candle_store.load_meta(key) if stored is not None else {}
+
+    start_str = start_date.strftime('%Y-%m-%d')
+    end_str = now.strftime('%Y-%m-%d')
+    covered_from = meta.get('covered_from')
+    head_needed = covered_from is None or start_str < covered_from
+    threshold = TIMEFRAME_THRESHOLDS.get(timeframe.lower(), 24 * 3600)
+
+    if stored is not None:
+        CACHE.touch(candle_store.series_file(key))
+    if not head_needed and candle_store.is_series_fresh(meta, threshold, now):
+        print(f"Серия {key} актуальна, загрузка из хранилища")
+        CACHE.record_hit()
+        return stored
+    CACHE.record_miss()
+
+    fresh_parts = []
+    try:
+        if stored is None or stored.empty:
+            print(f"Серия {key} отсутствует, полная загрузка с {start_str}")
+            data = _fetch_candles(ticker, start_str, end_str, timeframe, market, board)
+            if data is None:
+                print(f"Не удалось получить данные для {ticker} ({timeframe})")
+                return pd.DataFrame()
+            fresh_parts.append(data)
+        else:
+            if head_needed:
+                print(f"Догрузка начала серии {key}: {start_str} - {covered_from}")
+                data = _fetch_candles(ticker, start_str, covered_from, timeframe, market, board)
+                if data is not None:
+                    fresh_parts.append(data)
+            last_date = str(stored['date'].iloc[-1])
+            print(f"Догрузка хвоста серии {key} с {last_date}")
+            data = _fetch_candles(ticker, last_date, end_str, timeframe, market, board)
+            if data is not None:
+                fresh_parts.append(data)
+    except HttpError as e:
+        # Серия не сохраняется и не помечается свежей: следующий запрос повторит загрузку
+        print(f"Загрузка серии {key} не удалась, используется сохранённая версия: {e}")
+        return stored if stored is not None else pd.DataFrame()
+
+    merged = stored
+    for part in fresh_parts:
+        merged = candle_store.merge_candles(merged, part)
+    if merged is None or merged.empty:
+        return pd.DataFrame()
+
+    candle_store.save_series(key, merged)
+    if head_needed:
+        meta['covered_from'] = start_str
+    meta['updated_at'] = now.isoformat(timespec='seconds')
+    candle_store.save_meta(key, meta)
+    print(f"Серия {key} сохранена: {len(merged)} строк")
+    CACHE.maybe_evict()
+    return merged
+
+
+# Объединение одновременных запросов одних и тех же данных
+HISTORICAL_DATA_FLIGHT = SingleFlight("get_historical_data")
+
+
+def get_historical_data(ticker, timeframe, period_years, market="shares", board="TQBR", start_date=None):
     """
     Получает исторические данные для тикера.
 
+    Одновременные запросы с одинаковыми (тикер, таймфрейм, период, рынок, доска)
+    объединяются: загрузку выполняет один поток, остальные получают копию его результата.
+
+    Данные берутся из постоянного хранилища candle_store: одна серия на
+    (тикер, рынок, доска, интервал), с MOEX загружается только недостающий хвост.
+    Любой period_years отдаётся как срез этой серии. Старшие таймфреймы строятся
+    локально модулем resample: 4h из серии 1h, weekly/monthly/quarterly из daily.
+    Для тикеров из live_candles.LIVE_WATCHLIST внутридневные серии дополняются
+    кольцевым буфером фонового опроса и отдаются без обращения к сети.
+
     Args:
         ticker (str): Тикер инструмента.
         timeframe (str): Таймфрейм.
         period_years (int): Количество лет.
         market (str): Рынок ('shares', 'index', 'currency').
         board (str): Торговая доска.
+        start_date (datetime): Начало окна вместо period_years лет назад (например, якорь индикаторов).
 
     Returns:
         pd.DataFrame: Данные или пустой DataFrame при ошибке.
     """
-    if not os.path.exists(HISTORICAL_DATA_DIR):
-        os.makedirs(HISTORICAL_DATA_DIR)
+    key = (ticker.upper(), timeframe.lower(), period_years, market, board,
+           start_date.date() if start_date is not None else None)
+    data = HISTORICAL_DATA_FLIGHT.do(key, _load_historical_data, ticker, timeframe, period_years, market, board,
+                                     start_date)
+    return data.copy()
+
 
+def _load_historical_data(ticker, timeframe, period_years, market, board, start_date=None):
     now = datetime.now()
-    if timeframe.lower() in ['1m', '10m', '1h', '4h']:
-        date_str = now.strftime('%Y%m%d_%H%M%S')
-    else:
-        date_str = now.strftime('%Y%m%d')
-    filename = f"{ticker.upper()}_{timeframe.upper()}_{period_years}Y_{date_str}.csv"
-    file_path = os.path.join(HISTORICAL_DATA_DIR, filename)
-
-    if os.path.exists(file_path) and not is_data_outdated(file_path, timeframe, period_years):
-        print(f"Данные в '{file_path}' актуальны, загрузка из файла")
-        df = pd.read_csv(file_path)
-        required_columns = ['date', 'high', 'low', 'open', 'close', 'volume']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            print(f"Ошибка: в файле {file_path} отсутствуют столбцы: {missing_columns}")
-            os.remove(file_path)
-            return get_historical_data(ticker, timeframe, period_years, market, board)
-        return df
-
-    end_date = now
-    start_date = end_date - timedelta(days=period_years * 365)
-    start_date_str = start_date.strftime('%Y-%m-%d')
-    end_date_str = end_date.strftime('%Y-%m-%d')
-
-    if timeframe.lower() == '4h':
-        data = fetch_moex_candles_all(ticker, start_date_str, end_date_str, '1h', market, board)
-        if data is None or data.empty:
-            print(f"Не удалось получить 1-часовые данные для {ticker} для агрегации в 4h")
-            return pd.DataFrame()
-        data = data[['begin', 'high', 'low', 'open', 'close', 'volume']]
-        data.rename(columns={'begin': 'date'}, inplace=True)
-        data = aggregate_to_4h(data)
-    else:
-        data = fetch_moex_candles_all(ticker, start_date_str, end_date_str, timeframe, market, board)
-        if data is None or data.empty:
-            print(f"Не удалось получить данные для {ticker} ({timeframe}, {period_years} лет)")
-            return pd.DataFrame()
-        data = data[['begin', 'high', 'low', 'open', 'close', 'volume']]
-        data.rename(columns={'begin': 'date'}, inplace=True)
-
-    if not data.empty:
-        if (data['high'] < data['low']).any():
-            print(f"Ошибка: high < low в данных для {ticker} ({timeframe}), исправляем")
-            data['high'] = data[['high', 'low', 'close']].max(axis=1)
-            data['low'] = data[['high', 'low', 'close']].min(axis=1)
-
-        data.to_csv(file_path, index=False)
-        print(f"Данные сохранены в {file_path}, столбцы: {list(data.columns)}")
+    if start_date is None:
+        start_date = now - timedelta(days=period_years * 365)
+
+    # Тикеры из списка наблюдения отдаются из хранилища и буфера фонового опроса без запросов к ISS
+    series = LIVE.get_series(ticker, base_timeframe(timeframe), start_date, market, board)
+    if series is None:
+        series = update_series(ticker, base_timeframe(timeframe), start_date, market, board, now)
+    if series is None or series.empty:
+        print(f"Не удалось получить данные для {ticker} ({timeframe}, {period_years} лет)")
+        return pd.DataFrame()
 
+    if timeframe.lower() in RESAMPLED_TIMEFRAMES:
+        series = resample_candles(series, timeframe)
+    data = candle_store.slice_period(series, start_date)
+    print(f"Данные для {ticker} ({timeframe}, {period_years} лет): {len(data)} строк")
     return data
 
 if __name__ == "__main__":
     df = get_historical_data("AFLT", "weekly", 10)
-    print(df.tail())
\ No newline at end of file
+    print(df.tail())
@@ -0,0 +1,252 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import storage
+from csv_loader import CSV_LOADER
+from bulk_loader import load_universe
+from report_cache import REPORTS_DIR, REPORT_CACHE, report_path
+
+# Ключевые показатели отчёта smart-lab и их короткие имена для LLM
+MSFO_METRICS = {
+    'Чистая прибыль, млрд руб': 'NP',
+    'Активы, млрд руб': 'Assets',
+    'Чистые активы, млрд руб': 'Equity',
+    'P/E': 'P/E',
+    'P/B': 'P/B',
+    'EV/EBITDA': 'EV/EBITDA',
+    'Операционная прибыль, млрд руб': 'OP'
+}
+# Самый ранний год отчётности, который попадает в таблицу
+MSFO_MIN_YEAR = 2008
+MSFO_STORE_PATH = os.path.join(REPORTS_DIR, "msfo_store")
+# Одновременных скачиваний с smart-lab при пакетном обновлении
+MSFO_MAX_WORKERS = 4
+MSFO_COLUMNS = ['ticker', 'row', 'metric', 'period', 'value', 'text']
+
+
+def _to_number(values):
+    # Ячейки smart-lab: "1 234,5", "12,5%", пустые — в числа (NaN, если не число)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(np.float64)
+    text = values.astype(str).str.replace(r'[\s %]', '', regex=True).str.replace(',', '.', regex=False)
+    return pd.to_numeric(text, errors='coerce')
+
+
+def normalize_report(msfo_df, ticker=""):
+    """
+    Приводит разобранный отчёт smart-lab к длинной таблице ключевых показателей.
+
+    Отбор как в прежнем optimize_msfo_content: строки показателей в порядке файла (кроме полностью пустых),
+    все периоды от MSFO_MIN_YEAR и LTM; ячейка хранится и числом, и текстом, который уходил в промпт.
+
+    Args:
+        msfo_df (pd.DataFrame): Отчёт (первый столбец — показатель, далее годы и LTM).
+        ticker (str): Тикер для столбца 'ticker'.
+
+    Returns:
+        pd.DataFrame: Столбцы ticker, row (порядок строки в отчёте), metric (короткое имя),
+        period ('2019', ..., 'LTM'), value (float, NaN — пусто), text (ячейка для промпта, 'н/д' — пусто).
+    """
+    if msfo_df is None or msfo_df.empty:
+        return pd.DataFrame(columns=MSFO_COLUMNS)
+    label = msfo_df.columns[0]
+    rows = msfo_df[msfo_df[label].isin(MSFO_METRICS.keys())]
+    rows = rows.dropna(how='all', subset=rows.columns[1:])
+    periods = [col for col in rows.columns[1:] if col.isdigit() and int(col) >= MSFO_MIN_YEAR or col == 'LTM']
+    if rows.empty or not periods:
+        return pd.DataFrame(columns=MSFO_COLUMNS)
+    # Текст ячеек — тем же to_csv, что и прежде: исходные значения без пересчёта через float
+    text = rows[periods].fillna('н/д').to_csv(index=False, header=False, sep='|', lineterminator='\n')
+    cells = [re.sub(r'[ \t]+', '', line).split('|') for line in text.splitlines()]
+    values = pd.DataFrame({period: _to_number(rows[period]) for period in periods})
+    table = pd.DataFrame({
+        'row': np.repeat(np.arange(len(rows)), len(periods)),
+        'metric': np.repeat(rows[label].map(MSFO_METRICS).to_numpy(), len(periods)),
+        'period': np.tile(periods, len(rows)),
+        'value': values.to_numpy(np.float64).ravel(),
+        'text': np.array(cells, dtype=object).ravel(),
+    })
+    table.insert(0, 'ticker', ticker.upper())
+    return table[MSFO_COLUMNS]
+
+
+def _period_order(period):
+    return (1, 0) if period == 'LTM' else (0, int(period))
+
+
+def format_report(table):
+    """
+    Текст для промпта (формат optimize_msfo_content): 'Показатель|2019|...|LTM', пропуски — 'н/д'.
+    """
+    if table is None or table.empty:
+        return "Отсутствует"
+    periods = list(pd.unique(table['period']))
+    wide = table.pivot(index='row', columns='period', values='text').reindex(columns=periods).fillna('н/д')
+    metrics = table.groupby('row')['metric'].first()
+    lines = ["|".join(['Показатель'] + periods)]
+    for row, cells in wide.sort_index().iterrows():
+        lines.append("|".join([metrics[row]] + list(cells)))
+    return "\n".join(lines) + "\n"
+
+
+def report_tickers(tickers):
+    """
+    Тикеры, под которыми публикуются отчёты: преф (XXXXP) сводится к обыкновенной акции из того же списка.
+    """
+    tickers = [t.upper() for t in tickers]
+    present = set(tickers)
+    result = []
+    for ticker in tickers:
+        base = ticker[:-1] if ticker.endswith('P') and ticker[:-1] in present else ticker
+        if base not in result:
+            result.append(base)
+    return result
+
+
+class MsfoStore:
+    """
+    Таблица ключевых показателей МСФО всех компаний (год × тикер × показатель) в одном файле.
+
+    В памяти держится таблица, её разбиение по тикерам и готовые тексты для промпта;
+    при перезаписи файла всё перечитывается.
+    """
+
+    def __init__(self, base_path=MSFO_STORE_PATH):
+        self.base_path = base_path
+        self._table = None
+        self._by_ticker = {}
+        self._content = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        path = storage.storage_path(self.base_path)
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        with self._lock:
+            if mtime == self._mtime:
+                return self._table, self._by_ticker, mtime
+        table = storage.read_frame(self.base_path) if mtime is not None else None
+        if table is not None and not set(MSFO_COLUMNS) <= set(table.columns):
+            print(f"Таблица МСФО {self.base_path} в старом формате, используются файлы отчётов до пересборки")
+            table = None
+        by_ticker = {ticker: rows.reset_index(drop=True) for ticker, rows in table.groupby('ticker')} \
+            if table is not None else {}
+        with self._lock:
+            self._table, self._by_ticker, self._mtime = table, by_ticker, mtime
+            self._content = {}
+        return table, by_ticker, mtime
+
+    def table(self):
+        """
+        Вся таблица (копия) или None, если пакет ещё не собирался.
+        """
+        table = self._load()[0]
+        return table.copy() if table is not None else None
+
+    def ticker_table(self, report_ticker):
+        """
+        Строки одного тикера или None, если тикера нет в таблице или его отчёт скачан позже сборки таблицы.
+        """
+        _, by_ticker, mtime = self._load()
+        rows = by_ticker.get(report_ticker.upper())
+        if rows is None:
+            return None
+        file_path = report_path(report_ticker)
+        if os.path.exists(file_path) and os.path.getmtime(file_path) > mtime:
+            return None
+        return rows
+
+    def content(self, report_ticker):
+        """
+        Текст МСФО тикера для промпта из таблицы (None — как у ticker_table).
+        """
+        rows = self.ticker_table(report_ticker)
+        if rows is None:
+            return None
+        key = report_ticker.upper()
+        with self._lock:
+            text = self._content.get(key)
+        if text is None:
+            text = format_report(rows)
+            with self._lock:
+                self._content[key] = text
+        return text
+
+    def metric_panel(self, metric):
+        """
+        Кросс-срез показателя по компаниям: строки — тикеры, столбцы — периоды.
+        """
+        table = self._load()[0]
+        if table is None:
+            return pd.DataFrame()
+        rows = table[table['metric'] == metric]
+        panel = rows.pivot_table(index='ticker', columns='period', values='value', aggfunc='last')
+        return panel[sorted(panel.columns, key=_period_order)]
+
+    def write(self, table):
+        storage.write_frame(self.base_path, table)
+
+
+# Общая таблица МСФО процесса
+MSFO_STORE = MsfoStore()
+
+
+def report_content(report_ticker, msfo_df=None):
+    """
+    Готовый текст МСФО для промпта: из таблицы пакета, а если тикера там нет — из файла отчёта (без сети).
+
+    Args:
+        report_ticker (str): Тикер отчёта.
+        msfo_df (pd.DataFrame): Уже разобранный отчёт (по умолчанию — reports/{тикер}-МСФО-годовые.csv).
+
+    Returns:
+        str: Текст или "Отсутствует".
+    """
+    text = MSFO_STORE.content(report_ticker)
+    if text is not None:
+        return text
+    if msfo_df is None:
+        file_path = report_path(report_ticker)
+        msfo_df = CSV_LOADER.read(file_path, 'msfo') if os.path.exists(file_path) else None
+    return format_report(normalize_report(msfo_df, report_ticker))
+
+
+def refresh_msfo_store(tickers=None, max_workers=MSFO_MAX_WORKERS):
+    """
+    Пакетно перепроверяет отчёты всей вселенной и пересобирает таблицу MSFO_STORE.
+
+    Отчёты обновляются через REPORT_CACHE (условные запросы, неизменённые не скачиваются).
+
+    Args:
+        tickers (list): Тикеры (по умолчанию — вселенная bulk_loader.UNIVERSE_FILE).
+        max_workers (int): Максимум одновременных запросов к smart-lab.
+
+    Returns:
+        pd.DataFrame: Собранная таблица.
+    """
+    started = time.perf_counter()
+    tickers = report_tickers(tickers or load_universe())
+
+    def load(ticker):
+        file_path = REPORT_CACHE.refresh(ticker, force=True)
+        return normalize_report(CSV_LOADER.read(file_path, 'msfo') if file_path else None, ticker)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(load, tickers))
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        print("Таблица МСФО не собрана: нет ни одного отчёта")
+        return pd.DataFrame(columns=MSFO_COLUMNS)
+    table = pd.concat(frames, ignore_index=True)
+    MSFO_STORE.write(table)
+    print(f"Таблица МСФО: {table['ticker'].nunique()} из {len(tickers)} компаний, {len(table)} значений, "
+          f"{time.perf_counter() - started:.1f} с")
+    return table
+
+
+if __name__ == "__main__":
+    refresh_msfo_store()
@@ -0,0 +1,144 @@
+import time
+import numpy as np
+import pandas as pd
+import candle_store
+from bulk_loader import load_universe
+from indicators import compute_arrays, compute_indicators, prepare_ohlcv, synthetic_candles, TIMEFRAME_INDICATORS
+
+PANEL_FIELDS = ('high', 'low', 'close', 'volume')
+
+
+def load_panel(tickers=None, timeframe="daily", start_date=None, market="shares", board="TQBR"):
+    """
+    Собирает выровненную панель (даты × тикеры) из сохранённых серий candle_store без обращения к сети.
+
+    Args:
+        tickers (list): Тикеры (по умолчанию вся вселенная bulk_loader.UNIVERSE_FILE).
+        timeframe (str): Интервал хранимых серий.
+        start_date (datetime): Начало панели (None — вся история).
+        market (str): Рынок.
+        board (str): Торговая доска.
+
+    Returns:
+        dict: 'high', 'low', 'close', 'volume' — DataFrame (индекс — даты, столбцы — тикеры, NaN там,
+            где у тикера нет свечи). Тикеры без сохранённой серии пропускаются.
+    """
+    tickers = load_universe() if tickers is None else tickers
+    frames = {}
+    for ticker in tickers:
+        series = candle_store.load_series(candle_store.series_key(ticker, timeframe, market, board))
+        if series is None or series.empty:
+            continue
+        if start_date is not None:
+            series = candle_store.slice_period(series, start_date)
+        frames[ticker.upper()] = series.set_index(pd.to_datetime(series['date']))
+    if not frames:
+        return {field: pd.DataFrame() for field in PANEL_FIELDS}
+    stacked = pd.concat(frames, axis=1)
+    panel = {field: stacked.xs(field, axis=1, level=1).astype(np.float64) for field in PANEL_FIELDS}
+    print(f"Панель {timeframe}: {panel['close'].shape[0]} дат × {panel['close'].shape[1]} тикеров")
+    return panel
+
+
+def _listing_index(offsets, length):
+    # Индексы строк: столбец каждого тикера сдвигается так, чтобы начинаться с его первой свечи
+    rows = np.arange(length)[:, None] + offsets[None, :]
+    return np.minimum(rows, length - 1), np.arange(len(offsets))[None, :]
+
+
+def _dates_index(offsets, length):
+    # Обратный сдвиг: строки до листинга отмечаются как недействительные
+    rows = np.arange(length)[:, None] - offsets[None, :]
+    return (np.maximum(rows, 0), np.arange(len(offsets))[None, :]), rows >= 0
+
+
+def compute_panel(close, high=None, low=None, volume=None, spec=None):
+    """
+    Рассчитывает индикаторы сразу для всех тикеров панели одним векторизованным проходом.
+
+    Столбец каждого тикера выравнивается по его первой свече, поэтому значения совпадают
+    с расчётом по отдельной серии с момента листинга. Пропуски внутри истории (дни без торгов)
+    заполняются последней ценой с нулевым объёмом, а в результате на этих датах стоит NaN.
+
+    Args:
+        close (pd.DataFrame): Цены закрытия (даты × тикеры), NaN до листинга и в пропусках.
+        high, low (pd.DataFrame): Максимумы и минимумы (по умолчанию close).
+        volume (pd.DataFrame): Объёмы (по умолчанию 0).
+        spec (dict): Набор индикаторов (по умолчанию TIMEFRAME_INDICATORS['default']).
+
+    Returns:
+        dict: Имя индикатора -> DataFrame float32 той же формы, что close.
+    """
+    spec = spec or TIMEFRAME_INDICATORS['default']
+    missing = close.isna().to_numpy()
+    offsets = np.where(missing.all(axis=0), 0, np.argmax(~missing, axis=0))
+
+    aligned = _listing_index(offsets, len(close))
+    restore, listed = _dates_index(offsets, len(close))
+    invalid = missing | ~listed
+
+    def prepared(frame, fill_value=None):
+        frame = close if frame is None else frame.reindex_like(close)
+        frame = frame.fillna(fill_value) if fill_value is not None else frame.ffill()
+        return frame.to_numpy(np.float64)[aligned]
+
+    arrays = compute_arrays(prepared(high), prepared(low), prepared(close),
+                            prepared(volume if volume is not None else close * 0, fill_value=0.0), spec)
+    result = {}
+    for name, values in arrays.items():
+        values = values[restore]
+        values[invalid] = np.nan
+        result[name] = pd.DataFrame(values, index=close.index, columns=close.columns)
+    return result
+
+
+def panel_indicators(tickers=None, timeframe="daily", start_date=None, spec=None, market="shares", board="TQBR"):
+    """
+    Индикаторы для всей вселенной: load_panel + compute_panel.
+    """
+    panel = load_panel(tickers, timeframe, start_date, market, board)
+    if panel['close'].empty:
+        return {}
+    return compute_panel(panel['close'], panel['high'], panel['low'], panel['volume'], spec)
+
+
+def benchmark_panel(tickers=260, years=10, spec=None):
+    """
+    Сравнивает расчёт по отдельным сериям с панельным на синтетической вселенной
+    (у части тикеров листинг позже начала панели).
+
+    Returns:
+        dict: Время в секундах и максимальное относительное расхождение панели с расчётом по сериям.
+    """
+    spec = spec or {key: value for key, value in TIMEFRAME_INDICATORS['default'].items() if key != 'adx'}
+    rows = years * 260
+    series = {}
+    for seed in range(tickers):
+        data = synthetic_candles(rows, seed)
+        listing = (seed * 37) % (rows // 2) if seed % 4 == 0 else 0
+        series[f"T{seed:03d}"] = data.iloc[listing:].set_index('date')
+    panel = {field: pd.DataFrame({ticker: df[field] for ticker, df in series.items()}).astype(np.float64)
+             for field in PANEL_FIELDS}
+
+    started = time.perf_counter()
+    per_series = {ticker: compute_indicators(prepare_ohlcv(df), spec) for ticker, df in series.items()}
+    series_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    result = compute_panel(panel['close'], panel['high'], panel['low'], panel['volume'], spec)
+    panel_seconds = time.perf_counter() - started
+
+    max_diff = 0.0
+    for name, frame in result.items():
+        for ticker, values in per_series.items():
+            a = frame[ticker].loc[series[ticker].index].to_numpy(np.float64)
+            b = values[name].to_numpy(np.float64)
+            valid = np.isfinite(b)
+            diff = np.abs(a[valid] - b[valid]) / np.maximum(np.abs(b[valid]), 1.0)
+            max_diff = max(max_diff, float(diff.max()) if valid.any() else 0.0)
+    print(f"Индикаторы {tickers} тикеров × {years} лет: по сериям {series_seconds:.2f} с, "
+          f"панель {panel_seconds:.2f} с, макс. расхождение {max_diff:.2e}")
+    return {'series': series_seconds, 'panel': panel_seconds, 'max_rel_diff': max_diff}
+
+
+if __name__ == "__main__":
+    benchmark_panel()
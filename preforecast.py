@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from forecast import FORECAST_FLIGHT, FORECASTS, forecast_flight_key, produce_forecast
+from forecast_cache import FORECAST_REQUESTS
+from msfo_store import report_tickers
+
+# Список тикеров для ночного расчёта (через запятую); если пуст — самые запрашиваемые
+PREFORECAST_WATCHLIST = [t.strip().upper() for t in os.environ.get("PREFORECAST_WATCHLIST", "").split(",")
+                         if t.strip()]
+# Сколько самых запрашиваемых тикеров считать, если список не задан
+PREFORECAST_TOP_N = int(os.environ.get("PREFORECAST_TOP_N", 30))
+# Одновременных генераций на локальной LLM
+PREFORECAST_LLM_CONCURRENCY = int(os.environ.get("PREFORECAST_LLM_CONCURRENCY", 2))
+# Часы вне торгов (локальное время), в которые запускается ночной расчёт: [начало, конец)
+PREFORECAST_WINDOW = (1, 6)
+# Как часто планировщик проверяет, не пора ли запускать расчёт, сек.
+PREFORECAST_CHECK_INTERVAL = 600
+
+
+def preforecast_targets(tickers=None, top_n=PREFORECAST_TOP_N):
+    """
+    Тикеры для ночного расчёта: (тикер, базовый тикер отчётов).
+
+    Явный список (аргумент или PREFORECAST_WATCHLIST) — преф сводится к обыкновенной акции из того же
+    списка; иначе — top_n самых запрашиваемых по FORECAST_REQUESTS.
+    """
+    tickers = tickers or PREFORECAST_WATCHLIST
+    if not tickers:
+        return FORECAST_REQUESTS.top(top_n)
+    tickers = [t.upper() for t in tickers]
+    bases = set(report_tickers(tickers))
+    return [(t, t[:-1] if t not in bases and t[:-1] in bases else t) for t in tickers]
+
+
+def preforecast(tickers=None, horizons=None, model="local", top_n=PREFORECAST_TOP_N,
+                max_concurrent=PREFORECAST_LLM_CONCURRENCY):
+    """
+    Заранее считает прогнозы через produce_forecast и кладёт их в FORECAST_CACHE, откуда их отдаёт бот.
+    Расчёт идёт через FORECAST_FLIGHT с ключом бота: пользователь, запросивший тот же прогноз
+    во время ночного расчёта, ждёт его, а не запускает второй вызов LLM (и наоборот).
+
+    Прогнозы, уже посчитанные для последней загруженной свечи, берутся из кэша без вызова LLM.
+
+    Args:
+        tickers (list): Тикеры (по умолчанию PREFORECAST_WATCHLIST или top_n самых запрашиваемых).
+        horizons (list): Горизонты FORECASTS (по умолчанию все).
+        model (str): Модель ("local" или "gigachat").
+        top_n (int): Сколько популярных тикеров брать без явного списка.
+        max_concurrent (int): Максимум одновременных запросов к LLM.
+
+    Returns:
+        dict: Количество посчитанных, пропущенных (уже в кэше) и неудачных прогнозов.
+    """
+    started = time.perf_counter()
+    horizons = horizons or list(FORECASTS)
+    jobs = [(horizon, ticker, base_ticker) for ticker, base_ticker in preforecast_targets(tickers, top_n)
+            for horizon in horizons]
+    counts = {'produced': 0, 'cached': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    def run(job):
+        horizon, ticker, base_ticker = job
+        entry = FORECAST_FLIGHT.do(forecast_flight_key(horizon, ticker, model), produce_forecast,
+                                   horizon, ticker, base_ticker, ticker != base_ticker, model)
+        if entry is None:
+            outcome = 'failed'
+        else:
+            outcome = 'cached' if entry['cached'] else 'produced'
+        with lock:
+            counts[outcome] += 1
+
+    print(f"Ночной расчёт прогнозов: {len(jobs)} заданий, до {max_concurrent} одновременно")
+    with ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="preforecast") as executor:
+        list(executor.map(run, jobs))
+    print(f"Ночной расчёт прогнозов завершён за {time.perf_counter() - started:.0f} с: {counts}")
+    return counts
+
+
+class PreforecastScheduler:
+    """
+    Раз в сутки запускает preforecast в окне PREFORECAST_WINDOW (вне торгов) в фоновом потоке.
+    """
+
+    def __init__(self, window=PREFORECAST_WINDOW, check_interval=PREFORECAST_CHECK_INTERVAL):
+        self.window = window
+        self.check_interval = check_interval
+        self.last_run = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_due(self, now=None):
+        """
+        Запускает расчёт, если сейчас окно и сегодня он ещё не выполнялся.
+
+        Returns:
+            dict: Итог preforecast или None, если запуск не требовался.
+        """
+        now = now or datetime.now()
+        if not self.window[0] <= now.hour < self.window[1] or self.last_run == now.date():
+            return None
+        self.last_run = now.date()
+        try:
+            return preforecast()
+        except Exception as e:
+            print(f"Ошибка ночного расчёта прогнозов: {e}")
+            return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_due()
+            self._stop.wait(self.check_interval)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="preforecast", daemon=True)
+        self._thread.start()
+        print(f"Ночной расчёт прогнозов: окно {self.window[0]:02d}:00-{self.window[1]:02d}:00")
+
+    def stop(self):
+        self._stop.set()
+
+
+# Общий планировщик ночного расчёта
+PREFORECAST = PreforecastScheduler()
+
+
+if __name__ == "__main__":
+    preforecast()
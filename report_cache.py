@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+from csv_loader import CSV_LOADER
+from http_client import HTTP, HttpError
+
+REPORTS_DIR = "reports"
+# Адрес smart-lab (переопределяется для заглушки: REPORTS_BASE_URL=http://127.0.0.1:8765)
+REPORTS_BASE_URL = os.environ.get("REPORTS_BASE_URL", "https://smart-lab.ru")
+# Сколько секунд скачанный отчёт считается свежим без обращения к сайту
+REPORT_TTL = float(os.environ.get("REPORT_TTL", 24 * 3600))
+
+
+def report_path(report_ticker):
+    return os.path.join(REPORTS_DIR, f"{report_ticker}-МСФО-годовые.csv")
+
+
+def _meta_path(file_path):
+    # Рядом с отчётом, как у остальных сопутствующих .json (CacheManager удаляет их вместе с файлом)
+    return os.path.splitext(file_path)[0] + ".json"
+
+
+def _load_meta(file_path):
+    path = _meta_path(file_path)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка чтения метаданных '{path}': {e}")
+        return {}
+
+
+def _save_meta(file_path, meta):
+    path = _meta_path(file_path)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class ReportCache:
+    """
+    Кэш годовых отчётов МСФО со smart-lab.
+
+    В пределах TTL отчёт отдаётся с диска без сети; после TTL он перепроверяется
+    условным запросом (If-None-Match / If-Modified-Since), и ответ 304 только продлевает срок.
+    Разобранный кадр держит CSV_LOADER: пока файл не переписан, он не разбирается повторно.
+    """
+
+    def __init__(self, ttl=REPORT_TTL):
+        self.ttl = ttl
+        self.counters = {'fresh': 0, 'revalidated': 0, 'downloaded': 0, 'stale': 0, 'failed': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def refresh(self, report_ticker, force=False):
+        """
+        Обеспечивает актуальный файл отчёта на диске.
+
+        Args:
+            report_ticker (str): Тикер, по которому публикуется отчёт (для префа — базовый).
+            force (bool): Перепроверить, даже если TTL не истёк.
+
+        Returns:
+            str: Путь к файлу или None, если отчёта нет и скачать его не удалось.
+        """
+        if not os.path.exists(REPORTS_DIR):
+            os.makedirs(REPORTS_DIR, exist_ok=True)
+        file_path = report_path(report_ticker)
+        exists = os.path.exists(file_path)
+        meta = _load_meta(file_path) if exists else {}
+        if exists and not force and time.time() - meta.get('checked_at', 0) < self.ttl:
+            self._count('fresh')
+            return file_path
+
+        headers = {}
+        if exists and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if exists and meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        url = f"{REPORTS_BASE_URL}/q/{report_ticker}/f/y/MSFO/download/"
+        try:
+            response = HTTP.get(url, headers=headers or None, timeout=(5, 10), deadline=30)
+        except HttpError as e:
+            if exists:
+                self._count('stale')
+                print(f"Отчет {report_ticker} не обновлён ({e}), используется сохранённый: {file_path}")
+                return file_path
+            self._count('failed')
+            print(f"Ошибка при скачивании отчета {report_ticker}: {str(e)}")
+            return None
+
+        if response.status_code == 304 and exists:
+            self._count('revalidated')
+        else:
+            tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(response.content)
+            os.replace(tmp_path, file_path)
+            self._count('downloaded')
+            print(f"Отчет сохранен: {file_path}")
+        _save_meta(file_path, {
+            'url': url,
+            'checked_at': time.time(),
+            'etag': response.headers.get('ETag') or meta.get('etag'),
+            'last_modified': response.headers.get('Last-Modified') or meta.get('last_modified'),
+        })
+        # Разбор сразу после скачивания: прогноз получит кадр из памяти
+        CSV_LOADER.read(file_path, 'msfo')
+        return file_path
+
+    def load(self, report_ticker):
+        """
+        Возвращает разобранный отчёт (копию кадра) или None.
+        """
+        file_path = self.refresh(report_ticker)
+        return CSV_LOADER.read(file_path, 'msfo') if file_path else None
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+# Общий кэш отчётов процесса
+REPORT_CACHE = ReportCache()
@@ -0,0 +1,131 @@
+import pandas as pd
+
+# Базовый интервал, из которого строится каждый таймфрейм
+BASE_TIMEFRAMES = {
+    '4h': '1h',
+    'weekly': 'daily',
+    'monthly': 'daily',
+    'quarterly': 'daily',
+}
+
+# Таймфреймы, которые строятся локально. Часовые бары режутся от 10:00 (открытие
+# основной сессии MOEX), недели начинаются с понедельника, месяцы и кварталы — с первого числа, как у ISS.
+RESAMPLED_TIMEFRAMES = ('4h', 'weekly', 'monthly', 'quarterly')
+
+OHLCV_AGG = {
+    'date': 'first',
+    'high': 'max',
+    'low': 'min',
+    'open': 'first',
+    'close': 'last',
+    'volume': 'sum'
+}
+
+
+def base_timeframe(timeframe):
+    """
+    Возвращает интервал, который хранится и загружается для запрошенного таймфрейма.
+    """
+    return BASE_TIMEFRAMES.get(timeframe.lower(), timeframe.lower())
+
+
+def period_keys(dates, timeframe):
+    """
+    Возвращает начало периода (бина) для каждой даты.
+
+    Args:
+        dates (pd.Series): Даты баров.
+        timeframe (str): Целевой таймфрейм.
+
+    Returns:
+        pd.Series: Метка начала периода для каждой даты.
+    """
+    dates = pd.to_datetime(dates)
+    timeframe = timeframe.lower()
+    if timeframe == '4h':
+        return (dates - pd.Timedelta(hours=2)).dt.floor('4h') + pd.Timedelta(hours=2)
+    if timeframe == 'weekly':
+        return dates.dt.normalize() - pd.to_timedelta(dates.dt.weekday, unit='D')
+    if timeframe == 'monthly':
+        return dates.dt.to_period('M').dt.start_time
+    if timeframe == 'quarterly':
+        return dates.dt.to_period('Q').dt.start_time
+    return dates
+
+
+def resample_candles(data, timeframe):
+    """
+    Строит OHLCV старшего таймфрейма из базовой серии.
+
+    Дата бара — дата первой фактической свечи периода, поэтому праздники
+    и неполные недели не создают пустых баров.
+
+    Args:
+        data (pd.DataFrame): Базовые свечи с колонками ['date', 'high', 'low', 'open', 'close', 'volume'].
+        timeframe (str): Целевой таймфрейм ('4h', 'weekly', 'monthly', 'quarterly').
+
+    Returns:
+        pd.DataFrame: Агрегированные свечи или пустой DataFrame при ошибке.
+    """
+    if timeframe.lower() not in RESAMPLED_TIMEFRAMES:
+        return data
+    if data is None or data.empty:
+        return pd.DataFrame(columns=list(OHLCV_AGG))
+    try:
+        data = data.sort_values('date')
+        data = data.assign(date=pd.to_datetime(data['date']))
+        keys = period_keys(data['date'], timeframe)
+        resampled = data.groupby(keys.values, sort=True).agg(OHLCV_AGG)
+        resampled = resampled.dropna(subset=['open', 'close']).reset_index(drop=True)
+        return resampled[list(OHLCV_AGG)]
+    except Exception as e:
+        print(f"Ошибка при агрегации свечей {timeframe}: {str(e)}")
+        return pd.DataFrame()
+
+
+def check_parity(ticker, timeframe, period_years=2, market="shares", board="TQBR", rtol=1e-6):
+    """
+    Сверяет локально агрегированные бары с нативными барами ISS того же таймфрейма.
+
+    Бары сопоставляются по началу периода; первый (неполный) и последний (незакрытый)
+    периоды не сравниваются.
+
+    Returns:
+        pd.DataFrame: Расхождения (пустой DataFrame, если бары совпадают).
+    """
+    from datetime import datetime, timedelta
+    from moex_parser import fetch_moex_candles_all
+
+    end = datetime.now()
+    start = end - timedelta(days=period_years * 365)
+    start_str, end_str = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+    if timeframe.lower() not in ('weekly', 'monthly', 'quarterly'):
+        print(f"ISS не отдаёт нативные бары {timeframe}, сверка невозможна")
+        return pd.DataFrame()
+    base = fetch_moex_candles_all(ticker, start_str, end_str, base_timeframe(timeframe), market, board)
+    native = fetch_moex_candles_all(ticker, start_str, end_str, timeframe, market, board)
+    if base is None or native is None:
+        print(f"Нет данных для сверки {ticker} ({timeframe})")
+        return pd.DataFrame()
+
+    local = resample_candles(base.rename(columns={'begin': 'date'}), timeframe)
+    local.index = period_keys(local['date'], timeframe).values
+    native = native.rename(columns={'begin': 'date'})
+    native.index = period_keys(native['date'], timeframe).values
+
+    common = local.index.intersection(native.index)[1:-1]
+    diffs = []
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        a, b = local.loc[common, col].astype(float), native.loc[common, col].astype(float)
+        mismatch = (a - b).abs() > rtol * b.abs().clip(lower=1)
+        for period in common[mismatch.values]:
+            diffs.append({'period': period, 'column': col, 'local': a[period], 'iss': b[period]})
+    result = pd.DataFrame(diffs)
+    print(f"Сверка {ticker} {timeframe}: периодов {len(common)}, расхождений {len(result)}")
+    return result
+
+
+if __name__ == "__main__":
+    for tf in ['weekly', 'monthly', 'quarterly']:
+        check_parity("SBER", tf)
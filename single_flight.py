@@ -0,0 +1,94 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.completed = False
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одинаковым ключом: выполняется только первый,
+    остальные потоки ждут и получают его результат (или его исключение).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = {}
+        self.executed = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Выполняет fn(*args, **kwargs) для ключа key, если такой вызов ещё не выполняется.
+
+        Returns:
+            Результат fn (общий для всех ожидающих вызовов).
+        """
+        return self.do_notify(key, None, fn, *args, **kwargs)
+
+    def do_notify(self, key, on_wait, fn, *args, **kwargs):
+        """
+        Как do, но ожидающий чужого вызова поток перед ожиданием вызывает on_wait() (если задан).
+        """
+        with self._lock:
+            call = self.calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self.calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            print(f"{self.name}: ожидание уже выполняющегося запроса {key}")
+            if on_wait is not None:
+                on_wait()
+            call.done.wait()
+            if isinstance(call.error, Exception):
+                raise call.error
+            if not call.completed:
+                # Ведущий поток прерван (SystemExit, KeyboardInterrupt): результата нет, ждавшие получают ошибку
+                raise RuntimeError(f"{self.name}: запрос {key} прерван в ведущем потоке: {call.error!r}")
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            call.completed = True
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {'executed': self.executed, 'coalesced': self.coalesced, 'in_flight': len(self.calls)}
+
+
+class KeyedLock:
+    """
+    Набор блокировок по ключу: сериализует запись одного и того же файла из разных потоков.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
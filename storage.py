@@ -0,0 +1,162 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    STORAGE_FORMAT = "parquet"
+except ImportError:
+    # Без pyarrow используется несжатый .npz: np.load читает столбцы лениво, по одному
+    STORAGE_FORMAT = "npz"
+
+STORAGE_EXTENSIONS = {"parquet": ".parquet", "npz": ".npz"}
+DATE_COLUMNS = ('date', 'begin', 'end')
+INT_COLUMNS = ('volume',)
+
+
+def storage_path(base_path):
+    """
+    Возвращает путь к файлу хранилища для базового пути без расширения.
+    """
+    return base_path + STORAGE_EXTENSIONS[STORAGE_FORMAT]
+
+
+def frame_exists(base_path):
+    return os.path.exists(storage_path(base_path))
+
+
+def apply_dtypes(df):
+    """
+    Приводит столбцы к компактным типам: даты — datetime64, объём — int64, прочие числа — float32.
+
+    Args:
+        df (pd.DataFrame): Исходные данные.
+
+    Returns:
+        pd.DataFrame: Копия данных с приведёнными типами.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if col in DATE_COLUMNS:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        elif col in INT_COLUMNS and pd.api.types.is_numeric_dtype(df[col]) and not df[col].isna().any():
+            df[col] = df[col].astype(np.int64)
+        elif pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+            df[col] = df[col].astype(np.float32)
+    return df
+
+
+def write_frame(base_path, df):
+    """
+    Атомарно сохраняет DataFrame в колоночном формате (Parquet или .npz).
+
+    Args:
+        base_path (str): Путь без расширения.
+        df (pd.DataFrame): Данные.
+
+    Returns:
+        str: Путь к записанному файлу.
+    """
+    directory = os.path.dirname(base_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    df = apply_dtypes(df).reset_index(drop=True)
+    path = storage_path(base_path)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    if STORAGE_FORMAT == "parquet":
+        df.to_parquet(tmp_path, index=False)
+    else:
+        arrays = {}
+        for col in df.columns:
+            values = df[col].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)
+            arrays[col] = values
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_frame(base_path, columns=None):
+    """
+    Читает DataFrame из колоночного хранилища.
+
+    Args:
+        base_path (str): Путь без расширения.
+        columns (list): Подмножество столбцов (None — все).
+
+    Returns:
+        pd.DataFrame: Данные или None, если файла нет или он повреждён.
+    """
+    path = storage_path(base_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        if STORAGE_FORMAT == "parquet":
+            return pd.read_parquet(path, columns=columns)
+        with np.load(path, allow_pickle=False) as npz:
+            names = columns if columns is not None else npz.files
+            return pd.DataFrame({name: npz[name] for name in names})
+    except Exception as e:
+        print(f"Ошибка чтения '{path}': {e}")
+        return None
+
+
+def read_columns(base_path):
+    """
+    Возвращает список столбцов файла без чтения данных.
+    """
+    path = storage_path(base_path)
+    if not os.path.exists(path):
+        return []
+    if STORAGE_FORMAT == "parquet":
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(path).names)
+    with np.load(path, allow_pickle=False) as npz:
+        return list(npz.files)
+
+
+def convert_csv(csv_path, remove_csv=True):
+    """
+    Однократно конвертирует CSV в колоночный формат рядом с исходным файлом.
+
+    Args:
+        csv_path (str): Путь к CSV.
+        remove_csv (bool): Удалить CSV после успешной конвертации.
+
+    Returns:
+        str: Путь к новому файлу или None при ошибке.
+    """
+    base_path = os.path.splitext(csv_path)[0]
+    try:
+        df = pd.read_csv(csv_path)
+        path = write_frame(base_path, df)
+    except Exception as e:
+        print(f"Ошибка конвертации '{csv_path}': {e}")
+        return None
+    if remove_csv:
+        os.remove(csv_path)
+    print(f"Файл '{csv_path}' конвертирован в {path}")
+    return path
+
+
+def convert_csv_dir(directory, remove_csv=True):
+    """
+    Конвертирует все CSV в директории (рекурсивно) в колоночный формат.
+
+    Returns:
+        int: Количество сконвертированных файлов.
+    """
+    converted = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith('.csv') and convert_csv(os.path.join(root, name), remove_csv):
+                converted += 1
+    print(f"Сконвертировано файлов в '{directory}': {converted}")
+    return converted
+
+
+if __name__ == "__main__":
+    convert_csv_dir("historical_data")
@@ -0,0 +1,39 @@
+"""
+Ключ кэша прогнозов: запись привязана к последней загруженной свече, а не к часам.
+
+Запуск: python -m pytest -q test_forecast_cache.py
+"""
+import pandas as pd
+import pytest
+from forecast_cache import ForecastCache
+
+
+def _daily(last_day, close):
+    dates = pd.bdate_range(end=last_day, periods=5)
+    return pd.DataFrame({'date': dates, 'close': [100.0, 101.0, 102.0, 103.0, close]})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ForecastCache(directory=str(tmp_path / "forecast_cache"))
+
+
+def test_new_candle_within_same_wall_clock_bar(cache, tmp_path):
+    # Ночной прогноз построен до появления дневной свечи; днём той же даты она пришла — кэш не отдаётся
+    report = tmp_path / "report.csv"
+    report.write_text("x")
+    before = _daily('2025-03-06', 103.5)
+    key = cache.key("SBER", 'short', 'local', before, [str(report)])
+    cache.put(key, "прогноз по свече 06.03")
+    assert cache.get(cache.key("SBER", 'short', 'local', before, [str(report)]))['result'] == "прогноз по свече 06.03"
+
+    after = _daily('2025-03-07', 104.0)
+    assert cache.get(cache.key("SBER", 'short', 'local', after, [str(report)])) is None
+
+
+def test_updated_close_of_last_candle(cache):
+    # Та же свеча, но close обновился (незакрытый бар дозагружен) — новый ключ
+    first = cache.key("SBER", 'short', 'local', _daily('2025-03-07', 104.0), [])
+    second = cache.key("SBER", 'short', 'local', _daily('2025-03-07', 104.5), [])
+    assert first != second
+    assert first == cache.key("SBER", 'short', 'local', _daily('2025-03-07', 104.0), [])
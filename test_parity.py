@@ -0,0 +1,92 @@
+"""
+Сверки движков с эталонами без сети: свечи отдаёт заглушка ISS (iss_stub_server).
+
+Запуск: python -m pytest -q test_parity.py
+"""
+from datetime import datetime, timedelta
+import pandas as pd
+import pytest
+import indicators
+import iss_stub_server
+import moex_parser
+import resample
+
+
+@pytest.fixture(scope="module")
+def iss_stub(tmp_path_factory):
+    # Пустая директория фикстур: заглушка генерирует свечи детерминированно
+    fixtures_dir = str(tmp_path_factory.mktemp("fixtures"))
+    server, base_url = iss_stub_server.start_stub_server(port=0, fixtures_dir=fixtures_dir, universe=['SBER'])
+    previous = moex_parser.ISS_BASE_URL
+    moex_parser.ISS_BASE_URL = base_url
+    yield base_url
+    moex_parser.ISS_BASE_URL = previous
+    server.shutdown()
+
+
+@pytest.mark.parametrize("timeframe", ['weekly', 'monthly', 'quarterly'])
+def test_resample_parity(iss_stub, timeframe, capsys):
+    # Локально агрегированные бары совпадают с нативными барами ISS
+    mismatches = resample.check_parity("SBER", timeframe, period_years=2)
+    # Пустой результат бывает и без данных: сверка должна была сравнить периоды
+    compared = capsys.readouterr().out
+    assert "периодов 0" not in compared and "Сверка SBER" in compared, compared
+    assert mismatches.empty, mismatches.head().to_string()
+
+
+# Границы 4-часовых баров MOEX: утренняя сессия, три окна основной и вечерняя до закрытия
+FOUR_HOUR_WINDOWS = [(6, 10), (10, 14), (14, 18), (18, 22), (22, 24)]
+
+
+def test_resample_4h(iss_stub):
+    # У ISS нет интервала 4h: эталон собирается из часовых свечей ISS по окнам сессий вручную
+    end = datetime.now()
+    start = end - timedelta(days=60)
+    hourly = moex_parser.fetch_moex_candles_all("SBER", start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), '1h')
+    assert hourly is not None and len(hourly) > 300
+    hourly = hourly.rename(columns={'begin': 'date'})
+    hourly['date'] = pd.to_datetime(hourly['date'])
+
+    expected = []
+    for day, bars in hourly.groupby(hourly['date'].dt.date):
+        for first, last in FOUR_HOUR_WINDOWS:
+            window = bars[(bars['date'].dt.hour >= first) & (bars['date'].dt.hour < last)]
+            if window.empty:
+                continue
+            expected.append({'date': window['date'].iloc[0], 'high': window['high'].max(),
+                             'low': window['low'].min(), 'open': window['open'].iloc[0],
+                             'close': window['close'].iloc[-1], 'volume': window['volume'].sum()})
+    expected = pd.DataFrame(expected)
+
+    local = resample.resample_candles(hourly, '4h')
+    assert len(local) == len(expected)
+    pd.testing.assert_frame_equal(local.reset_index(drop=True), expected, check_dtype=False)
+
+
+@pytest.fixture(scope="module")
+def stub_daily(iss_stub):
+    end = datetime.now()
+    start = end - timedelta(days=10 * 365)
+    data = moex_parser.fetch_moex_candles_all("SBER", start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), 'daily')
+    assert data is not None and len(data) > 1000
+    return data.rename(columns={'begin': 'date'})
+
+
+@pytest.mark.parametrize("spec_name", ['default', 'weekly'])
+@pytest.mark.parametrize("source", ['stub', 'synthetic'])
+def test_indicator_parity(stub_daily, source, spec_name):
+    # Векторный движок совпадает с прежним расчётом на pandas/ta (float32 — отсюда допуск)
+    data = stub_daily if source == 'stub' else None
+    result = indicators.check_parity(data, indicators.TIMEFRAME_INDICATORS[spec_name], rtol=1e-4)
+    assert (result['mismatches'] == 0).all(), result.to_string()
+    assert result['max_rel_diff'].max() < 1e-6, result.to_string()
+
+
+@pytest.mark.parametrize("period", [14, 20])
+@pytest.mark.parametrize("source", ['stub', 'synthetic'])
+def test_wilder_parity(stub_daily, source, period):
+    # Ядра ATR, ±DI, ADX и RSI Уайлдера совпадают с пакетом ta до погрешности float64
+    data = stub_daily if source == 'stub' else indicators.synthetic_candles(20000)
+    result = indicators.check_wilder_parity(data, period=period, rtol=1e-9)
+    assert (result['mismatches'] == 0).all(), result.to_string()
+    assert result['max_rel_diff'].max() < 1e-12, result.to_string()
@@ -0,0 +1,115 @@
+import atexit
+import os
+import threading
+import time
+import storage
+
+# Задержка перед записью пакета (за это время повторные записи той же серии схлопываются), сек.
+WRITE_BEHIND_DELAY = float(os.environ.get("WRITE_BEHIND_DELAY", 1.0))
+# Максимум ожидающих записи кадров; при переполнении submit ждёт освобождения очереди
+WRITE_BEHIND_MAX_PENDING = 32
+
+
+class WriteBehindPersister:
+    """
+    Отложенная запись DataFrame в хранилище из фонового потока.
+
+    Запись по тому же пути, ещё не попавшая на диск, заменяется более новой;
+    накопившиеся записи выполняются пакетом. При завершении процесса очередь
+    сбрасывается обработчиком atexit.
+    """
+
+    def __init__(self, delay=WRITE_BEHIND_DELAY, max_pending=WRITE_BEHIND_MAX_PENDING):
+        self.delay = delay
+        self.max_pending = max_pending
+        self.pending = {}
+        self.counters = {'submitted': 0, 'coalesced': 0, 'written': 0, 'batches': 0, 'failures': 0}
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def submit(self, base_path, df, after=None):
+        """
+        Ставит кадр в очередь записи (storage.write_frame) и сразу возвращает управление.
+
+        Args:
+            base_path (str): Путь без расширения.
+            df (pd.DataFrame): Данные (копируются, вызывающий код может их менять).
+            after (callable): Вызывается один раз после записи пакета (например, вытеснение кэша).
+        """
+        df = df.copy()
+        with self._cond:
+            while len(self.pending) >= self.max_pending and base_path not in self.pending:
+                self._cond.wait()
+            if base_path in self.pending:
+                self.counters['coalesced'] += 1
+            self.pending[base_path] = (df, after)
+            self.counters['submitted'] += 1
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def _write_batch(self):
+        with self._write_lock:
+            with self._cond:
+                batch, self.pending = self.pending, {}
+                self._cond.notify_all()
+            if not batch:
+                return 0
+            written = 0
+            callbacks = []
+            for base_path, (df, after) in batch.items():
+                if after is not None and after not in callbacks:
+                    callbacks.append(after)
+                try:
+                    storage.write_frame(base_path, df)
+                    written += 1
+                except Exception as e:
+                    print(f"Ошибка отложенной записи '{base_path}': {e}")
+                    with self._cond:
+                        self.counters['failures'] += 1
+            with self._cond:
+                self.counters['written'] += written
+                self.counters['batches'] += 1
+            for after in callbacks:
+                try:
+                    after()
+                except Exception as e:
+                    print(f"Ошибка после отложенной записи: {e}")
+        return written
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self.pending:
+                    self._cond.wait()
+            # Пауза, чтобы повторные записи той же серии успели схлопнуться
+            time.sleep(self.delay)
+            self._write_batch()
+
+    def flush(self):
+        """
+        Синхронно записывает всё, что ожидает в очереди (в том числе при завершении процесса).
+
+        Returns:
+            int: Количество записанных кадров.
+        """
+        written = self._write_batch()
+        if written:
+            print(f"Отложенная запись: сброшено кадров {written}")
+        return written
+
+    def stats(self):
+        with self._cond:
+            counters = dict(self.counters)
+            counters['pending'] = len(self.pending)
+            return counters
+
+
+# Общий фоновый писатель процесса; очередь сбрасывается при выходе
+PERSISTER = WriteBehindPersister()
+atexit.register(PERSISTER.flush)